@@ -12,14 +12,69 @@ SMART_PY_CLI=~/smartpy-cli/SmartPy.sh
 # Build artifact directory.
 OUT_DIR=./build/.tmp_contract_build
 
+# Content hashes of the sources each artifact in build/ was built from.
+CACHE_DIR=./build/.cache
+
 # Array of SmartPy files to compile.
 # CONTRACTS_ARRAY=(counter)
 
-# Exit if SmartPy is not installed. 
+function usage {
+    echo "Usage: $0 [--all] [--no-html] [--force] [--jobs N] [CONTRACT ...]"
+    echo ""
+    echo "  --all      build every contract in contracts/ with a compilation target"
+    echo "             and run the test scenarios of the files that have none"
+    echo "  --no-html  skip the SmartPy HTML output"
+    echo "  --force    rebuild even if the sources have not changed"
+    echo "  --jobs N   number of contracts built in parallel (default: number of CPUs)"
+}
+
+BUILD_ALL=false
+HTML_FLAG=--html
+FORCE=false
+JOBS=$(nproc 2>/dev/null || echo 4)
+CONTRACTS=()
+SCENARIOS=()
+
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --all) BUILD_ALL=true ;;
+        --no-html) HTML_FLAG= ;;
+        --force) FORCE=true ;;
+        --jobs) shift; JOBS=$1 ;;
+        -h|--help) usage && exit ;;
+        *) CONTRACTS+=("$1") ;;
+    esac
+    shift
+done
+
+# Exit if SmartPy is not installed.
 if [ ! -f "$SMART_PY_CLI" ]; then
     echo "Fatal: Please install SmartPy CLI at $SMART_PY_CLI" && exit
 fi
 
+# Prints a contract source followed by every file it pulls in through
+# sp.io.import_stored_contract, recursively and without duplicates.
+function contractSources {
+    local QUEUE=("./contracts/$1.py")
+    local SEEN=()
+    while [ ${#QUEUE[@]} -gt 0 ]; do
+        local SOURCE=${QUEUE[0]}
+        QUEUE=("${QUEUE[@]:1}")
+        if [[ " ${SEEN[*]} " == *" $SOURCE "* ]]; then
+            continue
+        fi
+        SEEN+=("$SOURCE")
+        for IMPORTED in $(sed -n 's/^[^#]*sp\.io\.import_stored_contract("\([^"]*\)").*/\1/p' "$SOURCE"); do
+            QUEUE+=("./contracts/$IMPORTED")
+        done
+    done
+    printf "%s\n" "${SEEN[@]}" | sort
+}
+
+function sourceHash {
+    contractSources $1 | xargs cat | sha256sum | cut -d " " -f 1
+}
+
 function processContract {
     CONTRACT_NAME=$1
     OUT_DIR=$2
@@ -33,33 +88,94 @@ function processContract {
 
     # Ensure file exists.
     if [ ! -f "$CONTRACT_IN" ]; then
-        echo "Fatal: $CONTRACT_IN not found. Running from wrong dir?" && exit
+        echo "Fatal: $CONTRACT_IN not found. Running from wrong dir?" && exit 1
+    fi
+
+    HASH=$(sourceHash $CONTRACT_NAME)
+    if [ "$FORCE" = false ] && [ -f ./build/$CONTRACT_OUT ] && [ "$(cat $CACHE_DIR/$CONTRACT_NAME.sha256 2>/dev/null)" = "$HASH" ]; then
+        echo ">>> ${CONTRACT_NAME} is up to date, skipping."
+        return
     fi
 
     echo ">>> [1 / 3] Testing ${CONTRACT_NAME} ... "
-    $SMART_PY_CLI test $CONTRACT_IN $OUT_DIR --html
+    $SMART_PY_CLI test $CONTRACT_IN $OUT_DIR $HTML_FLAG
 
     echo ">>> [2 / 3] Compiling ${CONTRACT_NAME} ..."
-    $SMART_PY_CLI compile $CONTRACT_IN $OUT_DIR --html
+    $SMART_PY_CLI compile $CONTRACT_IN $OUT_DIR $HTML_FLAG
 
     echo ">>> [3 / 3] Extracting Michelson contract ... "
     cp $OUT_DIR/$CONTRACT_COMPILED ./build/$CONTRACT_OUT
     cp $OUT_DIR/$STORAGE_COMPILED ./build/$STORAGE_OUT
+    echo $HASH > $CACHE_DIR/$CONTRACT_NAME.sha256
 
     echo ">>> Michelson contract written to ${CONTRACT_OUT}"
 }
 
 export PYTHONPATH=$PWD
+mkdir -p $CACHE_DIR
+
+if [ "$BUILD_ALL" = true ]; then
+    for CONTRACT_IN in ./contracts/*.py; do
+        if grep -q "^sp.add_compilation_target" $CONTRACT_IN; then
+            CONTRACTS+=("$(basename $CONTRACT_IN .py)")
+        elif grep -q "^@sp.add_test" $CONTRACT_IN; then
+            # Scenario-only files such as Tests.py have nothing to compile,
+            # their scenarios are run on their own below.
+            SCENARIOS+=("$(basename $CONTRACT_IN .py)")
+        fi
+    done
+fi
 
+if [ ${#CONTRACTS[@]} -eq 0 ]; then
+    usage && exit 1
+fi
 
 echo "> [1 / 2] Unit Testing and Compiling Contracts."
-# Use if you want to pass a contract or more as arguments. 
-for n in $(seq 1 $#); do
-  processContract $1 $OUT_DIR
-  shift
+# Every contract gets its own output directory and log so they can be
+# built side by side; logs are printed as each build finishes.
+FAILED=()
+PIDS=()
+NAMES=()
+for CONTRACT_NAME in "${CONTRACTS[@]}"; do
+    while [ $(jobs -rp | wc -l) -ge $JOBS ]; do
+        sleep 0.2
+    done
+    mkdir -p $OUT_DIR/$CONTRACT_NAME
+    ( processContract $CONTRACT_NAME $OUT_DIR/$CONTRACT_NAME > $OUT_DIR/$CONTRACT_NAME.log 2>&1 ) &
+    PIDS+=($!)
+    NAMES+=($CONTRACT_NAME)
 done
 
-# Use if you want to compile all contracts in CONTRACTS_ARRAY. No arguments needed. 
+for i in ${!PIDS[@]}; do
+    if ! wait ${PIDS[$i]}; then
+        FAILED+=(${NAMES[$i]})
+    fi
+    cat $OUT_DIR/${NAMES[$i]}.log
+done
+
+for SCENARIO_NAME in "${SCENARIOS[@]}"; do
+    echo ">> Testing ${SCENARIO_NAME}"
+    mkdir -p $OUT_DIR/$SCENARIO_NAME
+    if ! $SMART_PY_CLI test ./contracts/$SCENARIO_NAME.py $OUT_DIR/$SCENARIO_NAME $HTML_FLAG; then
+        FAILED+=($SCENARIO_NAME)
+    fi
+done
+
+# Code size of what was built, with the change since the previous build.
+BUILT=()
+for CONTRACT_NAME in "${CONTRACTS[@]}"; do
+    if [[ ! " ${FAILED[*]} " == *" $CONTRACT_NAME "* ]] && [ -f ./build/$CONTRACT_NAME.json ]; then
+        BUILT+=($CONTRACT_NAME)
+    fi
+done
+if [ ${#BUILT[@]} -gt 0 ]; then
+    echo "> Code size:"
+    python3 -m tools.codesize "${BUILT[@]}" || true
+    echo "> Cost profile:"
+    python3 -m tools.costprofile "${BUILT[@]}" || true
+fi
+
+# Use if you want to compile all contracts in CONTRACTS_ARRAY. No arguments needed.
 # for i in ${!CONTRACTS_ARRAY[@]}; do
 #     processContract ${CONTRACTS_ARRAY[$i]} $OUT_DIR
 #  done
@@ -71,4 +187,8 @@ rm -rf ./contracts/__pycache__
 rm -rf ./__pycache__
 
 
-echo "> Removed artifacts."
\ No newline at end of file
+echo "> Removed artifacts."
+
+if [ ${#FAILED[@]} -gt 0 ]; then
+    echo "Fatal: failed to build ${FAILED[*]}" && exit 1
+fi
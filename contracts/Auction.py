@@ -2,33 +2,104 @@ import smartpy as sp
 
 checkingContract = sp.io.import_stored_contract("CheckingContract.py")
 
+# Width of the expiry buckets auctions are indexed in, in seconds.
+AUCTION_BUCKET_SECONDS = 3600
+# Most auctions settleExpiredAuctions takes in one call; each settled auction
+# adds up to two internal operations.
+MAX_SETTLE_BATCH = 20
 
-class Auction(checkingContract.CheckingContract):
+
+class Auction(checkingContract.AddressChecks, checkingContract.LowerCaseChecks):
     def __init__(self, _ownerAddress, _storageContract):
         self.init(
             contractOwner=_ownerAddress,
             storageContract=_storageContract,
-            auction=sp.map(
-                tkey=sp.TAddress,
+            auction=sp.big_map(
+                tkey=sp.TNat,
                 tvalue=sp.TRecord(
                     isAuctionLive=sp.TBool,
                     auctionConductor=sp.TAddress,
                     safleId=sp.TString,
-                    bidRate=sp.TMap(sp.TAddress, sp.TMutez),
                     higestBidderAddress=sp.TAddress,
                     highestBid=sp.TMutez,
                     totalBids=sp.TNat,
                     totalBidders=sp.TNat,
-                    biddersArray=sp.TList(sp.TAddress),
                     returnBidsOfOther=sp.TBool,
                     auctionLastFor=sp.TTimestamp,
                     safleIdTransferred=sp.TBool
                 )
             ),
-            alreadyActiveAuction=sp.set([]),
-            safleIdToAddress=sp.map()
+            bidRate=sp.big_map(
+                tkey=sp.TPair(sp.TNat, sp.TAddress),
+                tvalue=sp.TMutez
+            ),
+            biddersArray=sp.big_map(
+                tkey=sp.TPair(sp.TNat, sp.TNat),
+                tvalue=sp.TAddress
+            ),
+            auctionOfConductor=sp.big_map(
+                tkey=sp.TAddress,
+                tvalue=sp.TNat
+            ),
+            totalAuctions=sp.nat(0),
+            alreadyActiveAuction=sp.big_map(
+                tkey=sp.TAddress,
+                tvalue=sp.TUnit
+            ),
+            safleIdToAuction=sp.big_map(
+                tkey=sp.TString,
+                tvalue=sp.TNat
+            ),
+            # Live auctions by expiry bucket, auctionLastFor // AUCTION_BUCKET_SECONDS,
+            # keyed (bucket, auctionId) so an auction never loads its whole bucket.
+            expiringAuctions=sp.big_map(
+                tkey=sp.TPair(sp.TNat, sp.TNat),
+                tvalue=sp.TUnit
+            ),
+            expiringAuctionCounts=sp.big_map(
+                tkey=sp.TNat,
+                tvalue=sp.TNat
+            )
         )
-    
+
+    def expiryBucket(self, _auctionLastFor):
+        return sp.as_nat(_auctionLastFor - sp.timestamp(0)) // AUCTION_BUCKET_SECONDS
+
+    def indexAuction(self, _auctionId, _auctionLastFor):
+        bucket = sp.local("bucket", self.expiryBucket(_auctionLastFor)).value
+        self.data.expiringAuctions[sp.pair(bucket, _auctionId)] = sp.unit
+        self.data.expiringAuctionCounts[bucket] = self.data.expiringAuctionCounts.get(bucket, 0) + 1
+
+    def unindexAuction(self, _auctionId):
+        bucket = sp.local("bucket", self.expiryBucket(self.data.auction[_auctionId].auctionLastFor)).value
+        key = sp.pair(bucket, _auctionId)
+        sp.if self.data.expiringAuctions.contains(key):
+            del self.data.expiringAuctions[key]
+            remaining = sp.local("remaining", sp.as_nat(self.data.expiringAuctionCounts[bucket] - 1)).value
+            sp.if remaining == 0:
+                del self.data.expiringAuctionCounts[bucket]
+            sp.else:
+                self.data.expiringAuctionCounts[bucket] = remaining
+
+    def closeAuction(self, _auctionId):
+        thisAuction = self.data.auction[_auctionId]
+        thisAuction.isAuctionLive = False
+        thisAuction.returnBidsOfOther = True
+        del self.data.alreadyActiveAuction[thisAuction.auctionConductor]
+        self.unindexAuction(_auctionId)
+        sp.emit(sp.record(
+            auctionId=_auctionId,
+            winner=thisAuction.higestBidderAddress,
+            bid=thisAuction.highestBid
+        ), tag="settleAuction")
+        sp.if thisAuction.totalBidders > 0:
+            self.transferSafleIdToWinner(_auctionId)
+        sp.else:
+            self.releaseSafleId(_auctionId)
+
+    def onlyOwner(self):
+        sp.verify(self.data.contractOwner == sp.sender)
+
     def validateAuctionData(self, _safleId, _auctionSeconds):
         sp.verify(sp.len(_safleId) <= 16, "Length of the safleId should be betweeb 4-16 characters.")
         sp.verify((_auctionSeconds > 300) & (_auctionSeconds < 7776000), "Auction time should be in between 330 to 7776000 seconds.")
@@ -41,27 +112,41 @@ class Auction(checkingContract.CheckingContract):
         ).open_some()
         sp.verify(safleAddress == sp.sender, "You are not an owner of this SafleId.")
 
+    @sp.entry_point
+    def upgradeStorageContractAddress(self, params):
+        self.onlyOwner()
+
+        self.data.storageContract = params._storageContractAddress
+
     @sp.entry_point
     def auctionSafleId(self, params):
         self.validateAuctionData(params._safleId, params._auctionSeconds)
 
         lower = self.toLower(params._safleId)
-        self.data.auction[sp.sender] = sp.record(
+        auctionId = sp.local("auctionId", self.data.totalAuctions)
+        self.data.auction[auctionId.value] = sp.record(
             isAuctionLive=True,
             auctionConductor=sp.sender,
             safleId=lower,
-            bidRate=sp.map(),
             higestBidderAddress=sp.sender,
             highestBid=sp.mutez(0),
             totalBids=0,
             totalBidders=0,
-            biddersArray=[],
             returnBidsOfOther=False,
             auctionLastFor=sp.timestamp_from_utc_now().add_seconds(params._auctionSeconds),
             safleIdTransferred=False
         )
-        self.data.safleIdToAddress[lower] = sp.sender
-        self.data.alreadyActiveAuction.add(sp.sender)
+        self.data.auctionOfConductor[sp.sender] = auctionId.value
+        self.data.safleIdToAuction[lower] = auctionId.value
+        self.data.alreadyActiveAuction[sp.sender] = sp.unit
+        self.data.totalAuctions += 1
+        self.indexAuction(auctionId.value, self.data.auction[auctionId.value].auctionLastFor)
+        sp.emit(sp.record(
+            auctionId=auctionId.value,
+            safleId=lower,
+            conductor=sp.sender,
+            auctionLastFor=self.data.auction[auctionId.value].auctionLastFor
+        ), tag="auctionSafleId")
         storageContract = sp.contract(
             sp.TRecord(
                 _safleId=sp.TString,
@@ -84,46 +169,75 @@ class Auction(checkingContract.CheckingContract):
         lower = self.toLower(params._safleId)
         bidAmount = sp.amount
 
-        sp.verify(self.data.safleIdToAddress.contains(lower))
+        sp.verify(self.data.safleIdToAuction.contains(lower))
         sp.verify(~self.isContract(sp.sender))
 
-        auctioner = self.data.safleIdToAddress[lower]
+        auctionId = sp.local("auctionId", self.data.safleIdToAuction[lower]).value
+        thisAuction = self.data.auction[auctionId]
+        bidKey = sp.pair(auctionId, sp.sender)
+        previousBid = sp.local("previousBid", self.data.bidRate.get(bidKey, sp.mutez(0))).value
 
-        sp.verify(self.data.auction[auctioner].isAuctionLive, "Auction is not live")
-        sp.verify(self.data.auction[auctioner].auctionConductor != sp.sender, "You cannot bid for your SafleId")
-        sp.verify(bidAmount + self.data.auction[auctioner].bidRate.get(sp.sender, sp.mutez(0)) > self.data.auction[auctioner].highestBid, "Bid amount should be greater than the current bidrate.")
-        sp.verify(sp.timestamp_from_utc_now() < self.data.auction[auctioner].auctionLastFor, "Auction time is completed")
+        sp.verify(thisAuction.isAuctionLive, "Auction is not live")
+        sp.verify(thisAuction.auctionConductor != sp.sender, "You cannot bid for your SafleId")
+        sp.verify(bidAmount + previousBid > thisAuction.highestBid, "Bid amount should be greater than the current bidrate.")
+        sp.verify(sp.timestamp_from_utc_now() < thisAuction.auctionLastFor, "Auction time is completed")
 
-        sp.if self.data.auction[auctioner].bidRate.get(sp.sender, sp.mutez(0))==sp.mutez(0):
-            self.data.auction[auctioner].bidRate[sp.sender] = bidAmount
-            self.data.auction[auctioner].highestBid = bidAmount
-            self.data.auction[auctioner].biddersArray.push(sp.sender)
-            self.data.auction[auctioner].totalBidders+=1
-        sp.else:
-            self.data.auction[auctioner].bidRate[sp.sender] = self.data.auction[auctioner].bidRate.get(sp.sender, sp.mutez(0))+bidAmount
-            self.data.auction[auctioner].highestBid = self.data.auction[auctioner].bidRate.get(sp.sender, sp.mutez(0))
-        self.data.auction[auctioner].higestBidderAddress = sp.sender
-        self.data.auction[auctioner].totalBids+=1
+        sp.if previousBid == sp.mutez(0):
+            self.data.biddersArray[sp.pair(auctionId, thisAuction.totalBidders)] = sp.sender
+            thisAuction.totalBidders += 1
+        self.data.bidRate[bidKey] = previousBid + bidAmount
+        thisAuction.highestBid = previousBid + bidAmount
+        thisAuction.higestBidderAddress = sp.sender
+        thisAuction.totalBids += 1
+        sp.emit(sp.record(auctionId=auctionId, bidder=sp.sender, bid=previousBid + bidAmount), tag="bidForSafleId")
 
     @sp.entry_point
-    def refundOtherBidders(self):
-        thisAuction = self.data.auction[sp.sender]
+    def settleAuction(self):
+        auctionId = sp.local("auctionId", self.data.auctionOfConductor[sp.sender]).value
+        thisAuction = self.data.auction[auctionId]
         sp.verify(thisAuction.returnBidsOfOther ==  False)
         sp.verify(thisAuction.auctionConductor == sp.sender)
-        sp.verify(sp.len(thisAuction.biddersArray) > 0)
+        sp.verify(thisAuction.totalBidders > 0)
 
-        sp.for bidder in thisAuction.biddersArray:
-            sp.if bidder != thisAuction.higestBidderAddress:
-                bidderAmount = thisAuction.bidRate[bidder]
-                sp.send(bidder, bidderAmount)
-                self.data.alreadyActiveAuction.remove(sp.sender)
+        self.closeAuction(auctionId)
 
-        thisAuction.returnBidsOfOther = True
-        self.transferSafleIdToWinner()
+    @sp.entry_point
+    def settleExpiredAuctions(self, params):
+        sp.set_type(params, sp.TRecord(_auctionIds=sp.TList(sp.TNat)))
+        sp.verify(sp.len(params._auctionIds) <= MAX_SETTLE_BATCH, "Too many auctions to settle in one call.")
+
+        # Anyone may call this, e.g. a keeper bot that lists the expired
+        # auctions from the auctionSafleId events and passes their ids. Only the
+        # listed auctions are looked at; those that are no longer live or not
+        # expired yet are skipped. An expired auction without bids is closed and
+        # the SafleId stays with its owner.
+        settled = sp.local("settled", sp.nat(0))
+        sp.for auctionId in params._auctionIds:
+            sp.if self.data.auction.contains(auctionId):
+                thisAuction = self.data.auction[auctionId]
+                sp.if thisAuction.isAuctionLive & (thisAuction.auctionLastFor <= sp.timestamp_from_utc_now()):
+                    self.closeAuction(auctionId)
+                    settled.value += 1
+        sp.verify(settled.value > 0, "No expired auctions to settle.")
+
+    @sp.entry_point
+    def withdrawBid(self, params):
+        sp.set_type(params._auctionId, sp.TNat)
+
+        thisAuction = self.data.auction[params._auctionId]
+        bidKey = sp.pair(params._auctionId, sp.sender)
+
+        sp.verify(thisAuction.returnBidsOfOther, "Auction is not settled yet.")
+        sp.verify(thisAuction.higestBidderAddress != sp.sender, "Winning bid cannot be withdrawn.")
+        sp.verify(self.data.bidRate.contains(bidKey), "No bid to withdraw.")
+
+        sp.send(sp.sender, self.data.bidRate[bidKey])
+        sp.emit(sp.record(auctionId=params._auctionId, bidder=sp.sender, amount=self.data.bidRate[bidKey]), tag="withdrawBid")
+        del self.data.bidRate[bidKey]
 
     @sp.sub_entry_point
-    def transferSafleIdToWinner(self):
-        thisAuction = self.data.auction[sp.sender]
+    def transferSafleIdToWinner(self, auctionId):
+        thisAuction = self.data.auction[auctionId]
         sp.send(thisAuction.auctionConductor, thisAuction.highestBid)
         thisAuction.safleIdTransferred = True
         storageContract = sp.contract(
@@ -145,6 +259,26 @@ class Auction(checkingContract.CheckingContract):
             storageContract
         )
 
+    @sp.sub_entry_point
+    def releaseSafleId(self, auctionId):
+        thisAuction = self.data.auction[auctionId]
+        storageContract = sp.contract(
+            sp.TRecord(
+                _safleId=sp.TString,
+                _safleIdOwner=sp.TAddress
+            ),
+            self.data.storageContract,
+            entry_point="auctionEnded"
+        ).open_some()
+        sp.transfer(
+            sp.record(
+                _safleId=thisAuction.safleId,
+                _safleIdOwner=thisAuction.auctionConductor
+            ),
+            sp.mutez(0),
+            storageContract
+        )
+
     @sp.entry_point
     def directlyTransferSafleId(self, params):
         safleAddress = sp.view(
@@ -175,10 +309,19 @@ class Auction(checkingContract.CheckingContract):
 
     @sp.onchain_view()
     def arrayOfbidders(self, params):
-        thisAuction = self.data.auction[params._auctioner]
-        sp.result(thisAuction.biddersArray)
+        auctionId = sp.local("auctionId", self.data.auctionOfConductor[params._auctioner]).value
+        bidders = sp.local("bidders", sp.list(t=sp.TAddress))
+        sp.for idx in sp.range(0, self.data.auction[auctionId].totalBidders):
+            bidders.value.push(self.data.biddersArray[sp.pair(auctionId, idx)])
+        sp.result(bidders.value.rev())
+
+    @sp.onchain_view()
+    def expiringAuctionCount(self, params):
+        sp.result(self.data.expiringAuctionCounts.get(params._bucket, 0))
 
     @sp.onchain_view()
     def getBidRate(self, params):
-        thisAuction = self.data.auction[params._auctioner]
-        sp.result(thisAuction.bidRate[params._bidder])
\ No newline at end of file
+        auctionId = sp.local("auctionId", self.data.auctionOfConductor[params._auctioner]).value
+        sp.result(self.data.bidRate[sp.pair(auctionId, params._bidder)])
+
+sp.add_compilation_target("Auction", Auction(_ownerAddress=sp.address("tz1VVhDEgXSHNFcDmKpKeujvJ6dV7kcSqbAV"), _storageContract=sp.address("KT18amZmM5W7qDWVt2pH6uj7sCEd3kbzLrHT")))
@@ -1,12 +1,18 @@
 import smartpy as sp
 
+# Each check is its own mixin so a contract inherits only the lambdas it
+# calls; the map and set literals they carry are a large share of the code.
 
-class CheckingContract(sp.Contract):
+
+class AddressChecks(sp.Contract):
 
     @sp.global_lambda
     def isContract(address):
         sp.result((address < sp.address("tz1Ke2h7sDdakHJQh8WX4Z372du1KChsksyU")) & (address >= sp.address("KT18amZmM5W7qDWVt2pH6uj7sCEd3kbzLrHT")))
 
+
+class LowerCaseChecks(sp.Contract):
+
     @sp.global_lambda
     def toLower(string):
         char_to_lower = sp.map({
@@ -18,17 +24,45 @@ class CheckingContract(sp.Contract):
             lower_chars.value.push(char_to_lower[sp.slice(string, idx, 1).open_some()])
         sp.result(sp.concat(lower_chars.value.rev()))
 
+
+class AlphaNumericChecks(sp.Contract):
+
     @sp.global_lambda
     def checkAlphaNumeric(safleId):
         alphaNumericCharacters = sp.set(["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z", "0", "1", "2", "3", "4", "5", "6", "7", "8", "9"])
         sp.for idx in sp.range(0, sp.len(safleId)):
             sp.verify(alphaNumericCharacters.contains(sp.slice(safleId, idx, 1).open_some()), "Only alphanumeric allowed in blockchain name and alias name")
 
+
+# Uppercase letters and their lowercase, kept in a big_map in the storage of
+# the contracts that normalize SafleIDs instead of being pushed on each call.
+UPPER_TO_LOWER = dict((chr(c), chr(c + 32)) for c in range(ord("A"), ord("Z") + 1))
+
+
+def upperToLowerTable():
+    return sp.big_map(UPPER_TO_LOWER, tkey=sp.TString, tvalue=sp.TString)
+
+
+class SafleIdChecks(sp.Contract):
+
     @sp.global_lambda
-    def isSafleIdValid(_registrarName):
-        length = sp.len(_registrarName)
+    def normalizeSafleId(params):
+        sp.set_type(params, sp.TRecord(_safleId=sp.TString, _upperToLower=sp.TBigMap(sp.TString, sp.TString)))
+        length = sp.len(params._safleId)
         sp.verify(4 <= length, "SafleId length should be greater than 3 characters")
         sp.verify(length <= 16, "SafleId length should be less than 17 characters")
-        alphaNumericCharacters = sp.set(["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z", "0", "1", "2", "3", "4", "5", "6", "7", "8", "9"])
-        sp.for idx in sp.range(0, sp.len(_registrarName)):
-            sp.verify(alphaNumericCharacters.contains(sp.slice(_registrarName, idx, 1).open_some()), "Only alphanumeric allowed in blockchain name and alias name")
\ No newline at end of file
+        normalized = sp.local("normalized", "")
+        sp.for idx in sp.range(0, length):
+            char = sp.local("char", sp.slice(params._safleId, idx, 1).open_some()).value
+            sp.if ((char >= "a") & (char <= "z")) | ((char >= "0") & (char <= "9")):
+                normalized.value += char
+            sp.else:
+                normalized.value += params._upperToLower.get(char, message="Only alphanumeric allowed in blockchain name and alias name")
+        sp.result(normalized.value)
+
+    def normalize(self, _safleId):
+        return self.normalizeSafleId(sp.record(_safleId=_safleId, _upperToLower=self.data.upperToLower))
+
+
+class CheckingContract(AddressChecks, LowerCaseChecks, AlphaNumericChecks, SafleIdChecks):
+    pass
@@ -0,0 +1,122 @@
+import smartpy as sp
+
+checkingContract = sp.io.import_stored_contract("CheckingContract.py")
+
+
+def registrarFeesTypes():
+    # Owner, fee and registration status fields shared by RegistrarMain and
+    # the single-contract RegistrarSingle.
+    return dict(
+        contractOwner=sp.TAddress,
+        walletAddress=sp.TAddress,
+        safleIdRegStatus=sp.TBool,
+        safleIdFees=sp.TMutez,
+        registrarFees=sp.TMutez,
+        totalFeesCollected=sp.TMutez,
+        totalFeesWithdrawn=sp.TMutez,
+        feeSweepThreshold=sp.TMutez,
+        totalExcessWithdrawn=sp.TMutez,
+        upperToLower=sp.TBigMap(sp.TString, sp.TString)
+    )
+
+
+def initialRegistrarFees(_ownerAddress, _walletAddress):
+    return dict(
+        contractOwner=_ownerAddress,
+        walletAddress=_walletAddress,
+        safleIdRegStatus=False,
+        safleIdFees=sp.mutez(0),
+        registrarFees=sp.mutez(0),
+        totalFeesCollected=sp.mutez(0),
+        totalFeesWithdrawn=sp.mutez(0),
+        feeSweepThreshold=sp.mutez(0),
+        totalExcessWithdrawn=sp.mutez(0),
+        upperToLower=checkingContract.upperToLowerTable()
+    )
+
+
+# Name checks, fee collection and the owner entry points of both registrar
+# deployments; they differ only in how a registration reaches the registry.
+class RegistrarFees(checkingContract.CheckingContract):
+
+    def onlyOwner(self):
+        sp.verify(self.data.contractOwner == sp.sender, "sender is not a contract owner")
+
+    def checkRegistrationStatus(self):
+        sp.verify(self.data.safleIdRegStatus == False, "SafleId Registration is Paused")
+
+    def registrarChecks(self, _registrarName):
+        sp.verify(sp.amount >= self.data.registrarFees, "Registration fees not matched.")
+        return sp.local("lower", self.normalize(_registrarName)).value
+
+    def safleIdChecks(self, _safleId):
+        sp.verify(sp.amount >= self.data.safleIdFees, "Registration fees not matched.")
+        return sp.local("lower", self.normalize(_safleId)).value
+
+    def pendingFees(self):
+        return sp.local("pendingFees", self.data.totalFeesCollected - self.data.totalFeesWithdrawn).value
+
+    def collectFees(self):
+        # Fees stay in the contract until the owner withdraws them, or until
+        # they reach feeSweepThreshold when one is set.
+        self.data.totalFeesCollected += sp.amount
+        sp.if self.data.feeSweepThreshold > sp.mutez(0):
+            pending = self.pendingFees()
+            sp.if pending >= self.data.feeSweepThreshold:
+                self.sweepFees(pending)
+
+    def sweepFees(self, _amount):
+        self.data.totalFeesWithdrawn += _amount
+        sp.send(self.data.walletAddress, _amount)
+
+    @sp.entry_point
+    def setSafleIdFees(self, params):
+        self.onlyOwner()
+
+        sp.verify(params._amount >= 0, "Please set a fees for SafleID registration.")
+        self.data.safleIdFees = sp.utils.nat_to_mutez(params._amount)
+
+    @sp.entry_point
+    def setRegistrarFees(self, params):
+        self.onlyOwner()
+
+        sp.verify(params._amount >= 0, "Please set a fees for Registrar registration.")
+        self.data.registrarFees = sp.utils.nat_to_mutez(params._amount)
+
+    @sp.entry_point
+    def setFeeSweepThreshold(self, params):
+        self.onlyOwner()
+
+        self.data.feeSweepThreshold = sp.utils.nat_to_mutez(params._amount)
+
+    @sp.entry_point
+    def withdrawFees(self):
+        self.onlyOwner()
+
+        pending = self.pendingFees()
+        sp.verify(pending > sp.mutez(0), "No fees to withdraw.")
+        self.sweepFees(pending)
+
+    @sp.entry_point
+    def withdrawExcessBalance(self):
+        self.onlyOwner()
+
+        # Tez sent to entry points that take no fee is not a fee: it is paid
+        # out on its own and counted in totalExcessWithdrawn.
+        excess = sp.local("excess", sp.balance - self.pendingFees()).value
+        sp.verify(excess > sp.mutez(0), "No excess balance to withdraw.")
+        self.data.totalExcessWithdrawn += excess
+        sp.send(self.data.walletAddress, excess)
+
+    @sp.entry_point
+    def toggleRegistrationStatus(self):
+        self.onlyOwner()
+
+        self.data.safleIdRegStatus = ~(self.data.safleIdRegStatus)
+
+    @sp.entry_point
+    def updateWalletAddress(self, params):
+        self.onlyOwner()
+
+        sp.verify(~self.isContract(params._walletAddress))
+        self.data.walletAddress = params._walletAddress
@@ -0,0 +1,257 @@
+import smartpy as sp
+
+registrarFees = sp.io.import_stored_contract("RegistrarFees.py")
+registrarStorage = sp.io.import_stored_contract("RegistrarStorage.py")
+
+
+# Parameters of every upgradable piece of logic. Entry points pack them, the
+# logic lambda unpacks them, so an upgrade never changes the lambda type.
+LOGIC_PARAMS = {
+    "registerRegistrar": sp.TRecord(_registrar=sp.TAddress, _registrarName=sp.TString),
+    "updateRegistrar": sp.TRecord(_registrar=sp.TAddress, _newRegistrarName=sp.TString),
+    "registerSafleId": sp.TRecord(_registrar=sp.TAddress, _userAddress=sp.TAddress, _safleId=sp.TString),
+    "registerSafleIds": sp.TRecord(_registrar=sp.TAddress, _safleIds=sp.TList(sp.TRecord(_userAddress=sp.TAddress, _safleId=sp.TString))),
+    "updateSafleId": sp.TRecord(_registrar=sp.TAddress, _userAddress=sp.TAddress, _safleId=sp.TString),
+    "transferSafleId": sp.TRecord(_safleId=sp.TString, _oldOwner=sp.TAddress, _newOwner=sp.TAddress),
+    "auctionInProcess": sp.TRecord(_safleId=sp.TString, _safleIdOwner=sp.TAddress),
+    "auctionEnded": sp.TRecord(_safleId=sp.TString, _safleIdOwner=sp.TAddress),
+    "mapCoin": sp.TRecord(_indexnumber=sp.TNat, _coinName=sp.TString, _aliasName=sp.TString, _registrar=sp.TAddress),
+    "registerCoinAddress": sp.TRecord(_userAddress=sp.TAddress, _index=sp.TNat, _address=sp.TString, _registrar=sp.TAddress),
+    "updateCoinAddress": sp.TRecord(_userAddress=sp.TAddress, _index=sp.TNat, _newAddress=sp.TString, _registrar=sp.TAddress),
+    "registerCoinAddresses": sp.TRecord(_userAddress=sp.TAddress, _addresses=sp.TMap(sp.TNat, sp.TString), _registrar=sp.TAddress),
+    "updateCoinAddresses": sp.TRecord(_userAddress=sp.TAddress, _addresses=sp.TMap(sp.TNat, sp.TString), _registrar=sp.TAddress)
+}
+
+
+def registryType():
+    return sp.TRecord(**registrarStorage.registryTypes())
+
+
+def logicType():
+    return sp.TLambda(
+        sp.TRecord(params=sp.TBytes, registry=registryType()),
+        registryType(),
+        with_operations=True
+    )
+
+
+# RegistryLogic with self.data bound to the registry record of a logic lambda.
+class RegistryState(registrarStorage.RegistryLogic):
+    def __init__(self, _registry):
+        self.data = _registry
+
+
+def logicLambda(_name):
+    logic = getattr(registrarStorage.RegistryLogic, _name + "Logic")
+
+    def run(arg):
+        registry = sp.local("registry", arg.registry)
+        params = sp.unpack(arg.params, LOGIC_PARAMS[_name]).open_some("Invalid logic parameters.")
+        logic(RegistryState(registry.value), sp.local("params", params).value)
+        sp.result(registry.value)
+    return sp.build_lambda(run, with_operations=True)
+
+
+class RegistrarSingle(registrarFees.RegistrarFees):
+    def __init__(self, _ownerAddress, _walletAddress):
+        self.init_type(sp.TRecord(
+            registry=registryType(),
+            logic=sp.TBigMap(sp.TString, logicType()),
+            **registrarFees.registrarFeesTypes()
+        ))
+        self.init(
+            registry=sp.record(**registrarStorage.emptyRegistry()),
+            logic=sp.big_map(dict((name, logicLambda(name)) for name in LOGIC_PARAMS)),
+            **registrarFees.initialRegistrarFees(_ownerAddress, _walletAddress)
+        )
+
+    def onlyAuctionContract(self):
+        sp.verify(sp.sender == self.data.registry.auctionContractAddress)
+
+    def runLogic(self, _name, _params):
+        # The registry is handed to the installed lambda and replaced by what it
+        # returns: one execution instead of a call into a storage contract.
+        sp.set_type(_params, LOGIC_PARAMS[_name])
+        logic = self.data.logic.get(_name, message="Logic not installed.")
+        self.data.registry = logic(sp.record(params=sp.pack(_params), registry=self.data.registry))
+
+    @sp.entry_point
+    def upgradeLogic(self, params):
+        sp.set_type(params, sp.TRecord(_name=sp.TString, _logic=logicType()))
+        self.onlyOwner()
+
+        self.data.logic[params._name] = params._logic
+        sp.emit(sp.record(name=params._name), tag="upgradeLogic")
+
+    @sp.entry_point
+    def setAuctionContract(self, params):
+        self.onlyOwner()
+
+        self.data.registry.auctionContractAddress = params._auctionAddress
+
+    @sp.entry_point
+    def registerRegistrar(self, params):
+        lower = self.registrarChecks(params._registrarName)
+        self.checkRegistrationStatus()
+
+        self.collectFees()
+        self.runLogic("registerRegistrar", sp.record(_registrar=sp.sender, _registrarName=lower))
+
+    @sp.entry_point
+    def updateRegistrar(self, params):
+        lower = self.registrarChecks(params._registrarName)
+        self.checkRegistrationStatus()
+
+        self.collectFees()
+        self.runLogic("updateRegistrar", sp.record(_registrar=sp.sender, _newRegistrarName=lower))
+
+    @sp.entry_point
+    def registerSafleId(self, params):
+        lower = self.safleIdChecks(params._safleId)
+        self.checkRegistrationStatus()
+
+        self.collectFees()
+        self.runLogic("registerSafleId", sp.record(_registrar=sp.sender, _userAddress=params._userAddress, _safleId=lower))
+
+    @sp.entry_point
+    def registerSafleIds(self, params):
+        sp.set_type(params._safleIds, sp.TList(sp.TRecord(_userAddress=sp.TAddress, _safleId=sp.TString)))
+        sp.verify(sp.len(params._safleIds) > 0, "No SafleIDs to register.")
+        sp.verify(sp.amount >= sp.split_tokens(self.data.safleIdFees, sp.len(params._safleIds), 1), "Registration fees not matched.")
+        self.checkRegistrationStatus()
+
+        lowered = sp.local("lowered", sp.list(t=sp.TRecord(_userAddress=sp.TAddress, _safleId=sp.TString)))
+        sp.for item in params._safleIds:
+            lowered.value.push(sp.record(
+                _userAddress=item._userAddress,
+                _safleId=self.normalize(item._safleId)
+            ))
+        self.collectFees()
+        self.runLogic("registerSafleIds", sp.record(_registrar=sp.sender, _safleIds=lowered.value.rev()))
+
+    @sp.entry_point
+    def updateSafleId(self, params):
+        lower = self.safleIdChecks(params._newSafleId)
+        self.checkRegistrationStatus()
+
+        self.collectFees()
+        self.runLogic("updateSafleId", sp.record(_registrar=sp.sender, _userAddress=params._userAddress, _safleId=lower))
+
+    @sp.entry_point
+    def transferSafleId(self, params):
+        self.onlyAuctionContract()
+        self.runLogic("transferSafleId", sp.record(_safleId=params._safleId, _oldOwner=params._oldOwner, _newOwner=params._newOwner))
+
+    @sp.entry_point
+    def auctionInProcess(self, params):
+        self.onlyAuctionContract()
+        self.runLogic("auctionInProcess", sp.record(_safleId=params._safleId, _safleIdOwner=params._safleIdOwner))
+
+    @sp.entry_point
+    def auctionEnded(self, params):
+        self.onlyAuctionContract()
+        self.runLogic("auctionEnded", sp.record(_safleId=params._safleId, _safleIdOwner=params._safleIdOwner))
+
+    @sp.entry_point
+    def mapCoins(self, params):
+        lowerBlockchainName = self.toLower(params._blockchainName)
+        lowerAliasName = self.toLower(params._aliasName)
+        sp.verify(params._indexNumber != 0)
+        self.checkAlphaNumeric(lowerBlockchainName)
+        self.checkAlphaNumeric(lowerAliasName)
+
+        self.runLogic("mapCoin", sp.record(
+            _indexnumber=params._indexNumber,
+            _coinName=lowerBlockchainName,
+            _aliasName=lowerAliasName,
+            _registrar=sp.sender
+        ))
+
+    @sp.entry_point
+    def registerCoinAddress(self, params):
+        sp.verify(params._index != 0)
+        self.runLogic("registerCoinAddress", sp.record(
+            _userAddress=params._userAddress,
+            _index=params._index,
+            _address=self.toLower(params._address),
+            _registrar=sp.sender
+        ))
+
+    @sp.entry_point
+    def updateCoinAddress(self, params):
+        sp.verify(params._index != 0)
+        self.runLogic("updateCoinAddress", sp.record(
+            _userAddress=params._userAddress,
+            _index=params._index,
+            _newAddress=self.toLower(params._address),
+            _registrar=sp.sender
+        ))
+
+    def lowerCoinAddresses(self, _addresses):
+        sp.set_type(_addresses, sp.TMap(sp.TNat, sp.TString))
+
+        lowered = sp.local("lowered", sp.map(tkey=sp.TNat, tvalue=sp.TString))
+        sp.for item in _addresses.items():
+            sp.verify(item.key != 0)
+            lowered.value[item.key] = self.toLower(item.value)
+        return lowered.value
+
+    @sp.entry_point
+    def registerCoinAddresses(self, params):
+        lowerAddresses = self.lowerCoinAddresses(params._addresses)
+        self.runLogic("registerCoinAddresses", sp.record(_userAddress=params._userAddress, _addresses=lowerAddresses, _registrar=sp.sender))
+
+    @sp.entry_point
+    def updateCoinAddresses(self, params):
+        lowerAddresses = self.lowerCoinAddresses(params._addresses)
+        self.runLogic("updateCoinAddresses", sp.record(_userAddress=params._userAddress, _addresses=lowerAddresses, _registrar=sp.sender))
+
+    @sp.onchain_view()
+    def resolveRegistrarName(self, params):
+        RegistryState(self.data.registry).resolveRegistrarNameView(params)
+
+    @sp.onchain_view()
+    def resolveSafleId(self, params):
+        RegistryState(self.data.registry).resolveSafleIdView(params)
+
+    @sp.onchain_view()
+    def oldSafleIdsOf(self, params):
+        RegistryState(self.data.registry).oldSafleIdsView(params)
+
+    @sp.onchain_view()
+    def oldRegistrarNamesOf(self, params):
+        RegistryState(self.data.registry).oldRegistrarNamesView(params)
+
+    @sp.onchain_view()
+    def accountOf(self, params):
+        RegistryState(self.data.registry).accountView(params)
+
+    @sp.onchain_view()
+    def coinAddressToId(self, params):
+        RegistryState(self.data.registry).coinAddressToIdView(params)
+
+    @sp.onchain_view()
+    def idToCoinAddress(self, params):
+        RegistryState(self.data.registry).idToCoinAddressView(params)
+
+    @sp.onchain_view()
+    def resolveSafleIds(self, params):
+        RegistryState(self.data.registry).resolveSafleIdsView(params)
+
+    @sp.onchain_view()
+    def coinAddressesToIds(self, params):
+        RegistryState(self.data.registry).coinAddressesToIdsView(params)
+
+    @sp.onchain_view()
+    def idsToCoinAddresses(self, params):
+        RegistryState(self.data.registry).idsToCoinAddressesView(params)
+
+    @sp.onchain_view()
+    def nameStatus(self, params):
+        RegistryState(self.data.registry).nameStatusView(params)
+
+    @sp.onchain_view()
+    def nameStatuses(self, params):
+        RegistryState(self.data.registry).nameStatusesView(params)
+
+sp.add_compilation_target("RegistrarSingle", RegistrarSingle(_ownerAddress=sp.address("tz1VVhDEgXSHNFcDmKpKeujvJ6dV7kcSqbAV"), _walletAddress=sp.address("tz1VVhDEgXSHNFcDmKpKeujvJ6dV7kcSqbAV")))
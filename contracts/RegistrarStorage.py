@@ -1,213 +1,529 @@
 import smartpy as sp
 
 
-class RegistrarStorage(sp.Contract):
-    def __init__(self, _ownerAddress, _mainContractAddress):
-        self.init(
-            contractOwner=_ownerAddress,
-            mainContract=_mainContractAddress,
-            resolveAddressFromSafleId=sp.map(),
-            auctionProcess=sp.map(),
-            coinAddressToSafleId=sp.map(),
-            OtherCoin=sp.map(
-                tkey=sp.TNat,
-                tvalue=sp.TRecord(
-                    isIndexMapped=sp.TBool,
-                    aliasName=sp.TString,
-                    coinName=sp.TString
-                )
-            ),
-            isCoinMapped=sp.map(),
-            Registrars=sp.map(
-                tkey=sp.TAddress,
-                tvalue=sp.TRecord(
-                    isRegisteredRegistrar=sp.TBool,
-                    registrarName=sp.TString,
-                    registarAddress=sp.TAddress
-                )
-            ),
-            safleIdToCoinAddress=sp.map(
-                tkey=sp.TString,
-                tvalue=sp.TMap(sp.TNat, sp.TString)
-            ),
-            resolveUserAddress=sp.map(),
-            registrarNameToAddress=sp.map(),
-            isAddressTaken=sp.map(),
-            totalRegistrars=0,
-            totalSafleIdRegistered=0,
-            auctionContractAddress=sp.address("KT18amZmM5W7qDWVt2pH6uj7sCEd3kbzLrHT"),
-            resolveOldSafleIdFromAddress=sp.map(
-                tkey=sp.TAddress,
-                tvalue=sp.TList(sp.TBytes)
-            ),
-            resolveOldSafleID=sp.map(),
-            totalRegistrarUpdates=sp.map(),
-            resolveOldRegistrarAddress=sp.map(
-                tkey=sp.TAddress,
-                tvalue=sp.TList(sp.TBytes)
-            ),
-            totalSafleIDCount=sp.map(),
-            unavailableSafleIds=sp.map()
+def registryBigMaps():
+    # Key and value types of the registry big_maps, shared by RegistrarStorage
+    # and the single-contract RegistrarSingle, which keeps them in one record
+    # handed to its logic lambdas.
+    return dict(
+        resolveAddressFromSafleId=(sp.TBytes, sp.TAddress),
+        accounts=(
+            sp.TAddress,
+            sp.TRecord(
+                safleId=sp.TString,
+                isAddressTaken=sp.TBool,
+                inAuction=sp.TBool,
+                safleIdUpdates=sp.TNat,
+                oldSafleIdCount=sp.TNat,
+                isRegistrar=sp.TBool,
+                registrarName=sp.TString,
+                registrarUpdates=sp.TNat
+            )
+        ),
+        coinAddressToSafleId=(sp.TString, sp.TString),
+        OtherCoin=(
+            sp.TNat,
+            sp.TRecord(
+                isIndexMapped=sp.TBool,
+                aliasName=sp.TString,
+                coinName=sp.TString
+            )
+        ),
+        isCoinMapped=(sp.TString, sp.TBool),
+        safleIdToCoinAddress=(sp.TString, sp.TMap(sp.TNat, sp.TString)),
+        registrarNameToAddress=(sp.TBytes, sp.TAddress),
+        resolveOldSafleIdFromAddress=(sp.TPair(sp.TAddress, sp.TNat), sp.TBytes),
+        resolveOldSafleID=(sp.TBytes, sp.TAddress),
+        resolveOldRegistrarAddress=(sp.TPair(sp.TAddress, sp.TNat), sp.TBytes),
+        unavailableSafleIds=(sp.TString, sp.TBool)
+    )
+
+
+def registryTypes():
+    types = dict((name, sp.TBigMap(key, value)) for name, (key, value) in registryBigMaps().items())
+    types.update(
+        totalRegistrars=sp.TNat,
+        totalSafleIdRegistered=sp.TNat,
+        auctionContractAddress=sp.TAddress
+    )
+    return types
+
+
+def importChunkType():
+    # A chunk of the bulk import: (key, value) entries for any of the registry big_maps.
+    return sp.TRecord(**dict(
+        (name, sp.TList(sp.TPair(key, value))) for name, (key, value) in registryBigMaps().items()
+    ))
+
+
+def emptyRegistry():
+    return dict(
+        resolveAddressFromSafleId=sp.big_map(),
+        accounts=sp.big_map(),
+        coinAddressToSafleId=sp.big_map(),
+        OtherCoin=sp.big_map(),
+        isCoinMapped=sp.big_map(),
+        safleIdToCoinAddress=sp.big_map(),
+        registrarNameToAddress=sp.big_map(),
+        totalRegistrars=0,
+        totalSafleIdRegistered=0,
+        auctionContractAddress=sp.address("KT18amZmM5W7qDWVt2pH6uj7sCEd3kbzLrHT"),
+        resolveOldSafleIdFromAddress=sp.big_map(),
+        resolveOldSafleID=sp.big_map(),
+        resolveOldRegistrarAddress=sp.big_map(),
+        unavailableSafleIds=sp.big_map()
+    )
+
+
+# Codes returned by the nameStatus views.
+NAME_FREE = 0
+NAME_SAFLE_ID = 1
+NAME_REGISTRAR = 2
+NAME_RETIRED = 3
+NAME_IN_AUCTION = 4
+
+
+# Checks and writes on the registry fields in self.data. Access control stays
+# with the callers: RegistrarStorage entry points check the sender and then
+# run these, RegistrarSingle runs them in its logic lambdas with self.data
+# bound to the registry record.
+class RegistryLogic:
+
+    def emptyAccount(self):
+        return sp.record(
+            safleId = "",
+            isAddressTaken = False,
+            inAuction = False,
+            safleIdUpdates = 0,
+            oldSafleIdCount = 0,
+            isRegistrar = False,
+            registrarName = "",
+            registrarUpdates = 0
         )
 
-    def onlyOwner(self):
-        sp.verify(self.data.contractOwner == sp.sender)
+    def loadAccount(self, _name, _address):
+        # Everything known about an address lives in one record: entry points
+        # read it once into a local, update it and write it back once.
+        return sp.local(_name, self.data.accounts.get(_address, self.emptyAccount()))
 
-    def onlyMainContract(self):
-        sp.verify(self.data.mainContract == sp.sender)
+    def isRegistrar(self, _address):
+        return self.data.accounts.get(_address, self.emptyAccount()).isRegistrar
+
+    def nameKey(self, _local, _name):
+        # Name registries are keyed by the 32 byte BLAKE2b digest of the packed
+        # name; it is computed once per call and reused for every check and write.
+        return sp.local(_local, sp.blake2b(sp.pack(_name))).value
 
     def registrarChecks(self, _registrarName):
-        regNameBytes = sp.pack(_registrarName)
-        sp.verify(~self.data.registrarNameToAddress.contains(regNameBytes), "Registrar name is already taken.")
-        sp.verify(~self.data.resolveAddressFromSafleId.contains(regNameBytes), "This Registrar name is already registered as an SafleID.")
+        regNameKey = self.nameKey("regNameKey", _registrarName)
+        sp.verify(~self.data.registrarNameToAddress.contains(regNameKey), "Registrar name is already taken.")
+        sp.verify(~self.data.resolveAddressFromSafleId.contains(regNameKey), "This Registrar name is already registered as an SafleID.")
+        return regNameKey
 
     def safleIdChecks(self, _safleId, _registrar):
-        idBytes = sp.pack(_safleId)
+        sp.verify(self.isRegistrar(_registrar), "Invalid Registrar.")
+        return self.safleIdAvailable(_safleId)
 
-        sp.verify(self.data.Registrars.contains(_registrar), "Invalid Registrar.")
-        sp.verify(~self.data.registrarNameToAddress.contains(idBytes), "This SafleId is taken by a Registrar.")
-        sp.verify(~self.data.resolveAddressFromSafleId.contains(idBytes), "This SafleId is already registered.")
-        sp.verify(~self.data.unavailableSafleIds.contains(_safleId), "SafleId is already used once, not available now")
+    def safleIdAvailable(self, _safleId, _reportId=False):
+        idKey = self.nameKey("idKey", _safleId)
+
+        sp.verify(~self.data.registrarNameToAddress.contains(idKey), self.failure("This SafleId is taken by a Registrar.", _safleId, _reportId))
+        sp.verify(~self.data.resolveAddressFromSafleId.contains(idKey), self.failure("This SafleId is already registered.", _safleId, _reportId))
+        sp.verify(~self.data.unavailableSafleIds.contains(_safleId), self.failure("SafleId is already used once, not available now", _safleId, _reportId))
+        return idKey
+
+    def failure(self, _message, _safleId, _reportId):
+        # Batch entry points fail with (safleId, message) so the offending item is visible.
+        if _reportId:
+            return sp.pair(_safleId, _message)
+        return _message
 
     def auctionContract(self):
         sp.verify(sp.sender == self.data.auctionContractAddress)
 
-    def coinAddressCheck(self, _userAddress, _index, _registrar):
-        sp.verify(self.data.Registrars.contains(_registrar), "Invalid Registrar")
-        sp.verify(self.data.OtherCoin.contains(_index), "This index number is not mapped.");
-        sp.if self.data.auctionProcess.contains(_userAddress):
-            sp.verify(~self.data.auctionProcess[_userAddress])
+    def registerRegistrarLogic(self, params):
+        regNameKey = self.registrarChecks(params._registrarName)
 
-    @sp.entry_point
-    def upgradeMainContractAddress(self, params):
-        self.onlyOwner()
+        registrar = self.loadAccount("registrar", params._registrar)
+        registrar.value.isRegistrar = True
+        registrar.value.registrarName = params._registrarName
+        registrar.value.isAddressTaken = True
+        self.data.accounts[params._registrar] = registrar.value
 
-        self.data.mainContract = params._mainContractAddress
+        self.data.registrarNameToAddress[regNameKey] = params._registrar
+        self.data.totalRegistrars += 1
+        sp.emit(sp.record(registrar=params._registrar, name=params._registrarName), tag="registerRegistrar")
 
-    @sp.entry_point
-    def registerRegistrar(self, params):
-        self.registrarChecks(params._registrarName)
-        self.onlyMainContract()
+    def updateRegistrarLogic(self, params):
+        newNameKey = self.registrarChecks(params._newRegistrarName)
+
+        registrar = self.loadAccount("registrar", params._registrar)
+
+        sp.verify(registrar.value.isRegistrar, "Registrar should register first.")
+        sp.verify(registrar.value.registrarUpdates+1 <= 5, "Maximum update count reached.") #MAX_NAME_UPDATES
+
+        oldName = sp.local("oldName", registrar.value.registrarName).value
+        oldNameBytes = sp.local("oldNameBytes", sp.pack(oldName)).value
+        del self.data.registrarNameToAddress[sp.blake2b(oldNameBytes)]
+
+        # registrarUpdates doubles as the history counter; history keeps the packed name.
+        self.data.resolveOldRegistrarAddress[sp.pair(params._registrar, registrar.value.registrarUpdates)] = oldNameBytes
+
+        registrar.value.registrarName = params._newRegistrarName
+        registrar.value.registrarUpdates += 1
+        self.data.accounts[params._registrar] = registrar.value
 
-        regNameBytes = sp.pack(params._registrarName)
-        self.data.Registrars[params._registrar] = sp.record(
-            isRegisteredRegistrar=True,
-            registrarName=params._registrarName,
-            registarAddress=params._registrar
+        self.data.registrarNameToAddress[newNameKey] = params._registrar
+        sp.emit(sp.record(registrar=params._registrar, oldName=oldName, newName=params._newRegistrarName), tag="updateRegistrar")
+
+    def resolveRegistrarNameView(self, params):
+        regNameKey = self.nameKey("regNameKey", params._name)
+        sp.verify(self.data.registrarNameToAddress.contains(regNameKey), "Resolver : Registrar is not yet registered for this SafleID.")
+        sp.result(self.data.registrarNameToAddress[regNameKey])
+
+    def addSafleId(self, _userAddress, _safleId, _idKey, _reportId=False):
+        user = self.loadAccount("user", _userAddress)
+        sp.verify(~user.value.isAddressTaken, self.failure("SafleID already registered", _safleId, _reportId))
+
+        self.data.resolveAddressFromSafleId[_idKey] = _userAddress
+        user.value.isAddressTaken = True
+        user.value.safleId = _safleId
+        self.data.accounts[_userAddress] = user.value
+        self.data.totalSafleIdRegistered += 1
+        sp.emit(sp.record(user=_userAddress, safleId=_safleId), tag="registerSafleId")
+
+    def registerSafleIdLogic(self, params):
+        idKey = self.safleIdChecks(params._safleId, params._registrar)
+
+        self.addSafleId(params._userAddress, params._safleId, idKey)
+
+    def registerSafleIdsLogic(self, params):
+        sp.set_type(params._safleIds, sp.TList(sp.TRecord(_userAddress=sp.TAddress, _safleId=sp.TString)))
+
+        sp.verify(self.isRegistrar(params._registrar), "Invalid Registrar.")
+        sp.for item in params._safleIds:
+            idKey = self.safleIdAvailable(item._safleId, _reportId=True)
+            self.addSafleId(item._userAddress, item._safleId, idKey, _reportId=True)
+
+    def updateSafleIdLogic(self, params):
+        idKey = self.safleIdChecks(params._safleId, params._registrar)
+
+        user = self.loadAccount("user", params._userAddress)
+
+        sp.verify(user.value.safleIdUpdates+1 <= 5, "Maximum update count reached.") #MAX_NAME_UPDATES
+        sp.verify(user.value.isAddressTaken, "SafleID not registered.")
+        sp.verify(~user.value.inAuction, "SafleId cannot be updated inbetween Auction.")
+
+        oldName = sp.local("oldName", user.value.safleId).value
+        oldIdBytes = sp.local("oldIdBytes", sp.pack(oldName)).value
+        oldIdKey = sp.local("oldIdKey", sp.blake2b(oldIdBytes)).value
+
+        self.data.unavailableSafleIds[oldName] = True
+        del self.data.resolveAddressFromSafleId[oldIdKey]
+        self.oldSafleIds(user, params._userAddress, oldIdBytes, oldIdKey)
+
+        self.data.resolveAddressFromSafleId[idKey] = params._userAddress
+        user.value.safleId = params._safleId
+        user.value.safleIdUpdates += 1
+        self.data.accounts[params._userAddress] = user.value
+
+        self.data.totalSafleIdRegistered += 1
+        sp.emit(sp.record(user=params._userAddress, oldSafleId=oldName, newSafleId=params._safleId), tag="updateSafleId")
+
+    def resolveSafleIdView(self, params):
+        sp.verify(sp.len(params._safleId) != 0, "Resolver : user SafleID should not be empty.")
+        idKey = self.nameKey("idKey", params._safleId)
+        sp.verify(self.data.resolveAddressFromSafleId.contains(idKey), "Resolver : User is not yet registered for this SafleID.")
+        sp.result(self.data.resolveAddressFromSafleId[idKey])
+
+    def transferSafleIdLogic(self, params):
+        idBytes = sp.local("idBytes", sp.pack(params._safleId)).value
+        idKey = sp.local("idKey", sp.blake2b(idBytes)).value
+
+        oldOwner = self.loadAccount("oldOwner", params._oldOwner)
+        sp.verify(oldOwner.value.isAddressTaken, "You are not an owner of this safleId.")
+        sp.verify(self.data.resolveAddressFromSafleId.contains(idKey), "This SafleId does not have an owner.")
+
+        self.oldSafleIds(oldOwner, params._oldOwner, idBytes, idKey)
+        oldOwner.value.isAddressTaken = False
+        oldOwner.value.inAuction = False
+        self.data.accounts[params._oldOwner] = oldOwner.value
+
+        self.data.resolveAddressFromSafleId[idKey] = params._newOwner
+
+        # Loaded after the old owner is written back, so a transfer to self keeps the name.
+        newOwner = self.loadAccount("newOwner", params._newOwner)
+        newOwner.value.isAddressTaken = True
+        newOwner.value.safleId = params._safleId
+        self.data.accounts[params._newOwner] = newOwner.value
+        sp.emit(sp.record(safleId=params._safleId, oldOwner=params._oldOwner, newOwner=params._newOwner), tag="transferSafleId")
+
+    def oldSafleIds(self, _account, _userAddress, _safleIdBytes, _idKey):
+        # Only bumps the counter on the loaded account; the caller writes it back.
+        # History entries keep the packed name so they can be listed again.
+        self.data.resolveOldSafleIdFromAddress[sp.pair(_userAddress, _account.value.oldSafleIdCount)] = _safleIdBytes
+        _account.value.oldSafleIdCount += 1
+        self.data.resolveOldSafleID[_idKey] = _userAddress
+
+    def historyPage(self, _history, _owner, _total, _offset, _limit):
+        names = sp.local("names", sp.list(t=sp.TString))
+        idx = sp.local("idx", _offset)
+        sp.while (idx.value < _total) & (idx.value < _offset + _limit):
+            names.value.push(sp.unpack(_history[sp.pair(_owner, idx.value)], sp.TString).open_some())
+            idx.value += 1
+        sp.result(sp.record(total=_total, names=names.value.rev()))
+
+    def oldSafleIdsView(self, params):
+        sp.set_type(params, sp.TRecord(_userAddress=sp.TAddress, _offset=sp.TNat, _limit=sp.TNat))
+        self.historyPage(
+            self.data.resolveOldSafleIdFromAddress,
+            params._userAddress,
+            self.data.accounts.get(params._userAddress, self.emptyAccount()).oldSafleIdCount,
+            params._offset,
+            params._limit
         )
 
-        self.data.registrarNameToAddress[regNameBytes] = params._registrar
-        self.data.isAddressTaken[params._registrar] = True
-        self.data.totalRegistrars += 1
+    def oldRegistrarNamesView(self, params):
+        sp.set_type(params, sp.TRecord(_registrar=sp.TAddress, _offset=sp.TNat, _limit=sp.TNat))
+        self.historyPage(
+            self.data.resolveOldRegistrarAddress,
+            params._registrar,
+            self.data.accounts.get(params._registrar, self.emptyAccount()).registrarUpdates,
+            params._offset,
+            params._limit
+        )
 
-    @sp.entry_point
-    def updateRegistrar(self, params):
-        self.registrarChecks(params._newRegistrarName)
-        self.onlyMainContract()
+    def auctionInProcessLogic(self, params):
+        sp.set_type(params._safleId, sp.TString)
 
-        newNameBytes = sp.pack(params._newRegistrarName)
+        sp.verify(sp.len(params._safleId) != 0, "Resolver : User SafleID should not be empty.")
+        sp.verify(self.data.resolveAddressFromSafleId.contains(self.nameKey("idKey", params._safleId)), "Resolver : User is not yet registered for this SafleID.")
+        owner = self.loadAccount("owner", params._safleIdOwner)
+        owner.value.inAuction = True
+        self.data.accounts[params._safleIdOwner] = owner.value
 
-        sp.if ~self.data.totalRegistrarUpdates.contains(params._registrar):
-            self.data.totalRegistrarUpdates[params._registrar] = 0
-        sp.if ~self.data.resolveOldRegistrarAddress.contains(params._registrar):
-            self.data.resolveOldRegistrarAddress[params._registrar] = sp.list([])
+    def auctionEndedLogic(self, params):
+        sp.set_type(params._safleId, sp.TString)
 
-        sp.verify(self.data.isAddressTaken.get(params._registrar, False) == True, "Registrar should register first.")
-        sp.verify(self.data.totalRegistrarUpdates[params._registrar]+1 <= 5, "Maximum update count reached.") #MAX_NAME_UPDATES
+        owner = self.loadAccount("owner", params._safleIdOwner)
+        owner.value.inAuction = False
+        self.data.accounts[params._safleIdOwner] = owner.value
 
-        registrarObject = self.data.Registrars[params._registrar]
-        oldName = registrarObject.registrarName
-        oldNameBytes = sp.pack(oldName)
-        del self.data.registrarNameToAddress[oldNameBytes]
+    def mapCoinLogic(self, params):
+        sp.verify(self.data.OtherCoin.get(params._indexnumber, sp.record(
+                isIndexMapped = False,
+                aliasName = "",
+                coinName = ""
+            )).isIndexMapped == False, "This index number has already been mapped.")
+        sp.verify(self.data.isCoinMapped.get(params._coinName, False) == False, "This coin is already mapped.")
+        sp.verify(self.isRegistrar(params._registrar), "Invalid Registrar.")
 
-        self.data.resolveOldRegistrarAddress[params._registrar].push(
-            sp.pack(self.data.Registrars[params._registrar].registrarName)
+        self.data.OtherCoin[params._indexnumber] = sp.record(
+            isIndexMapped = True,
+            aliasName = params._aliasName,
+            coinName = params._coinName
         )
 
-        self.data.Registrars[params._registrar].registrarName = params._newRegistrarName
-        self.data.Registrars[params._registrar].registarAddress = params._registrar
+        self.data.isCoinMapped[params._coinName] = True
+        sp.emit(sp.record(index=params._indexnumber, coinName=params._coinName, aliasName=params._aliasName), tag="mapCoin")
 
-        self.data.registrarNameToAddress[newNameBytes] = params._registrar
-        self.data.totalRegistrarUpdates[params._registrar] += 1
+    def registerCoinAddressLogic(self, params):
+        sp.set_type(params._index, sp.TNat)
 
-    @sp.onchain_view()
-    def resolveRegistrarName(self, params):
-        regNameBytes = sp.pack(params._name)
-        sp.verify(self.data.registrarNameToAddress.contains(regNameBytes), "Resolver : Registrar is not yet registered for this SafleID.")
-        sp.result(self.data.registrarNameToAddress[regNameBytes])
+        safleId = self.coinOwnerChecks(params._userAddress, params._registrar)
+        sp.verify(self.data.OtherCoin.contains(params._index), "This index number is not mapped.")
 
-    @sp.entry_point
-    def registerSafleId(self, params):
-        self.safleIdChecks(params._safleId, params._registrar)
-        self.onlyMainContract()
+        sp.if ~self.data.safleIdToCoinAddress.contains(safleId):
+            self.data.safleIdToCoinAddress[safleId] = sp.map({})
+        self.data.safleIdToCoinAddress[safleId][params._index] = params._address
+        self.data.coinAddressToSafleId[params._address] = safleId
+        self.coinAddressEvent("registerCoinAddress", safleId, params._index, params._address)
 
-        sp.verify(self.data.isAddressTaken.get(params._userAddress, False) == False, "SafleID already registered")
+    def updateCoinAddressLogic(self, params):
+        sp.set_type(params._index, sp.TNat)
 
-        idBytes = sp.pack(params._safleId)
+        safleId = self.coinOwnerChecks(params._userAddress, params._registrar)
+        sp.verify(self.data.OtherCoin.contains(params._index), "This index number is not mapped.")
 
-        self.data.resolveAddressFromSafleId[idBytes] = params._userAddress
-        self.data.isAddressTaken[params._userAddress] = True
-        self.data.resolveUserAddress[params._userAddress] = params._safleId
-        self.data.totalSafleIdRegistered += 1
+        sp.verify(self.data.safleIdToCoinAddress[safleId].contains(params._index))
 
-    @sp.entry_point
-    def updateSafleId(self, params):
-        self.safleIdChecks(params._safleId, params._registrar)
-        self.onlyMainContract()
+        self.data.safleIdToCoinAddress[safleId][params._index] = params._newAddress
+        self.data.coinAddressToSafleId[params._newAddress] = safleId
+        self.coinAddressEvent("updateCoinAddress", safleId, params._index, params._newAddress)
 
-        sp.if ~self.data.totalSafleIDCount.contains(params._userAddress):
-            self.data.totalSafleIDCount[params._userAddress] = 0
+    def coinAddressEvent(self, _tag, _safleId, _index, _address):
+        sp.emit(sp.record(safleId=_safleId, index=_index, address=_address), tag=_tag)
 
-        sp.verify(self.data.totalSafleIDCount[params._userAddress]+1 <= 5, "Maximum update count reached.") #MAX_NAME_UPDATES
-        sp.verify(self.data.isAddressTaken.get(params._userAddress, False) == True, "SafleID not registered.")
-        sp.verify(self.data.auctionProcess.get(params._userAddress, False) == False, "SafleId cannot be updated inbetween Auction.")
+    def coinOwnerChecks(self, _userAddress, _registrar):
+        sp.verify(self.isRegistrar(_registrar), "Invalid Registrar.")
+        user = sp.local("user", self.data.accounts.get(_userAddress, self.emptyAccount())).value
+        sp.verify(~user.inAuction, "Coin addresses cannot be changed inbetween Auction.")
+        sp.verify(user.safleId != "", "SafleID not registered.")
+        return sp.local("safleId", user.safleId).value
 
-        idBytes = sp.pack(params._safleId)
+    def registerCoinAddressesLogic(self, params):
+        sp.set_type(params._addresses, sp.TMap(sp.TNat, sp.TString))
 
-        oldName = self.data.resolveUserAddress[params._userAddress]
-        oldIdBytes = sp.pack(oldName)
+        safleId = self.coinOwnerChecks(params._userAddress, params._registrar)
 
-        self.data.unavailableSafleIds[oldName] = True
-        del self.data.resolveAddressFromSafleId[oldIdBytes]
-        self.oldSafleIds(params._userAddress, oldIdBytes)
+        coinAddresses = sp.local("coinAddresses", self.data.safleIdToCoinAddress.get(safleId, sp.map(tkey=sp.TNat, tvalue=sp.TString)))
+        sp.for item in params._addresses.items():
+            sp.verify(self.data.OtherCoin.contains(item.key), sp.pair(item.key, "This index number is not mapped."))
+            coinAddresses.value[item.key] = item.value
+            self.data.coinAddressToSafleId[item.value] = safleId
+            self.coinAddressEvent("registerCoinAddress", safleId, item.key, item.value)
+        self.data.safleIdToCoinAddress[safleId] = coinAddresses.value
 
-        self.data.resolveAddressFromSafleId[idBytes] = params._userAddress
-        self.data.resolveUserAddress[params._userAddress] = params._safleId
+    def updateCoinAddressesLogic(self, params):
+        sp.set_type(params._addresses, sp.TMap(sp.TNat, sp.TString))
 
-        self.data.totalSafleIDCount[params._userAddress] += 1
-        self.data.totalSafleIdRegistered += 1
+        safleId = self.coinOwnerChecks(params._userAddress, params._registrar)
 
-    @sp.onchain_view()
-    def resolveSafleId(self, params):
-        idBytes = sp.pack(params._safleId)
-        sp.verify(sp.len(sp.pack(params._safleId)) != 0, "Resolver : user SafleID should not be empty.")
-        sp.verify(self.data.resolveAddressFromSafleId.contains(idBytes), "Resolver : User is not yet registered for this SafleID.")
-        sp.result(self.data.resolveAddressFromSafleId[idBytes])
+        coinAddresses = sp.local("coinAddresses", self.data.safleIdToCoinAddress[safleId])
+        sp.for item in params._addresses.items():
+            sp.verify(coinAddresses.value.contains(item.key), sp.pair(item.key, "No coin address registered for this index."))
+            coinAddresses.value[item.key] = item.value
+            self.data.coinAddressToSafleId[item.value] = safleId
+            self.coinAddressEvent("updateCoinAddress", safleId, item.key, item.value)
+        self.data.safleIdToCoinAddress[safleId] = coinAddresses.value
+
+    def accountView(self, params):
+        sp.set_type(params._address, sp.TAddress)
+        sp.result(self.data.accounts.get(params._address, self.emptyAccount()))
+
+    def coinAddressToIdView(self, params):
+        sp.result(self.data.coinAddressToSafleId[params._address])
+
+    def idToCoinAddressView(self, params):
+        sp.result(self.data.safleIdToCoinAddress[params._safleId][params._index])
+
+    def statusOfName(self, _name):
+        # Names are looked up as registered, i.e. lower case.
+        nameKey = sp.local("nameKey", sp.blake2b(sp.pack(_name))).value
+        status = sp.local("status", sp.nat(NAME_FREE))
+        sp.if self.data.registrarNameToAddress.contains(nameKey):
+            status.value = NAME_REGISTRAR
+        sp.else:
+            sp.if self.data.resolveAddressFromSafleId.contains(nameKey):
+                status.value = NAME_SAFLE_ID
+                sp.if self.data.accounts.get(self.data.resolveAddressFromSafleId[nameKey], self.emptyAccount()).inAuction:
+                    status.value = NAME_IN_AUCTION
+            sp.else:
+                sp.if self.data.unavailableSafleIds.contains(_name):
+                    status.value = NAME_RETIRED
+        return status.value
+
+    def nameStatusView(self, params):
+        sp.set_type(params._name, sp.TString)
+        sp.result(self.statusOfName(params._name))
+
+    # Batch views answer a whole list in one call; names or addresses that are
+    # not registered map to None instead of failing the call.
+    def resolveSafleIdsView(self, params):
+        sp.set_type(params._safleIds, sp.TList(sp.TString))
+        resolved = sp.local("resolved", sp.map(tkey=sp.TString, tvalue=sp.TOption(sp.TAddress)))
+        sp.for safleId in params._safleIds:
+            resolved.value[safleId] = self.data.resolveAddressFromSafleId.get_opt(sp.blake2b(sp.pack(safleId)))
+        sp.result(resolved.value)
+
+    def coinAddressesToIdsView(self, params):
+        sp.set_type(params._addresses, sp.TList(sp.TString))
+        resolved = sp.local("resolved", sp.map(tkey=sp.TString, tvalue=sp.TOption(sp.TString)))
+        sp.for address in params._addresses:
+            resolved.value[address] = self.data.coinAddressToSafleId.get_opt(address)
+        sp.result(resolved.value)
+
+    def idsToCoinAddressesView(self, params):
+        sp.set_type(params._coins, sp.TList(sp.TRecord(_safleId=sp.TString, _index=sp.TNat)))
+        resolved = sp.local("resolved", sp.map(tkey=sp.TPair(sp.TString, sp.TNat), tvalue=sp.TOption(sp.TString)))
+        sp.for coin in params._coins:
+            coinAddresses = self.data.safleIdToCoinAddress.get(coin._safleId, sp.map(tkey=sp.TNat, tvalue=sp.TString))
+            resolved.value[sp.pair(coin._safleId, coin._index)] = coinAddresses.get_opt(coin._index)
+        sp.result(resolved.value)
+
+    def nameStatusesView(self, params):
+        sp.set_type(params._names, sp.TList(sp.TString))
+        statuses = sp.local("statuses", sp.map(tkey=sp.TString, tvalue=sp.TNat))
+        sp.for name in params._names:
+            statuses.value[name] = self.statusOfName(name)
+        sp.result(statuses.value)
+
+
+class RegistrarStorage(RegistryLogic, sp.Contract):
+    def __init__(self, _ownerAddress, _mainContractAddress):
+        self.init_type(sp.TRecord(contractOwner=sp.TAddress, mainContract=sp.TAddress, importSealed=sp.TBool, **registryTypes()))
+        self.init(
+            contractOwner=_ownerAddress,
+            mainContract=_mainContractAddress,
+            importSealed=False,
+            **emptyRegistry()
+        )
+
+    def onlyOwner(self):
+        sp.verify(self.data.contractOwner == sp.sender)
+
+    def onlyMainContract(self):
+        sp.verify(self.data.mainContract == sp.sender)
 
     @sp.entry_point
-    def transferSafleId(self, params):
-        self.auctionContract()
+    def upgradeMainContractAddress(self, params):
+        self.onlyOwner()
 
-        idBytes = sp.pack(params._safleId)
+        self.data.mainContract = params._mainContractAddress
+
+    @sp.entry_point
+    def importRegistry(self, params):
+        # Bulk migration from another RegistrarStorage: entries are written as
+        # they are, without the checks of the entry points that created them.
+        sp.set_type(params, importChunkType())
+        self.onlyOwner()
+        sp.verify(~self.data.importSealed, "Import is sealed.")
 
-        sp.verify(self.data.isAddressTaken.get(params._oldOwner, False) == True, "You are not an owner of this safleId.")
-        sp.verify(self.data.resolveAddressFromSafleId.contains(idBytes), "This SafleId does not have an owner.")
+        for name in registryBigMaps():
+            sp.for entry in getattr(params, name):
+                getattr(self.data, name)[sp.fst(entry)] = sp.snd(entry)
+        # The chunk is the event: off-chain caches and indexes learn the
+        # imported entries from it, as there is no event per record.
+        sp.emit(params, tag="importRegistry")
 
-        self.oldSafleIds(params._oldOwner, idBytes)
-        self.data.isAddressTaken[params._oldOwner] = False
+    @sp.entry_point
+    def sealImport(self, params):
+        self.onlyOwner()
+        sp.verify(~self.data.importSealed, "Import is sealed.")
 
-        self.data.resolveAddressFromSafleId[idBytes] = params._newOwner
+        self.data.totalRegistrars = params._totalRegistrars
+        self.data.totalSafleIdRegistered = params._totalSafleIdRegistered
+        self.data.importSealed = True
 
-        self.data.auctionProcess[params._oldOwner] = False
-        self.data.isAddressTaken[params._newOwner] = True
-        self.data.resolveUserAddress[params._newOwner] = params._safleId
+    @sp.entry_point
+    def registerRegistrar(self, params):
+        self.onlyMainContract()
+        self.registerRegistrarLogic(params)
 
-    def oldSafleIds(self, _userAddress, _safleId):
-        sp.if ~self.data.resolveOldSafleIdFromAddress.contains(_userAddress):
-            self.data.resolveOldSafleIdFromAddress[_userAddress] = sp.list([])
+    @sp.entry_point
+    def updateRegistrar(self, params):
+        self.onlyMainContract()
+        self.updateRegistrarLogic(params)
 
-        self.data.resolveOldSafleIdFromAddress[_userAddress].push(_safleId)
-        self.data.resolveOldSafleID[_safleId] = _userAddress
+    @sp.entry_point
+    def registerSafleId(self, params):
+        self.onlyMainContract()
+        self.registerSafleIdLogic(params)
+
+    @sp.entry_point
+    def registerSafleIds(self, params):
+        self.onlyMainContract()
+        self.registerSafleIdsLogic(params)
+
+    @sp.entry_point
+    def updateSafleId(self, params):
+        self.onlyMainContract()
+        self.updateSafleIdLogic(params)
+
+    @sp.entry_point
+    def transferSafleId(self, params):
+        self.auctionContract()
+        self.transferSafleIdLogic(params)
 
     @sp.entry_point
     def setAuctionContract(self, params):
@@ -217,76 +533,86 @@ class RegistrarStorage(sp.Contract):
 
     @sp.entry_point
     def auctionInProcess(self, params):
-        sp.set_type(params._safleId, sp.TString)
         self.auctionContract()
+        self.auctionInProcessLogic(params)
 
-        idBytes = sp.pack(params._safleId)
-
-        sp.verify(sp.len(params._safleId) != 0, "Resolver : User SafleID should not be empty.")
-        sp.verify(self.data.resolveAddressFromSafleId.contains(idBytes), "Resolver : User is not yet registered for this SafleID.")
-        self.data.auctionProcess[params._safleIdOwner] = True
+    @sp.entry_point
+    def auctionEnded(self, params):
+        self.auctionContract()
+        self.auctionEndedLogic(params)
 
     @sp.entry_point
     def mapCoin(self, params):
         self.onlyMainContract()
-
-        sp.verify(self.data.OtherCoin.get(params._indexnumber, sp.record(
-                isIndexMapped = False,
-                aliasName = "",
-                coinName = ""
-            )).isIndexMapped == False, "This index number has already been mapped.")
-        sp.verify(self.data.isCoinMapped.get(params._coinName, False) == False, "This coin is already mapped.")
-        sp.verify(self.data.Registrars[params._registrar].isRegisteredRegistrar, "Invalid Registrar.")
-
-        self.data.OtherCoin[params._indexnumber] = sp.record(
-            isIndexMapped = True,
-            aliasName = params._aliasName,
-            coinName = params._coinName
-        )
-
-        self.data.isCoinMapped[params._coinName] = True
+        self.mapCoinLogic(params)
 
     @sp.entry_point
     def registerCoinAddress(self, params):
-        sp.set_type(params._index, sp.TNat)
-
-        self.coinAddressCheck(params._userAddress, params._index, params._registrar)
         self.onlyMainContract()
-
-        sp.verify(self.data.Registrars[params._registrar].isRegisteredRegistrar, "Invalid Registrar.")
-        sp.verify(self.data.auctionProcess.get(params._userAddress, False) == False)
-        sp.verify(self.data.OtherCoin[params._index].isIndexMapped == True)
-
-        safleId = self.data.resolveUserAddress[params._userAddress]
-        sp.if ~self.data.safleIdToCoinAddress.contains(safleId):
-            self.data.safleIdToCoinAddress[safleId] = sp.map({})
-        self.data.safleIdToCoinAddress[safleId][params._index] = params._address
-        self.data.coinAddressToSafleId[params._address] = safleId
+        self.registerCoinAddressLogic(params)
 
     @sp.entry_point
     def updateCoinAddress(self, params):
-        sp.set_type(params._index, sp.TNat)
+        self.onlyMainContract()
+        self.updateCoinAddressLogic(params)
 
-        self.coinAddressCheck(params._userAddress, params._index, params._registrar)
+    @sp.entry_point
+    def registerCoinAddresses(self, params):
         self.onlyMainContract()
+        self.registerCoinAddressesLogic(params)
 
-        sp.verify(self.data.Registrars[params._registrar].isRegisteredRegistrar, "Invalid Registrar")
-        sp.verify(self.data.auctionProcess.get(params._userAddress, False) == False)
-        sp.verify(self.data.OtherCoin[params._index].isIndexMapped == True, "This index number is not mapped.")
+    @sp.entry_point
+    def updateCoinAddresses(self, params):
+        self.onlyMainContract()
+        self.updateCoinAddressesLogic(params)
 
-        safleId = self.data.resolveUserAddress[params._userAddress]
-        sp.verify(self.data.safleIdToCoinAddress[safleId].contains(params._index))
+    @sp.onchain_view()
+    def resolveRegistrarName(self, params):
+        self.resolveRegistrarNameView(params)
 
-        self.data.safleIdToCoinAddress[safleId][params._index] = params._newAddress
-        self.data.coinAddressToSafleId[params._newAddress] = safleId
+    @sp.onchain_view()
+    def resolveSafleId(self, params):
+        self.resolveSafleIdView(params)
+
+    @sp.onchain_view()
+    def oldSafleIdsOf(self, params):
+        self.oldSafleIdsView(params)
+
+    @sp.onchain_view()
+    def oldRegistrarNamesOf(self, params):
+        self.oldRegistrarNamesView(params)
+
+    @sp.onchain_view()
+    def accountOf(self, params):
+        self.accountView(params)
 
     @sp.onchain_view()
     def coinAddressToId(self, params):
-        sp.result(self.data.coinAddressToSafleId[params._address])
+        self.coinAddressToIdView(params)
 
     @sp.onchain_view()
     def idToCoinAddress(self, params):
-        sp.result(self.data.safleIdToCoinAddress[params._safleId][params._index])
+        self.idToCoinAddressView(params)
+
+    @sp.onchain_view()
+    def resolveSafleIds(self, params):
+        self.resolveSafleIdsView(params)
+
+    @sp.onchain_view()
+    def coinAddressesToIds(self, params):
+        self.coinAddressesToIdsView(params)
+
+    @sp.onchain_view()
+    def idsToCoinAddresses(self, params):
+        self.idsToCoinAddressesView(params)
+
+    @sp.onchain_view()
+    def nameStatus(self, params):
+        self.nameStatusView(params)
+
+    @sp.onchain_view()
+    def nameStatuses(self, params):
+        self.nameStatusesView(params)
 
 sp.add_compilation_target("RegistrarStorage", RegistrarStorage(_ownerAddress=sp.address("tz1VVhDEgXSHNFcDmKpKeujvJ6dV7kcSqbAV"), _mainContractAddress=sp.address("KT1CgivcuoBSvub3JAPaVGQUGBLCXHhBhX9o")))
 
@@ -3,6 +3,7 @@ import smartpy as sp
 registrarMain = sp.io.import_stored_contract("RegistrarMain.py")
 registrarStorage = sp.io.import_stored_contract("RegistrarStorage.py")
 auctionContract = sp.io.import_stored_contract("Auction.py")
+registrarSingle = sp.io.import_stored_contract("RegistrarSingle.py")
 checkingContract = sp.io.import_stored_contract("CheckingContract.py")
 
 
@@ -16,6 +17,11 @@ def test():
     wallet = sp.test_account("wallet")
     newWallet = sp.test_account("newWallet")
     user = sp.test_account("user")
+    batchUser1 = sp.test_account("batchUser1")
+    batchUser2 = sp.test_account("batchUser2")
+    sweepUser1 = sp.test_account("sweepUser1")
+    sweepUser2 = sp.test_account("sweepUser2")
+    sweepUser3 = sp.test_account("sweepUser3")
 
     scenario.h2("RegistrarMain Contract")
     mainContract = registrarMain.RegistrarMain(
@@ -56,10 +62,35 @@ def test():
         sender=registrar, amount=sp.mutez(100000)
     )
 
+    scenario.h4("Rejecting SafleIDs with an invalid length or alphabet")
+    scenario += mainContract.registerSafleId(
+        _safleId="usr", _userAddress=user.address
+    ).run(sender=registrar, amount=sp.mutez(1000), valid=False)
+    scenario += mainContract.registerSafleId(
+        _safleId="user_rrr", _userAddress=user.address
+    ).run(sender=registrar, amount=sp.mutez(1000), valid=False)
+
     scenario.h4("Registering a new SafleID")
     scenario += mainContract.registerSafleId(
-        _safleId="userrrr", _userAddress=user.address
+        _safleId="UserRRR", _userAddress=user.address
     ).run(sender=registrar, amount=sp.mutez(1000))
+    scenario.verify(storageContract.data.accounts[user.address].safleId == "userrrr")
+
+    scenario.h4("Registering SafleIDs in a batch")
+    scenario += mainContract.registerSafleIds(_safleIds=[
+        sp.record(_userAddress=batchUser1.address, _safleId="BatchOne"),
+        sp.record(_userAddress=batchUser2.address, _safleId="batchtwo")
+    ]).run(sender=registrar, amount=sp.mutez(1000), valid=False)
+    scenario += mainContract.registerSafleIds(_safleIds=[
+        sp.record(_userAddress=batchUser1.address, _safleId="BatchOne"),
+        sp.record(_userAddress=batchUser2.address, _safleId="batchone")
+    ]).run(sender=registrar, amount=sp.mutez(2000), valid=False)
+    scenario += mainContract.registerSafleIds(_safleIds=[
+        sp.record(_userAddress=batchUser1.address, _safleId="BatchOne"),
+        sp.record(_userAddress=batchUser2.address, _safleId="batchtwo")
+    ]).run(sender=registrar, amount=sp.mutez(2000))
+    scenario.verify(storageContract.data.accounts[batchUser1.address].safleId == "batchone")
+    scenario.verify(storageContract.data.accounts[batchUser2.address].safleId == "batchtwo")
 
     scenario.h4("Updating the name of the SafleID")
     scenario += mainContract.updateSafleId(
@@ -71,6 +102,44 @@ def test():
         sender=owner
     )
 
+    scenario.h4("Fees stay in the contract until the owner withdraws them")
+    scenario.verify(mainContract.balance == sp.mutez(204000))
+    scenario.verify(mainContract.data.totalFeesCollected == sp.mutez(204000))
+    scenario += mainContract.withdrawFees().run(sender=registrar, valid=False)
+    scenario += mainContract.withdrawFees().run(sender=owner)
+    scenario.verify(mainContract.balance == sp.mutez(0))
+    scenario.verify(mainContract.data.totalFeesWithdrawn == sp.mutez(204000))
+    scenario += mainContract.withdrawFees().run(sender=owner, valid=False, exception="No fees to withdraw.")
+
+    scenario.h4("Fees are swept to the wallet once they reach the threshold")
+    scenario += mainContract.setFeeSweepThreshold(_amount=1500).run(sender=owner)
+    scenario += mainContract.registerSafleId(
+        _safleId="sweepone", _userAddress=sweepUser1.address
+    ).run(sender=registrar, amount=sp.mutez(1000))
+    scenario.verify(mainContract.balance == sp.mutez(1000))
+    scenario += mainContract.registerSafleId(
+        _safleId="sweeptwo", _userAddress=sweepUser2.address
+    ).run(sender=registrar, amount=sp.mutez(1000))
+    scenario.verify(mainContract.balance == sp.mutez(0))
+    scenario.verify(mainContract.data.totalFeesWithdrawn == sp.mutez(206000))
+    scenario += mainContract.setFeeSweepThreshold(_amount=0).run(sender=owner)
+
+    scenario.h4("Tez sent where no fee is due is withdrawn and counted apart from the fees")
+    scenario += mainContract.withdrawExcessBalance().run(sender=owner, valid=False, exception="No excess balance to withdraw.")
+    scenario += mainContract.toggleRegistrationStatus().run(sender=owner, amount=sp.mutez(300))
+    scenario += mainContract.toggleRegistrationStatus().run(sender=owner)
+    scenario += mainContract.registerSafleId(
+        _safleId="sweepthree", _userAddress=sweepUser3.address
+    ).run(sender=registrar, amount=sp.mutez(1000))
+    scenario += mainContract.withdrawFees().run(sender=owner)
+    scenario.verify(mainContract.balance == sp.mutez(300))
+    scenario.verify(mainContract.data.totalFeesWithdrawn == mainContract.data.totalFeesCollected)
+    scenario += mainContract.withdrawExcessBalance().run(sender=registrar, valid=False)
+    scenario += mainContract.withdrawExcessBalance().run(sender=owner)
+    scenario.verify(mainContract.balance == sp.mutez(0))
+    scenario.verify(mainContract.data.totalExcessWithdrawn == sp.mutez(300))
+    scenario.verify(mainContract.data.totalFeesWithdrawn == sp.mutez(207000))
+
     scenario.h4("Mapping a coin to a SafleID")
     scenario += mainContract.mapCoins(
         _blockchainName="Tezos", _aliasName="XTZ", _indexNumber=1
@@ -88,15 +157,91 @@ def test():
 
     scenario.h4("Fetching SafleID from coin address")
     scenario.show(storageContract.coinAddressToId(sp.record(_address="address")))
+    scenario.verify(storageContract.coinAddressToId(sp.record(_address="address")) == "user")
 
     scenario.h4("Fetching coin address from SafleID")
     scenario.show(storageContract.idToCoinAddress(sp.record(_safleId="user", _index=1)))
+    scenario.verify(storageContract.idToCoinAddress(sp.record(_safleId="user", _index=1)) == "address")
 
     scenario.h4("Fetching Address of a registrar")
     scenario.show(storageContract.resolveRegistrarName(sp.record(_name="registrar")))
+    scenario.verify(storageContract.resolveRegistrarName(sp.record(_name="registrar")) == registrar.address)
 
     scenario.h4("Fetching Address of a SafleID")
     scenario.show(storageContract.resolveSafleId(sp.record(_safleId="user")))
+    scenario.verify(storageContract.resolveSafleId(sp.record(_safleId="user")) == user.address)
+
+    scenario.h4("Checking whether names are free")
+    scenario.verify(storageContract.nameStatus(sp.record(_name="nobody")) == registrarStorage.NAME_FREE)
+    scenario.verify_equal(
+        storageContract.nameStatuses(sp.record(_names=["user", "registrar", "userrrr", "nobody"])),
+        {
+            "user": registrarStorage.NAME_SAFLE_ID,
+            "registrar": registrarStorage.NAME_REGISTRAR,
+            "userrrr": registrarStorage.NAME_RETIRED,
+            "nobody": registrarStorage.NAME_FREE
+        }
+    )
+
+    scenario.h4("Resolving many names in one call")
+    scenario.verify_equal(
+        storageContract.resolveSafleIds(sp.record(_safleIds=["user", "batchone", "nobody"])),
+        {"user": sp.some(user.address), "batchone": sp.some(batchUser1.address), "nobody": sp.none}
+    )
+    scenario.verify_equal(
+        storageContract.coinAddressesToIds(sp.record(_addresses=["address", "unknown"])),
+        {"address": sp.some("user"), "unknown": sp.none}
+    )
+    scenario.verify_equal(
+        storageContract.idsToCoinAddresses(sp.record(_coins=[
+            sp.record(_safleId="user", _index=1),
+            sp.record(_safleId="user", _index=7),
+            sp.record(_safleId="nobody", _index=1)
+        ])),
+        {("user", 1): sp.some("address"), ("user", 7): sp.none, ("nobody", 1): sp.none}
+    )
+
+    scenario.h4("Paging through previous names")
+    scenario.verify_equal(
+        storageContract.oldSafleIdsOf(sp.record(_userAddress=user.address, _offset=0, _limit=10)),
+        sp.record(total=1, names=["userrrr"])
+    )
+    scenario.verify_equal(
+        storageContract.oldRegistrarNamesOf(sp.record(_registrar=registrar.address, _offset=0, _limit=10)),
+        sp.record(total=1, names=["registrarer"])
+    )
+    scenario.verify_equal(
+        storageContract.oldSafleIdsOf(sp.record(_userAddress=user.address, _offset=1, _limit=10)),
+        sp.record(total=1, names=[])
+    )
+
+    scenario.h4("Registries are kept in big_maps")
+    scenario.verify(storageContract.data.accounts[user.address].isAddressTaken)
+    scenario.verify(storageContract.data.accounts[user.address].safleId == "user")
+    scenario.verify(storageContract.data.accounts[user.address].safleIdUpdates == 1)
+    scenario.verify(storageContract.data.accounts[registrar.address].isRegistrar)
+    scenario.verify(storageContract.accountOf(sp.record(_address=user.address)).oldSafleIdCount == 1)
+    scenario.verify(~storageContract.accountOf(sp.record(_address=batchUser1.address)).isRegistrar)
+    scenario.verify(storageContract.data.unavailableSafleIds.contains("userrrr"))
+    scenario.verify(~storageContract.data.resolveAddressFromSafleId.contains(sp.blake2b(sp.pack("userrrr"))))
+    scenario.verify(storageContract.data.resolveOldSafleID[sp.blake2b(sp.pack("userrrr"))] == user.address)
+
+    scenario.h4("Registering and updating several coin addresses at once")
+    scenario += mainContract.mapCoins(
+        _blockchainName="Ethereum", _aliasName="ETH", _indexNumber=2
+    ).run(sender=registrar)
+    scenario += mainContract.registerCoinAddresses(
+        _userAddress=user.address, _addresses={2: "xAbC"}
+    ).run(sender=registrar)
+    scenario += mainContract.registerCoinAddresses(
+        _userAddress=user.address, _addresses={3: "unmapped"}
+    ).run(sender=registrar, valid=False)
+    scenario += mainContract.updateCoinAddresses(
+        _userAddress=user.address, _addresses={1: "NewAddress", 2: "xDeF"}
+    ).run(sender=registrar)
+    scenario.verify(storageContract.idToCoinAddress(sp.record(_safleId="user", _index=1)) == "newaddress")
+    scenario.verify(storageContract.idToCoinAddress(sp.record(_safleId="user", _index=2)) == "xdef")
+    scenario.verify(storageContract.coinAddressToId(sp.record(_address="xdef")) == "user")
 
     scenario.h4("Updating to a new Main Contract")
     newMainContract = registrarMain.RegistrarMain(
@@ -107,6 +252,31 @@ def test():
         _mainContractAddress = newMainContract.address
     ).run(sender=owner)
 
+    scenario.h4("Migrating the registry into a new Storage Contract")
+    newStorageContract = registrarStorage.RegistrarStorage(
+        _ownerAddress=owner.address, _mainContractAddress=newMainContract.address
+    )
+    scenario += newStorageContract
+    chunk = dict((name, sp.list([])) for name in registrarStorage.registryBigMaps())
+    chunk.update(
+        accounts=sp.list([sp.pair(user.address, scenario.compute(storageContract.data.accounts[user.address]))]),
+        resolveAddressFromSafleId=sp.list([sp.pair(sp.blake2b(sp.pack("user")), user.address)]),
+        safleIdToCoinAddress=sp.list([sp.pair("user", scenario.compute(storageContract.data.safleIdToCoinAddress["user"]))])
+    )
+    scenario += newStorageContract.importRegistry(**chunk).run(sender=user, valid=False)
+    scenario += newStorageContract.importRegistry(**chunk).run(sender=owner)
+    scenario.verify(newStorageContract.resolveSafleId(sp.record(_safleId="user")) == user.address)
+    scenario.verify(newStorageContract.idToCoinAddress(sp.record(_safleId="user", _index=2)) == "xdef")
+    scenario.verify_equal(
+        newStorageContract.accountOf(sp.record(_address=user.address)),
+        storageContract.accountOf(sp.record(_address=user.address))
+    )
+    scenario += newStorageContract.sealImport(
+        _totalRegistrars=scenario.compute(storageContract.data.totalRegistrars),
+        _totalSafleIdRegistered=scenario.compute(storageContract.data.totalSafleIdRegistered)
+    ).run(sender=owner)
+    scenario += newStorageContract.importRegistry(**chunk).run(sender=owner, valid=False, exception="Import is sealed.")
+
 
 @sp.add_test(name="SafleID Auction")
 def test():
@@ -147,6 +317,14 @@ def test():
         _auctionAddress=auction.address
     ).run(sender=owner)
 
+    scenario.h4("Only the owner can point the Auction at another storage contract")
+    scenario += auction.upgradeStorageContractAddress(
+        _storageContractAddress=mainContract.address
+    ).run(sender=bidder1, valid=False)
+    scenario += auction.upgradeStorageContractAddress(
+        _storageContractAddress=storageContract.address
+    ).run(sender=owner)
+
     # Initial Setup
     mainContract.setSafleIdFees(_amount=1000).run(sender=owner)
     mainContract.setRegistrarFees(_amount=100000).run(sender=owner)
@@ -161,6 +339,7 @@ def test():
     scenario += auction.auctionSafleId(
         _safleId="oldsafleuser", _auctionSeconds=600
     ).run(sender=oldSafleUser)
+    scenario.verify(storageContract.nameStatus(sp.record(_name="oldsafleuser")) == registrarStorage.NAME_IN_AUCTION)
 
     scenario.h4("Bidding on the SafleID")
     scenario += auction.bidForSafleId(
@@ -176,8 +355,15 @@ def test():
         _safleId="oldsafleuser"
     ).run(sender=bidder1, amount=sp.mutez(1000))
 
-    scenario.h4("Refunding the bidders except the winner")
-    scenario += auction.refundOtherBidders().run(sender=oldSafleUser)
+    scenario.h4("Settling the auction")
+    scenario += auction.settleAuction().run(sender=oldSafleUser)
+
+    scenario.h4("Losing bidders withdraw their own bids")
+    scenario += auction.withdrawBid(_auctionId=0).run(sender=bidder2)
+    scenario += auction.withdrawBid(_auctionId=0).run(sender=bidder3)
+    scenario += auction.withdrawBid(_auctionId=0).run(sender=bidder2, valid=False)
+    scenario += auction.withdrawBid(_auctionId=0).run(sender=bidder1, valid=False)
+    scenario.verify(~auction.data.bidRate.contains(sp.pair(0, bidder2.address)))
 
     scenario.h4("Directly sending the safleID to the old user")
     scenario += auction.directlyTransferSafleId(
@@ -187,6 +373,147 @@ def test():
 
     scenario.h4("Getting the array of all the bidders")
     scenario.show(auction.arrayOfbidders(sp.record(_auctioner=oldSafleUser.address)))
+    scenario.verify_equal(
+        auction.arrayOfbidders(sp.record(_auctioner=oldSafleUser.address)),
+        [bidder1.address, bidder2.address, bidder3.address]
+    )
 
     scenario.h4("Getting the current bid rate of a bidder")
-    scenario.show(auction.getBidRate(sp.record(_auctioner=oldSafleUser.address, _bidder=bidder1.address)))
\ No newline at end of file
+    scenario.show(auction.getBidRate(sp.record(_auctioner=oldSafleUser.address, _bidder=bidder1.address)))
+    scenario.verify(auction.getBidRate(sp.record(_auctioner=oldSafleUser.address, _bidder=bidder1.address)) == sp.mutez(1100))
+    scenario.verify(auction.data.totalAuctions == 1)
+    scenario.verify(~auction.data.expiringAuctionCounts.contains(0))
+
+    scenario.h4("Indexing auctions by expiry bucket")
+    seller1 = sp.test_account("seller1")
+    seller2 = sp.test_account("seller2")
+    keeper = sp.test_account("keeper")
+    scenario += mainContract.registerSafleId(
+        _safleId="sellerone", _userAddress=seller1.address
+    ).run(sender=registrar, amount=sp.mutez(1000))
+    scenario += mainContract.registerSafleId(
+        _safleId="sellertwo", _userAddress=seller2.address
+    ).run(sender=registrar, amount=sp.mutez(1000))
+    scenario += auction.auctionSafleId(
+        _safleId="sellerone", _auctionSeconds=600
+    ).run(sender=seller1, now=sp.timestamp(7200))
+    scenario += auction.auctionSafleId(
+        _safleId="sellertwo", _auctionSeconds=1200
+    ).run(sender=seller2, now=sp.timestamp(7200))
+    scenario.verify(auction.expiringAuctionCount(sp.record(_bucket=2)) == 2)
+    scenario.verify(auction.data.expiringAuctions.contains(sp.pair(2, 1)))
+    scenario.verify(auction.data.expiringAuctions.contains(sp.pair(2, 2)))
+    scenario += auction.bidForSafleId(
+        _safleId="sellerone"
+    ).run(sender=bidder2, amount=sp.mutez(500), now=sp.timestamp(7300))
+
+    scenario.h4("Keepers settle the expired auctions of a bucket")
+    scenario += auction.settleExpiredAuctions(_auctionIds=list(range(0, auctionContract.MAX_SETTLE_BATCH + 1))).run(
+        sender=keeper, now=sp.timestamp(7800), valid=False, exception="Too many auctions to settle in one call."
+    )
+    scenario += auction.settleExpiredAuctions(_auctionIds=[1, 2]).run(
+        sender=keeper, now=sp.timestamp(7500), valid=False, exception="No expired auctions to settle."
+    )
+    scenario += auction.settleExpiredAuctions(_auctionIds=[1, 2, 7]).run(sender=keeper, now=sp.timestamp(7800))
+    scenario.verify(storageContract.data.accounts[bidder2.address].safleId == "sellerone")
+    scenario.verify(~auction.data.alreadyActiveAuction.contains(seller1.address))
+    scenario.verify(auction.expiringAuctionCount(sp.record(_bucket=2)) == 1)
+    scenario.verify(~auction.data.expiringAuctions.contains(sp.pair(2, 1)))
+
+    scenario.h4("Expired auctions without bids release the SafleID")
+    scenario += auction.settleExpiredAuctions(_auctionIds=[2]).run(sender=keeper, now=sp.timestamp(9000))
+    scenario.verify(~auction.data.expiringAuctions.contains(sp.pair(2, 2)))
+    scenario.verify(~auction.data.expiringAuctionCounts.contains(2))
+    scenario.verify(~auction.data.auction[2].isAuctionLive)
+    scenario.verify(~auction.data.alreadyActiveAuction.contains(seller2.address))
+    scenario.verify(~storageContract.data.accounts[seller2.address].inAuction)
+    scenario.verify(storageContract.nameStatus(sp.record(_name="sellertwo")) == registrarStorage.NAME_SAFLE_ID)
+    scenario.verify(storageContract.resolveSafleId(sp.record(_safleId="sellertwo")) == seller2.address)
+    scenario += auction.settleExpiredAuctions(_auctionIds=[1, 2]).run(
+        sender=keeper, now=sp.timestamp(9000), valid=False, exception="No expired auctions to settle."
+    )
+    scenario += auction.auctionSafleId(
+        _safleId="sellertwo", _auctionSeconds=600
+    ).run(sender=seller2, now=sp.timestamp(9000))
+
+
+@sp.add_test(name="SafleID Single Contract")
+def test():
+    scenario = sp.test_scenario()
+    scenario.h1("Safle Single Contract")
+
+    owner = sp.test_account("owner")
+    registrar = sp.test_account("registrar")
+    wallet = sp.test_account("wallet")
+    user = sp.test_account("user")
+    other = sp.test_account("other")
+    bidder = sp.test_account("bidder")
+
+    scenario.h2("RegistrarSingle Contract")
+    single = registrarSingle.RegistrarSingle(
+        _ownerAddress=owner.address, _walletAddress=wallet.address
+    )
+    scenario += single
+
+    scenario.h2("Auction Contract")
+    auction = auctionContract.Auction(
+        _ownerAddress=owner.address, _storageContract=single.address
+    )
+    scenario += auction
+    scenario += single.setAuctionContract(_auctionAddress=auction.address).run(sender=owner)
+
+    scenario.h4("Registering through the installed logic")
+    scenario += single.setSafleIdFees(_amount=1000).run(sender=owner)
+    scenario += single.registerRegistrar(_registrarName="Registrar").run(sender=registrar)
+    scenario += single.registerSafleId(
+        _safleId="UserName", _userAddress=user.address
+    ).run(sender=registrar, amount=sp.mutez(1000))
+    scenario += single.registerSafleId(
+        _safleId="username", _userAddress=other.address
+    ).run(sender=registrar, amount=sp.mutez(1000), valid=False)
+    scenario.verify(single.resolveSafleId(sp.record(_safleId="username")) == user.address)
+    scenario.verify(single.resolveRegistrarName(sp.record(_name="registrar")) == registrar.address)
+    scenario.verify(single.data.registry.accounts[user.address].safleId == "username")
+
+    scenario.h4("Updating names and coin addresses")
+    scenario += single.updateSafleId(
+        _newSafleId="newname", _userAddress=user.address
+    ).run(sender=registrar, amount=sp.mutez(1000))
+    scenario += single.mapCoins(
+        _blockchainName="Tezos", _aliasName="XTZ", _indexNumber=1
+    ).run(sender=registrar)
+    scenario += single.registerCoinAddress(
+        _address="tzADDR", _userAddress=user.address, _index=1
+    ).run(sender=registrar)
+    scenario.verify(single.coinAddressToId(sp.record(_address="tzaddr")) == "newname")
+    scenario.verify_equal(
+        single.oldSafleIdsOf(sp.record(_userAddress=user.address, _offset=0, _limit=10)),
+        sp.record(total=1, names=["username"])
+    )
+
+    scenario.h4("Only the owner can upgrade the logic")
+    def paused(arg):
+        sp.verify(False, "Registrations paused.")
+        sp.result(arg.registry)
+    pausedLogic = sp.build_lambda(paused, with_operations=True)
+    scenario += single.upgradeLogic(_name="registerSafleId", _logic=pausedLogic).run(sender=registrar, valid=False)
+    scenario += single.upgradeLogic(_name="registerSafleId", _logic=pausedLogic).run(sender=owner)
+    scenario += single.registerSafleId(
+        _safleId="another", _userAddress=other.address
+    ).run(sender=registrar, amount=sp.mutez(1000), valid=False, exception="Registrations paused.")
+    scenario += single.upgradeLogic(
+        _name="registerSafleId", _logic=registrarSingle.logicLambda("registerSafleId")
+    ).run(sender=owner)
+    scenario += single.registerSafleId(
+        _safleId="another", _userAddress=other.address
+    ).run(sender=registrar, amount=sp.mutez(1000))
+
+    scenario.h4("Auctions transfer SafleIDs held by the single contract")
+    scenario += auction.auctionSafleId(_safleId="newname", _auctionSeconds=600).run(sender=user)
+    scenario += single.updateSafleId(
+        _newSafleId="blocked", _userAddress=user.address
+    ).run(sender=registrar, amount=sp.mutez(1000), valid=False)
+    scenario += auction.bidForSafleId(_safleId="newname").run(sender=bidder, amount=sp.mutez(100))
+    scenario += auction.settleAuction().run(sender=user)
+    scenario.verify(single.resolveSafleId(sp.record(_safleId="newname")) == bidder.address)
+    scenario.verify(~single.data.registry.accounts[user.address].isAddressTaken)
@@ -1,41 +1,214 @@
+import * as fs from "fs";
+import * as path from "path";
 import * as dotenv from "dotenv";
-import { TezosToolkit } from "@taquito/taquito";
+import { OpKind, ParamsWithKind, TezosToolkit, TezosOperationError } from "@taquito/taquito";
 import { InMemorySigner } from "@taquito/signer";
+import { Schema } from "@taquito/michelson-encoder";
 
 dotenv.config(); /* This loads the variables in your .env file to process.env */
 
-const deploy = async () => {
-  //   const { TEZOS_RPC_URL, ORIGINATOR_PRIVATE_KEY } = process.env;
-
-  // const TEZOS_RPC_URL = "https://granadanet.api.tez.ie";
-  // const TEZOS_RPC_URL = "https://granadanet.smartpy.io/";
-  const TEZOS_RPC_URL = "https://hangzhounet.api.tez.ie";
-  // const TEZOS_RPC_URL = "https://granadanet.smartpy.io/";
-  const ORIGINATOR_PRIVATE_KEY =
-  "edskS1iD24NRtKU2D3mU4oiLXcLkbiXFDgtoePZWsN6AmDPKP1apXQXzMw4C81diawkbyNj9Q6qe9ow4frznq4HE5NbRsZwH4a"; //tz1TrhzPxJtyYX4sdh2Qg6kCkPCFvVXmQJXB
-    // "edskS8un6ip9hX8UW74Xhv1Mkd8JwtqFEyNL1exQf2MaFxPLUEcKGvXVV2oXsNu6ntThG399fkp1rDXNj5uqX9tAh9w4jpfADb"; //  tz1fMtL9YQekxj36AHWuDWtud5LosvtDunXk
-  console.log(TEZOS_RPC_URL, ORIGINATOR_PRIVATE_KEY);
-
-  const signer = await InMemorySigner.fromSecretKey(ORIGINATOR_PRIVATE_KEY);
-  const Tezos = new TezosToolkit(TEZOS_RPC_URL);
-  Tezos.setProvider({ signer: signer });
+/*
+ * Originates RegistrarMain, RegistrarStorage and Auction and wires them to
+ * each other, in two operation groups:
+ *
+ *   1. the three originations, in one batch;
+ *   2. every wiring call still missing, in one batch:
+ *      RegistrarMain.setStorageContract, RegistrarStorage.upgradeMainContractAddress,
+ *      RegistrarStorage.setAuctionContract and Auction.upgradeStorageContractAddress.
+ *
+ * One group is not possible: an originated address is derived from the hash
+ * of the signed group that creates it, so a call in the same group cannot
+ * name it, and the three contracts refer to each other.
+ *
+ * Environment (or .env):
+ *   TEZOS_RPC_URL           node to deploy to
+ *   ORIGINATOR_PRIVATE_KEY  key that originates and becomes the owner of the contracts
+ *   WALLET_ADDRESS          RegistrarMain wallet (default: the originator)
+ *   CONFIRMATIONS           blocks to wait for after each group (default: 1)
+ *   DEPLOY_RETRIES          attempts to inject each group (default: 3)
+ *
+ * With --sandbox the node and key default to a local flextesa sandbox
+ * (http://localhost:20000, alice). The addresses are kept in
+ * deployment/deployed-<chain id>.json; running again resumes from it,
+ * re-originating only if the recorded contracts do not exist on the chain
+ * and sending only the wiring calls that are still missing.
+ *
+ *   npm run deploy-contracts [-- --sandbox]
+ */
+
+const BUILD_DIR = path.join(__dirname, "..", "build");
+
+const SANDBOX_RPC_URL = "http://localhost:20000";
+const SANDBOX_PRIVATE_KEY = "edsk3QoqBuvdamxouPhin7swCvkQNgq4jP5KZPbwWNnwdZpSpJiEbq"; // flextesa alice
+
+const CONTRACTS = ["RegistrarMain", "RegistrarStorage", "Auction"];
+
+interface Config {
+  rpcUrl: string;
+  privateKey: string;
+  walletAddress?: string;
+  confirmations: number;
+  retries: number;
+}
+
+interface Deployment {
+  chainId: string;
+  rpcUrl: string;
+  owner: string;
+  contracts: { [name: string]: string };
+  originationHash?: string;
+  wiringHash?: string;
+}
+
+const config = (args: string[]): Config => {
+  const sandbox = args.includes("--sandbox");
+  const rpcUrl = process.env.TEZOS_RPC_URL || (sandbox ? SANDBOX_RPC_URL : undefined);
+  const privateKey = process.env.ORIGINATOR_PRIVATE_KEY || (sandbox ? SANDBOX_PRIVATE_KEY : undefined);
+  if (!rpcUrl || !privateKey) {
+    throw new Error("Set TEZOS_RPC_URL and ORIGINATOR_PRIVATE_KEY, or pass --sandbox");
+  }
+  return {
+    rpcUrl,
+    privateKey,
+    walletAddress: process.env.WALLET_ADDRESS,
+    confirmations: parseInt(process.env.CONFIRMATIONS || "1", 10),
+    retries: parseInt(process.env.DEPLOY_RETRIES || "3", 10)
+  };
+};
 
+const load = (file: string) => JSON.parse(fs.readFileSync(path.join(BUILD_DIR, file), "utf8"));
+
+/* The compiled script and initial storage from build/, with storage fields replaced by name. */
+const script = (name: string, fields: { [field: string]: string }) => {
+  const code = load(`${name}.json`);
+  const storageType = code.find((section: any) => section.prim === "storage").args[0];
+  const storage = new Schema(storageType).Execute(load(`${name}_storage.json`));
+  for (const field of Object.keys(fields)) {
+    if (!(field in storage)) {
+      throw new Error(`${name} has no storage field ${field}`);
+    }
+    storage[field] = fields[field];
+  }
+  return { code, storage };
+};
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/*
+ * Injects a batch, retrying on network and counter errors. A batch the node
+ * rejects in simulation (TezosOperationError) would fail again and is not retried.
+ */
+const sendBatch = async (Tezos: TezosToolkit, operations: ParamsWithKind[], retries: number) => {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await Tezos.contract.batch(operations).send();
+    } catch (error) {
+      if (error instanceof TezosOperationError || attempt >= retries) {
+        throw error;
+      }
+      console.log(`>> Attempt ${attempt} failed (${(error as Error).message}), retrying`);
+      await sleep(2000 * attempt);
+    }
+  }
+};
+
+const exists = async (Tezos: TezosToolkit, address: string) => {
   try {
-    // code: require("../build/RegistrarMain.json"),
-    // init: require("../build/RegistrarMain_storage.json")
-    const { hash, contractAddress } = await Tezos.contract.originate({
-      code: require("../build/RegistrarStorage.json"),
-      init: require("../build/RegistrarStorage_storage.json")
-    });
-
-    console.log("Successfully deployed contract");
-    console.log(`>> Transaction hash: ${hash}`);
-    console.log(`>> Contract address: ${contractAddress}`);
+    await Tezos.rpc.getContract(address);
+    return true;
   } catch (error) {
-    console.log("IN ERROR", error);
+    return false;
+  }
+};
+
+const originate = async (Tezos: TezosToolkit, cfg: Config, deployment: Deployment, save: () => void) => {
+  const owner = deployment.owner;
+  // The references between the contracts point at the owner until the wiring group.
+  const op = await sendBatch(Tezos, [
+    { kind: OpKind.ORIGINATION, ...script("RegistrarMain", { contractOwner: owner, walletAddress: cfg.walletAddress || owner }) },
+    { kind: OpKind.ORIGINATION, ...script("RegistrarStorage", { contractOwner: owner, mainContract: owner }) },
+    { kind: OpKind.ORIGINATION, ...script("Auction", { contractOwner: owner, storageContract: owner }) }
+  ], cfg.retries);
+  const addresses = op.getOriginatedContractAddresses();
+  CONTRACTS.forEach((name, i) => (deployment.contracts[name] = addresses[i]));
+  deployment.originationHash = op.hash;
+  delete deployment.wiringHash;
+  save();
+  console.log(`>> Origination hash: ${op.hash}`);
+  await op.confirmation(cfg.confirmations);
+};
+
+/* The wiring calls whose effect is not yet in the contracts' storage. */
+const missingWiring = async (Tezos: TezosToolkit, contracts: { [name: string]: string }): Promise<ParamsWithKind[]> => {
+  const { RegistrarMain, RegistrarStorage, Auction } = contracts;
+  const main: any = await (await Tezos.contract.at(RegistrarMain)).storage();
+  const storage: any = await (await Tezos.contract.at(RegistrarStorage)).storage();
+  const auction: any = await (await Tezos.contract.at(Auction)).storage();
+  const call = (to: string, entrypoint: string, address: string): ParamsWithKind => ({
+    kind: OpKind.TRANSACTION, to, amount: 0, parameter: { entrypoint, value: { string: address } }
+  });
+
+  const calls: ParamsWithKind[] = [];
+  if (!main.storageContractAddress || main.registrarStorageContractAddress !== RegistrarStorage) {
+    calls.push(call(RegistrarMain, "setStorageContract", RegistrarStorage));
+  }
+  if (storage.mainContract !== RegistrarMain) {
+    calls.push(call(RegistrarStorage, "upgradeMainContractAddress", RegistrarMain));
   }
+  if (storage.auctionContractAddress !== Auction) {
+    calls.push(call(RegistrarStorage, "setAuctionContract", Auction));
+  }
+  if (auction.storageContract !== RegistrarStorage) {
+    calls.push(call(Auction, "upgradeStorageContractAddress", RegistrarStorage));
+  }
+  return calls;
 };
 
-deploy();
+const deploy = async () => {
+  const cfg = config(process.argv.slice(2));
+  const signer = await InMemorySigner.fromSecretKey(cfg.privateKey);
+  const Tezos = new TezosToolkit(cfg.rpcUrl);
+  Tezos.setProvider({ signer: signer });
+
+  const chainId = await Tezos.rpc.getChainId();
+  const owner = await signer.publicKeyHash();
+  const recordPath = path.join(__dirname, `deployed-${chainId}.json`);
+  const deployment: Deployment = fs.existsSync(recordPath)
+    ? JSON.parse(fs.readFileSync(recordPath, "utf8"))
+    : { chainId, rpcUrl: cfg.rpcUrl, owner, contracts: {} };
+  const save = () => fs.writeFileSync(recordPath, JSON.stringify(deployment, null, 2) + "\n");
+  console.log(`${cfg.rpcUrl} (${chainId}), owner ${owner}`);
+
+  if (deployment.owner !== owner) {
+    throw new Error(`${recordPath} was deployed by ${deployment.owner}, not ${owner}`);
+  }
+
+  const deployed = await Promise.all(CONTRACTS.map((name) => deployment.contracts[name] && exists(Tezos, deployment.contracts[name])));
+  if (deployed.every(Boolean)) {
+    console.log(">> Contracts already originated");
+  } else {
+    await originate(Tezos, cfg, deployment, save);
+  }
+
+  const calls = await missingWiring(Tezos, deployment.contracts);
+  if (calls.length > 0) {
+    const op = await sendBatch(Tezos, calls, cfg.retries);
+    deployment.wiringHash = op.hash;
+    save();
+    console.log(`>> Wiring hash: ${op.hash}`);
+    await op.confirmation(cfg.confirmations);
+  }
+  if ((await missingWiring(Tezos, deployment.contracts)).length > 0) {
+    throw new Error("The contracts are not wired to each other");
+  }
+
+  console.log("Successfully deployed contracts");
+  for (const name of CONTRACTS) {
+    console.log(`>> ${name}: ${deployment.contracts[name]}`);
+  }
+};
 
-// olive permit virtual that pretty rescue focus carbon judge sing brick merge license cupboard slim
\ No newline at end of file
+deploy().catch((error) => {
+  console.log("IN ERROR", error);
+  process.exit(1);
+});
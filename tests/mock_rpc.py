@@ -0,0 +1,181 @@
+"""A local HTTP server answering the few node RPCs the tools use.
+
+Views are answered from plain dicts and blocks are appended by the test,
+so the resolver and the indexer can be exercised without a node.
+"""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from tools import michelson, migrate
+
+CHAIN_ID = "NetXdQprcVkpaWU"
+
+
+def record_type(**fields):
+    """Right-comb pair type with one annotated field per keyword, in order.
+
+    A field is a prim name or a whole type node.
+    """
+    args = [dict(prim if isinstance(prim, dict) else {"prim": prim}, annots=["%" + name]) for name, prim in fields.items()]
+    node = args[-1]
+    for arg in reversed(args[:-1]):
+        node = {"prim": "pair", "args": [arg, node]}
+    return node
+
+
+def entries_type(key, value):
+    return {"prim": "list", "args": [{"prim": "pair", "args": [key, value]}]}
+
+
+def ty(name, *args):
+    return {"prim": name, "args": list(args)} if args else {"prim": name}
+
+
+OLD_NAMES = entries_type(ty("pair", ty("address"), ty("nat")), ty("bytes"))
+
+EVENT_TYPES = {
+    "registerSafleId": record_type(safleId="string", user="address"),
+    "updateSafleId": record_type(newSafleId="string", oldSafleId="string", user="address"),
+    "transferSafleId": record_type(newOwner="address", oldOwner="address", safleId="string"),
+    "registerCoinAddress": record_type(address="string", index="nat", safleId="string"),
+    "updateCoinAddress": record_type(address="string", index="nat", safleId="string"),
+    "registerRegistrar": record_type(name="string", registrar="address"),
+    "updateRegistrar": record_type(newName="string", oldName="string", registrar="address"),
+    "mapCoin": record_type(aliasName="string", coinName="string", index="nat"),
+    "auctionSafleId": record_type(auctionId="nat", auctionLastFor="timestamp", conductor="address", safleId="string"),
+    "bidForSafleId": record_type(auctionId="nat", bid="mutez", bidder="address"),
+    "settleAuction": record_type(auctionId="nat", bid="mutez", winner="address"),
+    "withdrawBid": record_type(amount="mutez", auctionId="nat", bidder="address"),
+    "importRegistry": record_type(
+        OtherCoin=entries_type(ty("nat"), record_type(aliasName="string", coinName="string", isIndexMapped="bool")),
+        accounts=entries_type(ty("address"), record_type(
+            inAuction="bool", isAddressTaken="bool", isRegistrar="bool", oldSafleIdCount="nat",
+            registrarName="string", registrarUpdates="nat", safleId="string", safleIdUpdates="nat"
+        )),
+        coinAddressToSafleId=entries_type(ty("string"), ty("string")),
+        isCoinMapped=entries_type(ty("string"), ty("bool")),
+        registrarNameToAddress=entries_type(ty("bytes"), ty("address")),
+        resolveAddressFromSafleId=entries_type(ty("bytes"), ty("address")),
+        resolveOldRegistrarAddress=OLD_NAMES,
+        resolveOldSafleID=entries_type(ty("bytes"), ty("address")),
+        resolveOldSafleIdFromAddress=OLD_NAMES,
+        safleIdToCoinAddress=entries_type(ty("string"), ty("map", ty("nat"), ty("string"))),
+        unavailableSafleIds=entries_type(ty("string"), ty("bool")),
+    ),
+}
+
+
+def event(contract, tag, status="applied", **payload):
+    """An internal event result as found in block metadata."""
+    ty = EVENT_TYPES[tag]
+    return {
+        "kind": "event",
+        "source": contract,
+        "type": ty,
+        "tag": tag,
+        "payload": michelson.encode(ty, payload),
+        "result": {"status": status},
+    }
+
+
+def import_event(contract, **entries):
+    """An importRegistry event; big_maps not given have no entries in the chunk."""
+    chunk = dict((name, entries.get(name, [])) for name in migrate.record_fields(EVENT_TYPES["importRegistry"]))
+    return event(contract, "importRegistry", **chunk)
+
+
+class MockNode(object):
+    def __init__(self):
+        self.views = {}
+        self.blocks = [{"header": {"level": 0, "hash": "B0"}, "operations": []}]
+        self.view_calls = []
+        self.scripts = {}
+        self.big_maps = {}
+        self.server = HTTPServer(("127.0.0.1", 0), self.handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def endpoint(self):
+        return "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def set_view(self, view, argument, result):
+        """Answer ``view(argument)`` with ``result``; ``None`` makes it fail."""
+        self.views[(view, json.dumps(argument, sort_keys=True))] = result
+
+    def bake(self, *events, **header):
+        """Append a block containing ``events``; return its level."""
+        level = len(self.blocks)
+        contents = [{"kind": "transaction", "metadata": {"internal_operation_results": list(events)}}]
+        self.blocks.append({
+            "header": dict({"level": level, "hash": "B%d" % level, "predecessor": self.blocks[-1]["header"]["hash"]}, **header),
+            "operations": [[], [], [], [{"contents": contents}]],
+        })
+        return level
+
+    def block(self, ref):
+        if ref == "head":
+            return self.blocks[-1]
+        for block in self.blocks:
+            if str(block["header"]["level"]) == ref or block["header"]["hash"] == ref:
+                return block
+        return None
+
+    def handler(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.endswith("/chain_id"):
+                    return self.reply(200, CHAIN_ID)
+                match = re.match(r"^/chains/main/blocks/head/context/(contracts/(\w+)/script|big_maps/(\d+)(/(\w+)|\?offset=(\d+)&length=(\d+)))$", self.path)
+                if match and match.group(2):
+                    script = node.scripts.get(match.group(2))
+                    return self.reply(200, script) if script else self.reply(404, [])
+                if match:
+                    big_map = node.big_maps.get(int(match.group(3)), {})
+                    if match.group(5):
+                        value = big_map.get(match.group(5))
+                        return self.reply(200, value) if value is not None else self.reply(404, [])
+                    offset, length = int(match.group(6)), int(match.group(7))
+                    return self.reply(200, list(big_map.values())[offset:offset + length])
+                match = re.match(r"^/chains/main/blocks/([^/]+)(/header)?$", self.path)
+                block = match and node.block(match.group(1))
+                if block is None:
+                    return self.reply(404, [{"kind": "temporary", "id": "not_found"}])
+                return self.reply(200, block["header"] if match.group(2) else block)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode())
+                if not self.path.endswith("/helpers/scripts/run_script_view"):
+                    return self.reply(404, [])
+                key = (body["view"], json.dumps(body["input"], sort_keys=True))
+                node.view_calls.append(key)
+                result = node.views.get(key)
+                if result is None:
+                    return self.reply(500, [{"kind": "temporary", "id": "proto.michelson_v1.script_rejected",
+                                             "with": {"string": "Resolver : User is not yet registered for this SafleID."}}])
+                return self.reply(200, {"data": {"string": result}})
+
+        return Handler
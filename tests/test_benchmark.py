@@ -0,0 +1,86 @@
+from tools import benchmark
+from tools.octez import parse_receipt
+
+RECEIPT = """
+Estimated gas: 5000 units (will add 100 for safety)
+Operation receipts:
+  Manager signed operations:
+    From: tz1VVhDEgXSHNFcDmKpKeujvJ6dV7kcSqbAV
+    Gas limit: 5100
+    Transaction:
+      Amount: ꜩ0
+      From: tz1VVhDEgXSHNFcDmKpKeujvJ6dV7kcSqbAV
+      To: KT1Main
+      Entrypoint: registerSafleId
+      This transaction was successfully applied
+      Storage size: 2000 bytes
+      Consumed gas: 3000.5
+      Internal operations:
+        Internal Transaction:
+          Amount: ꜩ0
+          From: KT1Main
+          To: KT1Storage
+          Entrypoint: registerSafleId
+          This transaction was successfully applied
+          Storage size: 9000 bytes
+          Paid storage size diff: 120 bytes
+          Consumed gas: 4000.25
+"""
+
+
+def test_parse_receipt_splits_internal_transactions():
+    main, storage = parse_receipt(RECEIPT)
+    assert (main.destination, main.entrypoint, main.consumed_gas, main.storage_size) == ("KT1Main", "registerSafleId", 3000.5, 2000)
+    assert (storage.destination, storage.consumed_gas, storage.storage_size, storage.paid_storage_diff) == ("KT1Storage", 4000.25, 9000, 120)
+
+
+def test_tez_formats_mutez():
+    assert benchmark.tez(0) == "0.000000"
+    assert benchmark.tez(1) == "0.000001"
+    assert benchmark.tez(2500000) == "2.500000"
+
+
+def test_letters_spells_numbers_in_a_to_z():
+    assert benchmark.letters(0) == "aaaaaaaa"
+    assert benchmark.letters(27, width=3) == "abb"
+    assert len(set(benchmark.letters(i) for i in range(1000))) == 1000
+
+
+def report(**gas_by_name):
+    return {"results": dict(
+        (name, dict((str(size), {"gas": gas}) for size, gas in sizes.items()))
+        for name, sizes in gas_by_name.items()
+    )}
+
+
+def test_check_flags_growth_over_budget():
+    budgets = {"default": {"max_growth": 1.1}, "entries": {"A.view": {"max_growth": None}}}
+    violations = benchmark.check(report(**{
+        "A.flat": {10: 1000, 10000: 1050},
+        "A.grows": {10: 1000, 10000: 2000},
+        "A.view": {10: 1000, 10000: 9000},
+    }), budgets)
+    assert len(violations) == 1 and violations[0].startswith("A.grows")
+
+
+def test_check_flags_regression_against_baseline():
+    budgets = {"default": {"max_regression": 0.05}}
+    old = report(**{"A.ep": {10: 1000}})
+    assert benchmark.check(report(**{"A.ep": {10: 1040}}), budgets, old) == []
+    assert len(benchmark.check(report(**{"A.ep": {10: 1100}}), budgets, old)) == 1
+
+
+def test_compare_rows():
+    rows = benchmark.compare(report(**{"A.ep": {10: 1000}}), report(**{"A.ep": {10: 500}, "A.new": {10: 1}}))
+    assert ("A.ep", "10", 1000, 500, 0.5) in rows
+    assert ("A.new", "10", None, 1, None) in rows
+    assert "A.ep" in benchmark.format_compare(rows)
+
+
+def test_revisions_writes_both_reports(tmp_path, monkeypatch, capsys):
+    def run_revisions(old, new, sizes, endpoint=None):
+        return (dict(report(**{"A.ep": {10: 1000}}), revision=old), dict(report(**{"A.ep": {10: 800}}), revision=new))
+    monkeypatch.setattr(benchmark, "run_revisions", run_revisions)
+    assert benchmark.main(["revisions", "HEAD~1", "HEAD", "--sizes", "10", "--output-dir", str(tmp_path)]) == 0
+    assert (tmp_path / "benchmark_old.json").exists() and (tmp_path / "benchmark_new.json").exists()
+    assert "0.80" in capsys.readouterr().out
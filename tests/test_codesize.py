@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from tools import codesize
+from tools.michelson import MichelsonError
+
+
+def test_encode_matches_pack():
+    # PACK (Pair 1 "a") = 0x05 07 07 0001 01 00000001 61
+    assert codesize.encode({"prim": "Pair", "args": [{"int": "1"}, {"string": "a"}]}).hex() == "0707000101000000016" + "1"
+    assert codesize.encode({"int": "1000"}).hex() == "00a80f"
+    assert codesize.encode({"int": "-64"}).hex() == "00c001"
+    assert codesize.encode({"bytes": "beef"}).hex() == "0a00000002beef"
+
+
+def test_encode_annotations_sequences_and_long_primitives():
+    assert codesize.encode({"prim": "nat", "annots": ["%x"]}).hex() == "046200000002" + "2578"
+    assert codesize.encode([{"prim": "DROP"}, {"prim": "UNIT"}]).hex() == "0200000004" + "0320" + "034f"
+    view = {"prim": "view", "args": [{"string": "v"}, {"prim": "unit"}, {"prim": "nat"}, []]}
+    assert codesize.encode(view).hex() == "0991" + "0000000f" + "010000000176" + "036c" + "0362" + "0200000000" + "00000000"
+
+
+def test_contract_size_reports_sections_and_storage(tmp_path):
+    script = [
+        {"prim": "parameter", "args": [{"prim": "unit"}]},
+        {"prim": "storage", "args": [{"prim": "nat"}]},
+        {"prim": "code", "args": [[{"prim": "CDR"}, {"prim": "NIL", "args": [{"prim": "operation"}]}, {"prim": "PAIR"}]]},
+        {"prim": "view", "args": [{"string": "get"}, {"prim": "unit"}, {"prim": "nat"}, [{"prim": "CDR"}]]},
+    ]
+    (tmp_path / "C.json").write_text(json.dumps(script))
+    (tmp_path / "C_storage.json").write_text(json.dumps({"int": "5"}))
+    size = codesize.contract_size("C", str(tmp_path))
+    assert size["storage"] == 2
+    assert sorted(size["sections"]) == ["code", "parameter", "storage", "view get"]
+    assert size["script"] == 5 + sum(size["sections"].values())
+    assert codesize.built_contracts(str(tmp_path)) == ["C"]
+
+
+def test_uncompiled_nodes_are_rejected():
+    with pytest.raises(MichelsonError):
+        codesize.encode({"prim": "ERROR", "args": [{"string": "Cannot compile missing type"}]})
@@ -0,0 +1,106 @@
+import json
+
+from tools import costprofile, michelson
+
+PARAMETER = {"prim": "or", "args": [
+    {"prim": "nat", "annots": ["%add"]},
+    {"prim": "unit", "annots": ["%scan"]},
+]}
+STORAGE = {"prim": "pair", "args": [
+    {"prim": "nat", "annots": ["%total"]},
+    {"prim": "map", "args": [{"prim": "nat"}, {"prim": "string"}], "annots": ["%items"]},
+]}
+ADD = [{"prim": "SWAP"}, {"prim": "UNPAIR"}, {"prim": "DIG", "args": [{"int": "2"}]}, {"prim": "ADD"}, {"prim": "PAIR"}]
+SCAN = [{"prim": "DROP"}, {"prim": "DUP"}, {"prim": "CDR"}, {"prim": "ITER", "args": [[{"prim": "DROP"}]]}]
+CODE = [
+    {"prim": "UNPAIR"},
+    {"prim": "IF_LEFT", "args": [ADD, SCAN]},
+    {"prim": "NIL", "args": [{"prim": "operation"}]},
+    {"prim": "PAIR"},
+]
+VIEW = {"prim": "view", "args": [{"string": "total"}, {"prim": "unit"}, {"prim": "nat"}, [{"prim": "CDR"}, {"prim": "CAR"}]]}
+
+
+def write_contract(build_dir, name, code=CODE):
+    script = [
+        {"prim": "parameter", "args": [PARAMETER]},
+        {"prim": "storage", "args": [STORAGE]},
+        {"prim": "code", "args": [code]},
+        VIEW,
+    ]
+    (build_dir / ("%s.json" % name)).write_text(json.dumps(script))
+    (build_dir / ("%s_storage.json" % name)).write_text(json.dumps({"prim": "Pair", "args": [{"int": "0"}, []]}))
+
+
+def test_entry_points_storage_fields_and_loops(tmp_path):
+    write_contract(tmp_path, "C")
+    profile = costprofile.contract_profile("C", str(tmp_path))
+    assert sorted(profile) == ["dispatch", "entrypoint add", "entrypoint scan", "view total"]
+    assert profile["entrypoint add"]["instructions"] == len(ADD)
+    assert (profile["entrypoint add"]["reads"], profile["entrypoint add"]["writes"]) == ([], ["total"])
+    assert profile["entrypoint scan"]["loops"] == [{"kind": "ITER", "over": "storage items", "depth": 1}]
+    assert profile["entrypoint scan"]["hot_spots"] == ["ITER over storage items"]
+    assert profile["entrypoint scan"]["writes"] == []
+    assert profile["view total"]["reads"] == ["total"]
+    assert profile["dispatch"]["instructions"] == 4
+
+
+def test_lambdas_are_named_by_their_strings():
+    def body(*strings):
+        return [{"prim": "PUSH", "args": [{"prim": "string"}, {"string": s}]} for s in strings] + [{"prim": "FAILWITH"}]
+
+    length = "SafleId length should be greater than 3 characters"
+    alphanumeric = "Only alphanumeric allowed in blockchain name and alias name"
+    assert costprofile.lambda_name({"prim": "string"}, body(length, alphanumeric)) == "normalizeSafleId"
+    assert costprofile.lambda_name({"prim": "unit"}, body(length, alphanumeric)) == "isSafleIdValid"
+    assert costprofile.lambda_name({"prim": "unit"}, body(alphanumeric)) == "checkAlphaNumeric"
+    assert costprofile.lambda_name({"prim": "string"}, body("A", "a", "Z", "z")) == "toLower"
+    assert costprofile.lambda_name({"prim": "unit"}, body("other")).startswith("lambda_")
+
+
+def test_built_registrar_main():
+    profile = costprofile.contract_profile("RegistrarMain")
+    parameter = michelson.load_contract("RegistrarMain")["parameter"]
+    assert sorted(key[len("entrypoint "):] for key in profile if key.startswith("entrypoint ")) == sorted(michelson.entrypoints(parameter))
+    assert sorted(key for key in profile if key.startswith("lambda ")) == [
+        "lambda checkAlphaNumeric", "lambda isContract", "lambda isSafleIdValid", "lambda toLower"
+    ]
+    to_lower = profile["lambda toLower"]
+    assert to_lower["loops"][0] == {"kind": "LOOP", "over": "input", "depth": 1}
+    assert any(spot.startswith("pushes a") for spot in to_lower["hot_spots"])
+    assert profile["entrypoint registerSafleId"]["calls"] == {"toLower": 1}
+    assert (profile["entrypoint setSafleIdFees"]["reads"], profile["entrypoint setSafleIdFees"]["writes"]) == (["contractOwner"], ["safleIdFees"])
+
+
+def test_built_registrar_storage():
+    profile = costprofile.contract_profile("RegistrarStorage")
+    assert profile["entrypoint registerSafleId"]["writes"] == [
+        "isAddressTaken", "resolveAddressFromSafleId", "resolveUserAddress", "totalSafleIdRegistered"
+    ]
+    assert profile["view resolveSafleId"]["reads"] == ["resolveAddressFromSafleId"]
+    assert profile["view resolveSafleId"]["writes"] == []
+
+
+def test_check_fails_on_growth_and_new_hot_spots(tmp_path, capsys):
+    report = str(tmp_path / "costprofile.json")
+    write_contract(tmp_path, "C")
+    assert costprofile.main(["C", "--build-dir", str(tmp_path), "--report", report, "--check"]) == 0
+
+    grown = [CODE[0], {"prim": "IF_LEFT", "args": [ADD + [{"prim": "DUP"}, {"prim": "DROP"}], SCAN]}] + CODE[2:]
+    write_contract(tmp_path, "C", grown)
+    assert costprofile.main(["C", "--build-dir", str(tmp_path), "--report", report, "--tolerance", "50"]) == 0
+    assert costprofile.main(["C", "--build-dir", str(tmp_path), "--report", report, "--check"]) == 0
+    output = capsys.readouterr().out
+    assert "entrypoint add" in output and "7 (+2)" in output
+
+    write_contract(tmp_path, "C")
+    with open(report) as f:
+        previous = json.load(f)
+    previous["C"]["entrypoint scan"]["hot_spots"] = []
+    previous["C"]["entrypoint add"]["instructions"] = 2
+    with open(report, "w") as f:
+        json.dump(previous, f)
+    assert costprofile.main(["C", "--build-dir", str(tmp_path), "--report", report, "--check"]) == 1
+    output = capsys.readouterr().out
+    assert "regression: C entrypoint add: 5 instructions, 2 before" in output
+    assert "regression: C entrypoint scan: new hot spot: ITER over storage items" in output
@@ -0,0 +1,202 @@
+import json
+import os
+
+import pytest
+
+from tests.mock_rpc import MockNode, event, import_event
+from tools.indexer import KEYS, Indexer, IndexerError, unpacked_string
+from tools.resolver import NotRegistered
+from tools.rpc import RpcClient
+
+with open(os.path.join(os.path.dirname(__file__), "fixtures", "indexer_blocks.json")) as f:
+    FIXTURE = json.load(f)
+
+STORAGE = FIXTURE["storage"]
+AUCTION = FIXTURE["auction"]
+ACCOUNTS = FIXTURE["accounts"]
+
+
+@pytest.fixture
+def node():
+    node = MockNode().start()
+    node.blocks = json.loads(json.dumps(FIXTURE["blocks"]))
+    yield node
+    node.stop()
+
+
+def indexer_for(node, **kwargs):
+    return Indexer(RpcClient(node.endpoint), STORAGE, AUCTION, **kwargs)
+
+
+def rebuilt(node):
+    """Tables of an indexer that followed the node's current chain from the start."""
+    indexer = indexer_for(node)
+    indexer.sync()
+    return tables(indexer)
+
+
+def tables(indexer):
+    return dict(
+        (table, [dict(row) for row in indexer.db.execute("SELECT * FROM %s ORDER BY %s" % (table, ", ".join(key)))])
+        for table, key in KEYS.items()
+    )
+
+
+def test_registry_follows_the_recorded_blocks(node):
+    indexer = indexer_for(node)
+    assert indexer.sync() == 6
+
+    assert indexer.resolve_safle_id("alice") == ACCOUNTS["alice"]
+    assert indexer.resolve_safle_id("alicia") == ACCOUNTS["erin"]
+    assert indexer.resolve_safle_id("bobby") == ACCOUNTS["carol"]
+    for name in ("bob", "alina", "alison"):
+        with pytest.raises(NotRegistered):
+            indexer.resolve_safle_id(name)
+    assert indexer.resolve_registrar_name("saflewallet") == ACCOUNTS["registrar"]
+    with pytest.raises(NotRegistered):
+        indexer.resolve_registrar_name("safle")
+
+    assert indexer.id_to_coin_address("alice", 1) == "0xdef"
+    assert indexer.coin_address_to_id("0xdef") == "alice"
+    assert indexer.coin_address_to_id("0xabc") == "alice"
+    assert indexer.safle_ids_of(ACCOUNTS["erin"]) == ["alicia"]
+    assert indexer.safle_ids_of(ACCOUNTS["bob"]) == []
+    assert indexer.old_names(ACCOUNTS["bob"]) == ["alicia"]
+    assert indexer.old_names(ACCOUNTS["carol"]) == ["bob"]
+    assert indexer.old_names(ACCOUNTS["registrar"], kind="registrar") == ["safle"]
+
+
+def test_prefix_search_in_name_order(node):
+    indexer = indexer_for(node)
+    indexer.sync()
+    assert indexer.search("ali") == ["alice", "alicia"]
+    assert indexer.search("ALI", limit=1) == ["alice"]
+    assert indexer.search("b") == ["bobby"]
+    assert indexer.search("") == ["alice", "alicia", "bobby"]
+    assert indexer.search("c") == []
+    assert indexer.search("safle", registrars=True) == ["saflewallet"]
+
+
+def test_auctions_keep_outstanding_bids(node):
+    indexer = indexer_for(node)
+    indexer.sync(max_blocks=6)
+    auction = indexer.auction(0)
+    assert auction["safle_id"] == "alicia" and auction["conductor"] == ACCOUNTS["bob"]
+    assert auction["ends"] == 1685620800
+    assert (auction["highest_bidder"], auction["highest_bid"], auction["settled"]) == (ACCOUNTS["erin"], 150, True)
+    assert auction["bids"] == {ACCOUNTS["erin"]: 150, ACCOUNTS["dave"]: 100}
+    indexer.sync()
+    assert indexer.auction(0)["bids"] == {ACCOUNTS["erin"]: 150}
+    assert indexer.auctions_of("alicia") == [0]
+    assert indexer.expired_auctions(1685620800) == []
+    with pytest.raises(NotRegistered):
+        indexer.auction(1)
+
+
+def test_resumes_from_the_checkpoint(node, tmp_path):
+    path = str(tmp_path / "registry.sqlite")
+    indexer = indexer_for(node, path=path)
+    assert indexer.sync(max_blocks=3) == 2
+    indexer.close()
+
+    indexer = indexer_for(node, path=path)
+    assert indexer.level == 2
+    assert indexer.sync() == 6
+    assert tables(indexer) == rebuilt(node)
+    indexer.close()
+
+    with pytest.raises(IndexerError):
+        Indexer(RpcClient(node.endpoint), AUCTION, STORAGE, path=path)
+
+
+def test_reorganisation_is_rolled_back_to_the_fork(node):
+    indexer = indexer_for(node)
+    indexer.sync()
+
+    # The chain switches to a branch forking after block 4: the auction is never settled.
+    del node.blocks[5:]
+    node.bake(hash="B5'")
+    node.bake(event(STORAGE, "registerSafleId", user=ACCOUNTS["dave"], safleId="alfred"), hash="B6'")
+    node.bake(hash="B7'")
+    assert indexer.sync() == 7
+    assert indexer.block_hash(5) == "B5'"
+    assert indexer.resolve_safle_id("alicia") == ACCOUNTS["bob"]
+    assert indexer.auction(0)["settled"] is False
+    assert indexer.expired_auctions(1685620799) == []
+    assert indexer.expired_auctions(1685620800) == [0]
+    assert indexer.expired_auctions(1685620800, limit=0) == []
+    assert indexer.search("al") == ["alfred", "alice", "alicia"]
+    assert tables(indexer) == rebuilt(node)
+
+
+def test_head_replaced_at_the_same_level_or_lower(node):
+    indexer = indexer_for(node)
+    indexer.sync()
+
+    node.blocks[6] = dict(node.blocks[6], header=dict(node.blocks[6]["header"], hash="B6'"), operations=[])
+    assert indexer.sync() == 6
+    assert indexer.id_to_coin_address("alice", 1) == "0xabc"
+
+    del node.blocks[5:]
+    assert indexer.sync() == 4
+    assert tables(indexer) == rebuilt(node)
+
+
+def test_reorganisations_deeper_than_the_journal_are_refused(node):
+    indexer = indexer_for(node, keep_blocks=2)
+    indexer.sync()
+    assert indexer.block_hash(4) is None
+
+    del node.blocks[4:]
+    node.bake(hash="B4'")
+    node.bake(hash="B5'")
+    node.bake(hash="B6'")
+    with pytest.raises(IndexerError):
+        indexer.sync()
+
+
+def account(**fields):
+    record = dict(
+        inAuction=False, isAddressTaken=False, isRegistrar=False, oldSafleIdCount=0,
+        registrarName="", registrarUpdates=0, safleId="", safleIdUpdates=0
+    )
+    record.update(fields)
+    return record
+
+
+def packed(name):
+    data = name.encode("utf-8")
+    return (b"\x05\x01" + len(data).to_bytes(4, "big") + data).hex()
+
+
+def test_bulk_imports_are_indexed_from_the_chunk(node):
+    indexer = indexer_for(node)
+    indexer.sync()
+    node.bake(import_event(
+        STORAGE,
+        accounts=[
+            (ACCOUNTS["dave"], account(isAddressTaken=True, safleId="zelda", oldSafleIdCount=1)),
+            (ACCOUNTS["carol"], account(isRegistrar=True, registrarName="zregistrar", registrarUpdates=1)),
+        ],
+        resolveOldSafleIdFromAddress=[((ACCOUNTS["dave"], 0), packed("zed"))],
+        resolveOldRegistrarAddress=[((ACCOUNTS["carol"], 0), packed("zreg"))],
+        OtherCoin=[(7, dict(aliasName="zc", coinName="zcoin", isIndexMapped=True))],
+        safleIdToCoinAddress=[("zelda", {7: "zaddr"})],
+        coinAddressToSafleId=[("zaddr", "zelda"), ("zold", "zelda")],
+    ), hash="B7")
+    assert indexer.sync() == 7
+
+    assert indexer.search("z") == ["zelda"]
+    assert indexer.resolve_safle_id("zelda") == ACCOUNTS["dave"]
+    assert indexer.resolve_registrar_name("zregistrar") == ACCOUNTS["carol"]
+    assert indexer.old_names(ACCOUNTS["dave"]) == ["zed"]
+    assert indexer.old_names(ACCOUNTS["carol"], kind="registrar") == ["zreg"]
+    assert indexer.id_to_coin_address("zelda", 7) == "zaddr"
+    assert indexer.coin_address_to_id("zold") == "zelda"
+
+    del node.blocks[7:]
+    node.bake(hash="B7'")
+    assert indexer.sync() == 7
+    assert tables(indexer) == rebuilt(node)
+    with pytest.raises(IndexerError):
+        unpacked_string("050000")
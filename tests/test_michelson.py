@@ -0,0 +1,76 @@
+from tools import michelson
+
+
+def t(prim, *args, annot=None):
+    node = {"prim": prim}
+    if args:
+        node["args"] = list(args)
+    if annot:
+        node["annots"] = ["%" + annot]
+    return node
+
+
+RECORD = t("pair", t("string", annot="_safleId"), t("pair", t("address", annot="_userAddress"), t("nat", annot="_index")))
+
+
+def test_base58_roundtrip():
+    address = "tz1VVhDEgXSHNFcDmKpKeujvJ6dV7kcSqbAV"
+    payload = michelson.b58check_decode(address)
+    assert michelson.b58check_encode(payload) == address
+
+
+def test_make_address_is_deterministic_and_valid():
+    first = michelson.make_address(("user", 1))
+    assert first == michelson.make_address(("user", 1))
+    assert first != michelson.make_address(("user", 2))
+    assert first.startswith("tz1") and len(first) == 36
+    assert michelson.make_address("x", kind="KT1").startswith("KT1")
+
+
+def test_implicit_addresses_sort_before_originated():
+    implicit = michelson.address_bytes(michelson.make_address(1))
+    originated = michelson.address_bytes(michelson.make_address(1, kind="KT1"))
+    assert implicit < originated
+
+
+def test_encode_decode_record():
+    value = {"_safleId": "user", "_userAddress": michelson.make_address(1), "_index": 3}
+    node = michelson.encode(RECORD, value)
+    assert node["prim"] == "Pair"
+    assert michelson.decode(RECORD, node) == value
+
+
+def test_encode_single_field_record_unwraps():
+    assert michelson.encode(t("nat", annot="setSafleIdFees"), {"_amount": 5}) == {"int": "5"}
+
+
+def test_encode_map_sorts_keys():
+    node = michelson.encode(t("map", t("string"), t("nat")), {"b": 2, "a": 1})
+    assert [elt["args"][0]["string"] for elt in node] == ["a", "b"]
+
+
+def test_encode_or_by_annotation():
+    ty = t("or", t("nat", annot="first"), t("or", t("string", annot="second"), t("unit", annot="third")))
+    assert michelson.encode(ty, ("second", "x")) == {"prim": "Right", "args": [{"prim": "Left", "args": [{"string": "x"}]}]}
+    assert michelson.decode(ty, michelson.encode(ty, ("third", None))) == ("third", None)
+
+
+def test_entrypoints_of_or_tree():
+    ty = t("or", t("or", t("nat", annot="a"), t("unit", annot="b")), t("string", annot="c"))
+    assert sorted(michelson.entrypoints(ty)) == ["a", "b", "c"]
+
+
+def test_get_and_set_field():
+    ty = t("pair", t("pair", t("nat", annot="count"), t("string", annot="name")), t("bool", annot="flag"))
+    value = michelson.encode(ty, {"count": 1, "name": "x", "flag": False})
+    assert michelson.get_field(ty, value, "name") == {"string": "x"}
+    updated = michelson.set_field(ty, value, "flag", {"prim": "True"})
+    assert michelson.decode(ty, updated) == {"count": 1, "name": "x", "flag": True}
+    assert michelson.decode(ty, value)["flag"] is False
+
+
+def test_to_text_parenthesizes_nested_applications():
+    node = {"prim": "Pair", "args": [{"string": "a"}, {"prim": "Pair", "args": [{"int": "1"}, {"prim": "None"}]}]}
+    assert michelson.to_text(node) == 'Pair "a" (Pair 1 None)'
+    assert michelson.to_text([]) == "{}"
+    assert michelson.to_text(t("pair", t("nat", annot="a"), t("unit"))) == "pair (nat %a) unit"
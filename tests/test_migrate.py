@@ -0,0 +1,112 @@
+import pytest
+
+from tests.mock_rpc import MockNode
+from tools import codesize, michelson, migrate
+from tools.rpc import RpcClient
+
+CONTRACT = michelson.make_address("new storage", "KT1")
+
+ACCOUNT = {"prim": "pair", "args": [{"prim": "string", "annots": ["%safleId"]}, {"prim": "nat", "annots": ["%safleIdUpdates"]}]}
+HISTORY_KEY = {"prim": "pair", "args": [{"prim": "address"}, {"prim": "nat"}]}
+
+STORAGE_TYPE = {"prim": "pair", "args": [
+    {"prim": "pair", "args": [{"prim": "nat", "annots": ["%totalRegistrars"]}, {"prim": "nat", "annots": ["%totalSafleIdRegistered"]}]},
+    {"prim": "bool", "annots": ["%importSealed"]},
+    {"prim": "big_map", "args": [{"prim": "address"}, ACCOUNT], "annots": ["%accounts"]},
+    {"prim": "big_map", "args": [HISTORY_KEY, {"prim": "bytes"}], "annots": ["%resolveOldSafleIdFromAddress"]},
+]}
+
+PARAMETER_TYPE = {"prim": "or", "args": [
+    {"prim": "pair", "annots": ["%importRegistry"], "args": [
+        {"prim": "list", "args": [{"prim": "pair", "args": [{"prim": "address"}, ACCOUNT]}], "annots": ["%accounts"]},
+        {"prim": "list", "args": [{"prim": "pair", "args": [HISTORY_KEY, {"prim": "bytes"}]}], "annots": ["%resolveOldSafleIdFromAddress"]},
+    ]},
+    {"prim": "pair", "annots": ["%sealImport"], "args": [
+        {"prim": "nat", "annots": ["%_totalRegistrars"]}, {"prim": "nat", "annots": ["%_totalSafleIdRegistered"]}
+    ]},
+]}
+
+
+def user(i):
+    return michelson.make_address(("user", i))
+
+
+def make_dump(users=30):
+    accounts = [[{"string": user(i)}, michelson.encode(ACCOUNT, {"safleId": "user%d" % i, "safleIdUpdates": i % 2})] for i in range(users)]
+    history = [
+        [michelson.encode(HISTORY_KEY, (user(i), 0)), {"bytes": "0501000000046f6c6431"}]
+        for i in range(users) if i % 2
+    ]
+    return {
+        "totalRegistrars": 1,
+        "totalSafleIdRegistered": users + len(history),
+        "bigMaps": {"accounts": accounts, "resolveOldSafleIdFromAddress": history},
+    }
+
+
+@pytest.fixture
+def node():
+    node = MockNode().start()
+    yield node
+    node.stop()
+
+
+def deploy(node, dump, sealed=True):
+    """Put the state ``dump`` would be imported to on the mock node."""
+    storage = michelson.encode(STORAGE_TYPE, {
+        "totalRegistrars": dump["totalRegistrars"], "totalSafleIdRegistered": dump["totalSafleIdRegistered"],
+        "importSealed": sealed, "accounts": {}, "resolveOldSafleIdFromAddress": {},
+    })
+    storage = michelson.set_field(STORAGE_TYPE, storage, "accounts", {"int": "7"})
+    storage = michelson.set_field(STORAGE_TYPE, storage, "resolveOldSafleIdFromAddress", {"int": "8"})
+    node.scripts[CONTRACT] = {
+        "code": [{"prim": "parameter", "args": [PARAMETER_TYPE]}, {"prim": "storage", "args": [STORAGE_TYPE]}, {"prim": "code", "args": [[]]}],
+        "storage": storage,
+    }
+    for big_map, name, key_type in ((7, "accounts", {"prim": "address"}), (8, "resolveOldSafleIdFromAddress", HISTORY_KEY)):
+        node.big_maps[big_map] = dict((migrate.script_expr_hash(key_type, key), value) for key, value in dump["bigMaps"][name])
+
+
+def test_chunks_hold_every_entry_once_within_budget():
+    dump = make_dump()
+    planned = list(migrate.chunks(dump, max_bytes=300))
+    assert len(planned) > 5
+    for chunk in planned:
+        assert sum(len(codesize.encode(entry)) for entries in chunk.values() for entry in entries) <= 300
+    for name, entries in dump["bigMaps"].items():
+        imported = [entry["args"] for chunk in planned for entry in chunk.get(name, [])]
+        assert imported == entries
+    assert len(list(migrate.chunks(dump, max_gas=migrate.GAS_PER_OPERATION + 3 * 2000))) > len(planned) / 2
+    with pytest.raises(migrate.MigrationError):
+        list(migrate.chunks(dump, max_bytes=20))
+
+
+def test_chunk_parameters_fill_every_big_map_of_the_entry_point():
+    types = migrate.entrypoint_types({"code": [{"prim": "parameter", "args": [PARAMETER_TYPE]}]})
+    chunk = next(migrate.chunks(make_dump(2)))
+    parameter = migrate.chunk_parameter(types["importRegistry"], {"accounts": chunk["accounts"]})
+    assert parameter == {"prim": "Pair", "args": [chunk["accounts"], []]}
+    assert michelson.to_text(migrate.seal_parameter(types["sealImport"], make_dump(2))) == "Pair 1 3"
+    with pytest.raises(migrate.MigrationError):
+        migrate.chunk_parameter(types["importRegistry"], {"unavailableSafleIds": []})
+
+
+def test_verify_accepts_an_identical_registry(node):
+    dump = make_dump()
+    deploy(node, dump)
+    assert migrate.verify(RpcClient(node.endpoint), CONTRACT, dump) == []
+
+
+def test_verify_reports_missing_changed_and_extra_entries(node):
+    dump = make_dump()
+    deploy(node, dump, sealed=False)
+    accounts = node.big_maps[7]
+    del accounts[migrate.script_expr_hash({"prim": "address"}, {"string": user(0)})]
+    accounts[migrate.script_expr_hash({"prim": "address"}, {"string": user(1)})] = michelson.encode(ACCOUNT, {"safleId": "other", "safleIdUpdates": 1})
+    accounts["exprExtra1"] = accounts["exprExtra2"] = michelson.encode(ACCOUNT, {"safleId": "extra", "safleIdUpdates": 0})
+    dump["totalRegistrars"] = 2
+    problems = migrate.verify(RpcClient(node.endpoint), CONTRACT, dump)
+    assert problems[:2] == ["totalRegistrars: 1 on chain, 2 in the dump", "the import is not sealed"]
+    assert problems[2].startswith("accounts: {\"string\": \"%s\"} is missing" % user(0))
+    assert "\"other\"" in problems[3]
+    assert problems[4:] == ["accounts: 31 entries on chain, 30 in the dump"]
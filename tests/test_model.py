@@ -0,0 +1,169 @@
+import time
+
+import pytest
+
+from tools import differential
+from tools import model as safle
+from tools.model import AUCTION, MAIN, Failure, Model
+
+
+@pytest.fixture
+def model():
+    model = Model()
+    model.call("main", "setSafleIdFees", "owner", {"_amount": 10})
+    model.call("main", "registerRegistrar", "registrar", {"_registrarName": "Reg1"})
+    return model
+
+
+def failure(model, *args, **kwargs):
+    with pytest.raises(Failure) as e:
+        model.call(*args, **kwargs)
+    return e.value.message
+
+
+def test_registration_goes_through_main_to_storage(model):
+    model.call("main", "registerSafleId", "registrar", {"_safleId": "Alice", "_userAddress": "alice"}, amount=10)
+    assert model.view("storage", "resolveSafleId", {"_safleId": "alice"}) == "alice"
+    assert model.view("storage", "accountOf", {"_address": "alice"})["safleId"] == "alice"
+    assert model.balance("wallet") == 0 and model.balance(MAIN) == 10
+    assert failure(model, "storage", "registerSafleId", "registrar", {
+        "_registrar": "registrar", "_userAddress": "bob", "_safleId": "bobby"
+    }) is None
+
+
+def test_fees_accumulate_until_withdrawn_or_swept(model):
+    model.call("main", "registerSafleId", "registrar", {"_safleId": "alice", "_userAddress": "alice"}, amount=10)
+    assert failure(model, "main", "withdrawFees", "registrar", {}) == "sender is not a contract owner"
+    model.call("main", "withdrawFees", "owner", {})
+    assert (model.balance("wallet"), model.balance(MAIN)) == (10, 0)
+    assert failure(model, "main", "withdrawFees", "owner", {}) == "No fees to withdraw."
+    model.call("main", "setFeeSweepThreshold", "owner", {"_amount": 15})
+    model.call("main", "registerSafleId", "registrar", {"_safleId": "bobby", "_userAddress": "bob"}, amount=10)
+    assert (model.balance("wallet"), model.balance(MAIN)) == (10, 10)
+    model.call("main", "registerSafleId", "registrar", {"_safleId": "carol", "_userAddress": "carol"}, amount=10)
+    assert (model.balance("wallet"), model.balance(MAIN)) == (30, 0)
+    fees = model.main.vars
+    assert (fees["totalFeesCollected"], fees["totalFeesWithdrawn"]) == (30, 30)
+
+    # Tez sent where no fee is due is not a fee: it is withdrawn and counted on its own.
+    assert failure(model, "main", "withdrawExcessBalance", "owner", {}) == "No excess balance to withdraw."
+    model.call("main", "setFeeSweepThreshold", "owner", {"_amount": 0}, amount=3)
+    model.call("main", "mapCoins", "registrar", {"_blockchainName": "Tezos", "_aliasName": "XTZ", "_indexNumber": 1}, amount=4)
+    model.call("main", "registerSafleId", "registrar", {"_safleId": "dave", "_userAddress": "dave"}, amount=10)
+    model.call("main", "withdrawFees", "owner", {})
+    assert (model.balance("wallet"), model.balance(MAIN)) == (40, 7)
+    assert (fees["totalFeesCollected"], fees["totalFeesWithdrawn"], fees["totalExcessWithdrawn"]) == (40, 40, 0)
+    assert failure(model, "main", "withdrawExcessBalance", "registrar", {}) == "sender is not a contract owner"
+    model.call("main", "withdrawExcessBalance", "owner", {})
+    assert (model.balance("wallet"), model.balance(MAIN)) == (47, 0)
+    assert (fees["totalFeesCollected"], fees["totalFeesWithdrawn"], fees["totalExcessWithdrawn"]) == (40, 40, 7)
+
+
+def test_name_status_covers_every_kind_of_name(model):
+    model.call("main", "registerSafleId", "registrar", {"_safleId": "alice", "_userAddress": "alice"}, amount=10)
+    model.call("main", "registerSafleId", "registrar", {"_safleId": "bobby", "_userAddress": "bob"}, amount=10)
+    model.call("main", "updateSafleId", "registrar", {"_newSafleId": "robert", "_userAddress": "bob"}, amount=10)
+    model.call("auction", "auctionSafleId", "alice", {"_safleId": "alice", "_auctionSeconds": 600})
+    assert model.view("storage", "nameStatuses", {"_names": ["alice", "robert", "bobby", "reg1", "carol"]}) == {
+        "alice": safle.NAME_IN_AUCTION, "robert": safle.NAME_SAFLE_ID, "bobby": safle.NAME_RETIRED,
+        "reg1": safle.NAME_REGISTRAR, "carol": safle.NAME_FREE,
+    }
+
+
+def test_checks_fail_in_contract_order(model):
+    params = {"_safleId": "ab", "_userAddress": "alice"}
+    assert failure(model, "main", "registerSafleId", "registrar", params, amount=9) == "Registration fees not matched."
+    assert failure(model, "main", "registerSafleId", "registrar", params, amount=10) == \
+        "SafleId length should be greater than 3 characters"
+    assert failure(model, "main", "registerSafleId", "alice", {"_safleId": "reg1", "_userAddress": "alice"}, amount=10) == \
+        "Invalid Registrar."
+    assert failure(model, "main", "registerSafleId", "registrar", {"_safleId": "REG1", "_userAddress": "alice"}, amount=10) == \
+        "This SafleId is taken by a Registrar."
+
+
+def test_failed_calls_roll_back_every_contract(model):
+    batch = {"_safleIds": [
+        {"_userAddress": "alice", "_safleId": "alice"},
+        {"_userAddress": "bob", "_safleId": "ALICE"},
+    ]}
+    assert failure(model, "main", "registerSafleIds", "registrar", batch, amount=20) == \
+        ("alice", "This SafleId is already registered.")
+    assert model.view("storage", "resolveSafleIds", {"_safleIds": ["alice"]}) == {"alice": None}
+    assert model.storage.vars["totalSafleIdRegistered"] == 0
+    assert model.balance("wallet") == 0 and model.balance(MAIN) == 0
+
+
+def test_auction_moves_the_name_and_the_bids(model):
+    model.call("main", "registerSafleId", "registrar", {"_safleId": "alice", "_userAddress": "alice"}, amount=10)
+    model.call("auction", "auctionSafleId", "alice", {"_safleId": "alice", "_auctionSeconds": 600}, now=0)
+    assert failure(model, "main", "registerCoinAddress", "registrar", {
+        "_userAddress": "alice", "_index": 1, "_address": "abc"
+    }) == "Coin addresses cannot be changed inbetween Auction."
+    model.call("auction", "bidForSafleId", "bob", {"_safleId": "alice"}, amount=100, now=10)
+    model.call("auction", "bidForSafleId", "carol", {"_safleId": "alice"}, amount=150, now=20)
+    assert failure(model, "auction", "bidForSafleId", "bob", {"_safleId": "alice"}, amount=100, now=600) == \
+        "Auction time is completed"
+    model.call("auction", "settleAuction", "alice", now=700)
+    model.call("auction", "withdrawBid", "bob", {"_auctionId": 0})
+
+    assert model.view("storage", "resolveSafleId", {"_safleId": "alice"}) == "carol"
+    assert model.view("storage", "oldSafleIdsOf", {"_userAddress": "alice", "_offset": 0, "_limit": 5}) == \
+        {"total": 1, "names": ["alice"]}
+    assert (model.balance("alice"), model.balance("bob"), model.balance(AUCTION)) == (150, 100, 0)
+    assert failure(model, "auction", "withdrawBid", "carol", {"_auctionId": 0}) == "Winning bid cannot be withdrawn."
+
+
+def test_model_runs_thousands_of_calls_per_second():
+    started = time.time()
+    state, trace = differential.generate(seed=1, length=5000)
+    assert 5000 / (time.time() - started) > 2000
+    assert any(op.outcome is None for op in trace) and any(op.outcome is not None for op in trace)
+
+
+def test_traces_are_reproducible():
+    first = [repr(op) for op in differential.generate(7, 300)[1]]
+    assert first == [repr(op) for op in differential.generate(7, 300)[1]]
+
+
+def test_scenario_replays_the_trace_with_expected_failures():
+    state, trace = differential.generate(seed=2, length=200)
+    source = differential.scenario_source(2, state, trace)
+    compile(source, "_differential_2.py", "exec")
+    failing = next(i for i, op in enumerate(trace) if op.outcome is not None and op.outcome.message)
+    lines = source.splitlines()
+    call = lines[lines.index('    scenario.h4("op %d: %s.%s")' % (failing, trace[failing].contract, trace[failing].entrypoint)) + 1]
+    assert "valid=False" in call and "exception=" in call
+    assert "scenario.verify_equal(storage.resolveSafleIds(" in source
+
+    output = 'Error in scenario\n  File "contracts/_differential_2.py", line %d, in test' % (lines.index(call) + 1)
+    assert differential.divergence(output, source) == failing
+
+
+def test_keepers_settle_expired_auctions_by_bucket(model):
+    for name in ("alice", "bobby", "carol"):
+        model.call("main", "registerSafleId", "registrar", {"_safleId": name, "_userAddress": name}, amount=10)
+    for name, seconds in (("alice", 600), ("bobby", 600), ("carol", 1200)):
+        model.call("auction", "auctionSafleId", name, {"_safleId": name, "_auctionSeconds": seconds}, now=7200)
+    model.call("auction", "bidForSafleId", "dave", {"_safleId": "alice"}, amount=5, now=7300)
+    model.call("auction", "bidForSafleId", "erin", {"_safleId": "bobby"}, amount=5, now=7300)
+    assert model.view("auction", "expiringAuctionCount", {"_bucket": 2}) == 3
+    assert sorted(model.auction.expiringAuctions) == [(2, 0), (2, 1), (2, 2)]
+    assert failure(model, "auction", "settleExpiredAuctions", "keeper", {"_auctionIds": [0] * (safle.MAX_SETTLE_BATCH + 1)}, now=7800) == \
+        "Too many auctions to settle in one call."
+
+    model.call("auction", "settleExpiredAuctions", "keeper", {"_auctionIds": [0]}, now=7800)
+    assert model.view("auction", "expiringAuctionCount", {"_bucket": 2}) == 2
+    assert model.view("storage", "resolveSafleId", {"_safleId": "alice"}) == "dave"
+    model.call("auction", "settleExpiredAuctions", "keeper", {"_auctionIds": [0, 1, 2, 7]}, now=7800)
+    assert sorted(model.auction.expiringAuctions) == [(2, 2)]
+    assert failure(model, "auction", "settleExpiredAuctions", "keeper", {"_auctionIds": [0, 1, 2]}, now=7800) == \
+        "No expired auctions to settle."
+
+    # Without bids the auction is closed and the name released to its owner.
+    model.call("auction", "settleExpiredAuctions", "keeper", {"_auctionIds": [2]}, now=8400)
+    assert not model.auction.expiringAuctions
+    assert model.view("auction", "expiringAuctionCount", {"_bucket": 2}) == 0
+    assert model.view("storage", "resolveSafleId", {"_safleId": "carol"}) == "carol"
+    assert model.view("storage", "nameStatus", {"_name": "carol"}) == safle.NAME_SAFLE_ID
+    assert not model.auction.auction[2]["isAuctionLive"]
+    model.call("auction", "auctionSafleId", "carol", {"_safleId": "carol", "_auctionSeconds": 600}, now=8400)
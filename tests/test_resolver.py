@@ -0,0 +1,131 @@
+import pytest
+
+from tests.mock_rpc import MockNode, event, import_event
+from tools.resolver import LRUCache, NotRegistered, Resolver
+from tools.rpc import RpcClient
+
+STORAGE = "KT1CgivcuoBSvub3JAPaVGQUGBLCXHhBhX9o"
+OTHER = "KT18amZmM5W7qDWVt2pH6uj7sCEd3kbzLrHT"
+ALICE = "tz1VVhDEgXSHNFcDmKpKeujvJ6dV7kcSqbAV"
+BOB = "tz1Ke2h7sDdakHJQh8WX4Z372du1KChsksyU"
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def node():
+    node = MockNode().start()
+    yield node
+    node.stop()
+
+
+@pytest.fixture
+def resolver(node):
+    resolver = Resolver(RpcClient(node.endpoint), STORAGE, clock=Clock())
+    resolver.sync()
+    return resolver
+
+
+def test_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=10, clock=Clock())
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.put("c", 3)
+    assert "b" not in cache and "a" in cache and "c" in cache
+
+
+def test_cache_entries_expire():
+    clock = Clock()
+    cache = LRUCache(ttl=10, clock=clock)
+    cache.put("a", 1)
+    clock.now = 9.9
+    assert cache.get("a") == (True, 1)
+    clock.now = 10
+    assert cache.get("a") == (False, None)
+    assert len(cache) == 0
+
+
+def test_hot_names_are_served_from_memory(node, resolver):
+    node.set_view("resolveSafleId", {"string": "alice"}, ALICE)
+    for _ in range(100):
+        assert resolver.resolve_safle_id("alice") == ALICE
+    assert len(node.view_calls) == 1
+    assert resolver.cache.hits == 99
+
+
+def test_missing_names_are_cached_too(node, resolver):
+    with pytest.raises(NotRegistered):
+        resolver.resolve_safle_id("nobody")
+    with pytest.raises(NotRegistered):
+        resolver.resolve_safle_id("nobody")
+    assert len(node.view_calls) == 1
+
+
+def test_events_invalidate_only_touched_entries(node, resolver):
+    node.set_view("resolveSafleId", {"string": "alice"}, ALICE)
+    node.set_view("resolveSafleId", {"string": "carol"}, BOB)
+    node.set_view("idToCoinAddress", {"prim": "Pair", "args": [{"int": "1"}, {"string": "alice"}]}, "0xold")
+    node.set_view("resolveRegistrarName", {"string": "reg"}, BOB)
+    resolver.resolve_safle_id("alice")
+    resolver.resolve_safle_id("carol")
+    resolver.id_to_coin_address("alice", 1)
+    resolver.resolve_registrar_name("reg")
+    with pytest.raises(NotRegistered):
+        resolver.resolve_safle_id("newbie")
+
+    node.set_view("resolveSafleId", {"string": "alice"}, BOB)
+    node.set_view("resolveSafleId", {"string": "newbie"}, ALICE)
+    node.set_view("idToCoinAddress", {"prim": "Pair", "args": [{"int": "1"}, {"string": "alice"}]}, "0xnew")
+    node.bake(
+        event(STORAGE, "transferSafleId", safleId="alice", oldOwner=ALICE, newOwner=BOB),
+        event(STORAGE, "registerSafleId", safleId="newbie", user=ALICE),
+        event(STORAGE, "updateCoinAddress", safleId="alice", index=1, address="0xnew"),
+        event(OTHER, "registerSafleId", safleId="carol", user=ALICE),
+        event(STORAGE, "registerSafleId", status="backtracked", safleId="carol", user=ALICE),
+    )
+    assert resolver.sync() == 1
+
+    assert ("resolveSafleId", "carol") in resolver.cache
+    assert ("resolveRegistrarName", "reg") in resolver.cache
+    assert resolver.resolve_safle_id("alice") == BOB
+    assert resolver.resolve_safle_id("newbie") == ALICE
+    assert resolver.id_to_coin_address("alice", 1) == "0xnew"
+
+
+def test_updates_invalidate_old_and_new_names(node, resolver):
+    node.set_view("resolveSafleId", {"string": "old"}, ALICE)
+    node.set_view("coinAddressToId", {"string": "0xabc"}, "old")
+    resolver.resolve_safle_id("old")
+    resolver.coin_address_to_id("0xabc")
+    node.bake(event(STORAGE, "updateSafleId", oldSafleId="old", newSafleId="new", user=ALICE))
+    node.bake()
+    assert resolver.sync() == 2
+    assert ("resolveSafleId", "old") not in resolver.cache
+    assert ("coinAddressToId", "0xabc") in resolver.cache
+
+
+def test_first_sync_replays_the_blocks_since_the_first_lookup(node):
+    resolver = Resolver(RpcClient(node.endpoint), STORAGE, clock=Clock())
+    node.set_view("resolveSafleId", {"string": "alice"}, ALICE)
+    resolver.resolve_safle_id("alice")
+    node.set_view("resolveSafleId", {"string": "alice"}, BOB)
+    node.bake(event(STORAGE, "transferSafleId", safleId="alice", oldOwner=ALICE, newOwner=BOB))
+    assert resolver.sync() == 1
+    assert resolver.resolve_safle_id("alice") == BOB
+
+
+def test_bulk_imports_clear_the_cache(node, resolver):
+    node.set_view("resolveSafleId", {"string": "alice"}, ALICE)
+    resolver.resolve_safle_id("alice")
+    with pytest.raises(NotRegistered):
+        resolver.resolve_safle_id("imported")
+    node.bake(import_event(STORAGE, coinAddressToSafleId=[("0xabc", "imported")]))
+    assert resolver.sync() == 1
+    assert len(resolver.cache) == 0
@@ -0,0 +1,113 @@
+import os
+import stat
+
+import pytest
+
+from tools import testrunner
+
+CONTRACT = '''\
+import smartpy as sp
+
+helper = sp.io.import_stored_contract("Helper.py")
+
+
+class Counter(sp.Contract):
+    @sp.entry_point
+    def bump(self, params):
+        sp.for i in sp.range(0, params):
+            sp.if i > 2:
+                self.data.x += 1
+            sp.else:
+                pass
+
+
+@sp.add_test(name="First")
+def test():
+    scenario = sp.test_scenario()
+
+
+def notATest():
+    pass
+
+
+@sp.add_test(name="Second scenario")
+def test():
+    scenario = sp.test_scenario()
+    scenario.h1("FAIL")
+
+
+@sp.add_test(name="Third")
+def test():
+    scenario = sp.test_scenario()
+'''
+
+# Stands in for SmartPy.sh: writes an output directory per scenario, in order,
+# and fails on the scenario containing "FAIL".
+FAKE_CLI = '''\
+#!/usr/bin/env python3
+import os, re, sys, time
+_, command, path, out = sys.argv
+source = open(path).read()
+for name, body in re.findall(r'add_test\\(name="([^"]+)"\\)\\n(.*?)(?=\\n@|\\Z)', source, re.S):
+    time.sleep(0.05)
+    os.makedirs(os.path.join(out, name.replace(" ", "_")))
+    open(os.path.join(out, name.replace(" ", "_"), "log.txt"), "w").write("ok")
+    if "FAIL" in body:
+        print("Error in scenario " + name)
+        sys.exit(1)
+'''
+
+
+@pytest.fixture
+def contracts(tmp_path, monkeypatch):
+    (tmp_path / "Counter.py").write_text(CONTRACT)
+    (tmp_path / "Other.py").write_text(CONTRACT.replace('scenario.h1("FAIL")', "pass").replace('name="', 'name="Other '))
+    cli = tmp_path / "SmartPy.sh"
+    cli.write_text(FAKE_CLI)
+    cli.chmod(cli.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(testrunner, "CONTRACTS_DIR", str(tmp_path))
+    monkeypatch.setattr(testrunner, "SMART_PY_CLI", str(cli))
+    return tmp_path
+
+
+def test_discovers_scenarios_in_smartpy_sources(contracts):
+    scenarios = testrunner.discover([str(contracts / "Counter.py")])
+    assert [(s.name, s.start, s.end) for s in scenarios] == [("First", 16, 18), ("Second scenario", 25, 28), ("Third", 31, 33)]
+    assert len(testrunner.discover()) == 6
+
+
+def test_shards_keep_imports_helpers_and_selected_scenarios(contracts):
+    path = str(contracts / "Counter.py")
+    first, second, third = testrunner.discover([path])
+    source = testrunner.shard_source(path, [first, third])
+    assert 'helper = sp.io.import_stored_contract("Helper.py")' in source
+    assert "sp.for i in sp.range(0, params):" in source and "def notATest():" in source
+    assert '"First"' in source and '"Third"' in source and "Second scenario" not in source
+
+
+def test_schedule_balances_expected_durations():
+    scenarios = [testrunner.Scenario(n, "T.py", 0, 0) for n in "abcde"]
+    timings = {"T.py::a": 10, "T.py::b": 6, "T.py::c": 5, "T.py::d": 4, "T.py::e": 1}
+    workers = testrunner.schedule(scenarios, 2, timings)
+    # Longest first onto the least loaded worker: a+d against b+c+e.
+    assert sorted(sum(timings[s.key] for s in w) for w in workers) == [12, 14]
+    assert len(testrunner.schedule(scenarios, 16, timings)) == 5
+
+
+def test_run_reports_each_scenario(contracts):
+    results, failures = testrunner.run(testrunner.discover(), jobs=3, timings={})
+    by_key = dict((r.scenario.key, r) for r in results)
+    assert by_key["Counter.py::First"].passed is True
+    assert by_key["Counter.py::Second scenario"].passed is False
+    assert all(r.passed for key, r in by_key.items() if key.startswith("Other.py"))
+    assert [os.path.basename(path) for path, output in failures] == ["Counter.py"]
+    assert "Error in scenario Second scenario" in failures[0][1]
+    assert all(r.seconds >= 0.04 for r in results if r.passed)
+    assert not [f for f in os.listdir(str(contracts)) if f.startswith("_shard_")]
+
+
+def test_scenario_times_mark_scenarios_after_a_failure_as_not_run(tmp_path):
+    scenarios = [testrunner.Scenario(n, "T.py", 0, 0) for n in ("a", "b", "c")]
+    (tmp_path / "a").mkdir()
+    times = testrunner.scenario_times(str(tmp_path), scenarios, 0.0, 1e12, passed=False)
+    assert [ok for _, _, ok in times] == [True, False, None]
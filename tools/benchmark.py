@@ -0,0 +1,567 @@
+"""Storage-growth gas benchmark for RegistrarMain, RegistrarStorage and Auction.
+
+The contracts compiled by ``compile.sh`` into ``build/`` are originated in
+an octez-client mockup and the registry is filled to each size in
+``--sizes``: N registrars, SafleIDs, coin addresses, auctions and bids.
+At every size each entry point and view is called once, and the gas
+consumed by every (internal) transaction plus the resulting storage size
+is recorded in a JSON report.
+
+The run fails when a result breaks ``tools/benchmark_budgets.json``:
+gas at the largest size may grow at most ``max_growth`` times over the
+smallest size, and, with ``--baseline``, may regress at most
+``max_regression`` over the baseline report.
+
+    ./compile.sh RegistrarMain RegistrarStorage Auction
+    python -m tools.benchmark run --sizes 10,100,1000,10000
+    python -m tools.benchmark compare old_report.json new_report.json
+
+``revisions`` builds two git revisions in throw-away worktrees, benchmarks
+both and prints the comparison, e.g. to weigh a storage layout change:
+
+    python -m tools.benchmark revisions HEAD~1 HEAD --sizes 10,1000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from tools import michelson, migrate
+from tools.model import AUCTION_BUCKET_SECONDS
+from tools.octez import OctezClient
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_REPORT = os.path.join(michelson.BUILD_DIR, "benchmark_report.json")
+DEFAULT_BUDGETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_budgets.json")
+
+CONTRACTS = ["RegistrarMain", "RegistrarStorage", "Auction"]
+
+# Items per contract call and calls per operation group while filling.
+BATCH_ITEMS = 50
+BATCH_CALLS = 4
+
+AUCTION_SECONDS = 7000000
+# Shortest auction the contract accepts; settleExpiredAuctions is measured
+# on one of these once it has expired.
+EXPIRING_AUCTION_SECONDS = 301
+
+
+def tez(mutez):
+    return "%d.%06d" % divmod(int(mutez), 1000000)
+
+
+def letters(number, width=8):
+    """``number`` spelled in a-z, for strings that go through toLower."""
+    chars = []
+    for _ in range(width):
+        number, digit = divmod(number, 26)
+        chars.append(chr(ord("a") + digit))
+    return "".join(reversed(chars))
+
+
+class Bench(object):
+    """Originated contracts plus the bookkeeping needed to call them."""
+
+    def __init__(self, client, build_dir=michelson.BUILD_DIR):
+        self.client = client
+        self.build_dir = build_dir
+        self.scripts = dict((name, michelson.load_contract(name, build_dir)) for name in CONTRACTS)
+        self.addresses = {}
+        self.aliases = {}
+        self.accounts = []
+        self.next_account = 0
+        self.counters = {}
+        self.storage_sizes = {}
+        self.filled = dict(registrars=0, safleIds=0, coinAddresses=0, auctions=0, bids=0)
+        self.owner = client.address("bootstrap1")
+        self.registrar = "bootstrap2"
+        self.wallet = client.address("bootstrap5")
+        self.probes = {}
+
+    # -- setup ---------------------------------------------------------
+
+    def originate(self):
+        main = self.originate_contract("RegistrarMain", contractOwner=self.owner, walletAddress=self.wallet)
+        storage = self.originate_contract("RegistrarStorage", contractOwner=self.owner, mainContract=main)
+        auction = self.originate_contract("Auction", contractOwner=self.owner, storageContract=storage)
+        self.call("bootstrap1", "RegistrarMain", "setStorageContract", {"_registrarStorageContract": storage})
+        self.call("bootstrap1", "RegistrarStorage", "setAuctionContract", {"_auctionAddress": auction})
+        self.call(self.registrar, "RegistrarMain", "registerRegistrar", {"_registrarName": "benchregistrar"})
+        self.call(self.registrar, "RegistrarMain", "mapCoins", {"_blockchainName": "tezos", "_aliasName": "xtz", "_indexNumber": 1})
+        self.counters["coinIndex"] = 1
+        self.bench_auction = self.start_auction(self.account())
+        self.expiring_auction = self.start_expiring_auction()
+
+    def originate_contract(self, name, alias=None, **fields):
+        """Originate ``name`` from ``build/``; only the first copy of a contract is the one called by name."""
+        script = self.scripts[name]
+        storage = michelson.load_storage(name, self.build_dir)
+        for field, value in fields.items():
+            field_type = michelson.get_field(script["storage"], script["storage"], field)
+            storage = michelson.set_field(script["storage"], storage, field, michelson.encode(field_type, value))
+        address = self.client.originate(alias or name, michelson.script_text(name, self.build_dir), michelson.to_text(storage))
+        self.addresses.setdefault(name, address)
+        self.aliases[address] = name
+        return address
+
+    # -- calls ---------------------------------------------------------
+
+    def arg(self, contract, entrypoint, value):
+        ty = michelson.entrypoints(self.scripts[contract]["parameter"])[entrypoint]
+        return michelson.to_text(michelson.encode(ty, value))
+
+    def call(self, sender, contract, entrypoint, value, amount=0):
+        results = self.client.transfer(
+            sender, self.addresses[contract], entrypoint, self.arg(contract, entrypoint, value), tez(amount)
+        )
+        self.record_sizes(results)
+        return results
+
+    def call_batch(self, sender, contract, entrypoint, values):
+        transfers = [
+            dict(destination=self.addresses[contract], entrypoint=entrypoint, arg=self.arg(contract, entrypoint, value))
+            for value in values
+        ]
+        for start in range(0, len(transfers), BATCH_CALLS):
+            self.record_sizes(self.client.multiple_transfers(sender, transfers[start:start + BATCH_CALLS]))
+
+    def record_sizes(self, results):
+        for result in results:
+            name = self.aliases.get(result.destination)
+            if name is not None and result.storage_size is not None:
+                self.storage_sizes[name] = result.storage_size
+
+    def fresh(self, kind):
+        self.counters[kind] = self.counters.get(kind, 0) + 1
+        return self.counters[kind]
+
+    def account(self):
+        """An implicit account that has not been used as a sender yet."""
+        while self.next_account >= len(self.accounts):
+            self.create_accounts(max(16, len(self.accounts)))
+        alias = self.accounts[self.next_account]
+        self.next_account += 1
+        return alias
+
+    def create_accounts(self, count):
+        aliases = ["bench%d" % (len(self.accounts) + i) for i in range(count)]
+        addresses = [self.client.gen_account(alias) for alias in aliases]
+        for start in range(0, len(addresses), 100):
+            self.client.multiple_transfers("bootstrap1", [
+                dict(destination=address, amount="100") for address in addresses[start:start + 100]
+            ])
+        self.accounts.extend(aliases)
+
+    # -- fixtures ------------------------------------------------------
+
+    def register_safle_id(self, user_address, fee=0):
+        name = "bench" + letters(self.fresh("safleId"))
+        self.call(self.registrar, "RegistrarMain", "registerSafleId", {"_safleId": name, "_userAddress": user_address}, amount=fee)
+        return name
+
+    def start_auction(self, alias, seconds=AUCTION_SECONDS):
+        """Register a SafleID for ``alias`` and put it up for auction."""
+        name = self.register_safle_id(self.client.address(alias))
+        results = self.call(alias, "Auction", "auctionSafleId", {"_safleId": name, "_auctionSeconds": seconds})
+        auction = dict(
+            id=self.fresh("auction") - 1, conductor=alias, safleId=name, highestBid=0, bidders=[], results=results,
+            ends=time.time() + seconds
+        )
+        return auction
+
+    def start_expiring_auction(self):
+        """A short auction with one bid, for a later settleExpiredAuctions."""
+        if "settleExpiredAuctions" not in michelson.entrypoints(self.scripts["Auction"]["parameter"]):
+            return None
+        auction = self.start_auction(self.account(), EXPIRING_AUCTION_SECONDS)
+        self.bid(self.account(), auction)
+        return auction
+
+    def bid(self, alias, auction):
+        amount = auction["highestBid"] + 1
+        results = self.call(alias, "Auction", "bidForSafleId", {"_safleId": auction["safleId"]}, amount=amount)
+        auction["highestBid"] = amount
+        auction["bidders"].append(alias)
+        return results
+
+    # -- filling -------------------------------------------------------
+
+    def fill(self, size):
+        """Grow every registry to ``size`` entries."""
+        if self.filled["registrars"] < size:
+            # Registrars are keyed by sender, so they are written straight
+            # into the storage contract with the owner acting as main.
+            self.call("bootstrap1", "RegistrarStorage", "upgradeMainContractAddress", {"_mainContractAddress": self.owner})
+            self.call_batch("bootstrap1", "RegistrarStorage", "registerRegistrar", [
+                {"_registrar": michelson.make_address(("registrar", i)), "_registrarName": "fillreg%08d" % i}
+                for i in range(self.filled["registrars"], size)
+            ])
+            self.call("bootstrap1", "RegistrarStorage", "upgradeMainContractAddress", {"_mainContractAddress": self.addresses["RegistrarMain"]})
+            self.filled["registrars"] = size
+        if self.filled["safleIds"] < size:
+            items = [
+                {"_userAddress": michelson.make_address(("user", i)), "_safleId": "filluser%08d" % i}
+                for i in range(self.filled["safleIds"], size)
+            ]
+            self.call_batch(self.registrar, "RegistrarMain", "registerSafleIds", [
+                {"_safleIds": items[start:start + BATCH_ITEMS]} for start in range(0, len(items), BATCH_ITEMS)
+            ])
+            self.filled["safleIds"] = size
+        if self.filled["coinAddresses"] < size:
+            self.call_batch(self.registrar, "RegistrarMain", "registerCoinAddress", [
+                {"_userAddress": michelson.make_address(("user", i)), "_index": 1, "_address": "filladdr" + letters(i)}
+                for i in range(self.filled["coinAddresses"], size)
+            ])
+            self.filled["coinAddresses"] = size
+        while self.filled["auctions"] < size:
+            self.start_auction(self.account())
+            self.filled["auctions"] += 1
+        while self.filled["bids"] < size:
+            self.bid(self.account(), self.bench_auction)
+            self.filled["bids"] += 1
+
+    # -- measuring -----------------------------------------------------
+
+    def probe(self, contract, view):
+        """Contract calling ``view`` on-chain, so its gas shows in a receipt."""
+        key = (contract, view)
+        if key not in self.probes:
+            input_type, output_type, _ = self.scripts[contract]["views"][view]
+            parameter = {"prim": "pair", "args": [input_type, {"prim": "address"}]}
+            code = [
+                {"prim": "UNPAIR"}, {"prim": "UNPAIR"},
+                {"prim": "VIEW", "args": [{"string": view}, output_type]},
+                {"prim": "DROP"}, {"prim": "NIL", "args": [{"prim": "operation"}]}, {"prim": "PAIR"},
+            ]
+            script = "parameter %s ;\nstorage unit ;\ncode %s ;" % (
+                michelson.to_text(parameter), michelson.to_text(code))
+            address = self.client.originate("probe_%s_%s" % (contract, view), script, "Unit")
+            self.probes[key] = (address, parameter)
+        return self.probes[key]
+
+    def view(self, contract, view, value):
+        address, parameter = self.probe(contract, view)
+        arg = michelson.to_text(michelson.encode(parameter, (value, self.addresses[contract])))
+        results = self.client.transfer("bootstrap1", address, None, arg)
+        # The probe's own instructions are a small constant on top of the view.
+        return [("%s.%s" % (contract, view), sum(r.consumed_gas for r in results), None, 0)]
+
+    def measure(self):
+        """Call every entry point and view once; return name -> figures."""
+        measured = {}
+        for case in CASES:
+            for name, gas, storage_size, paid in case(self):
+                entry = measured.setdefault(name, dict(gas=0.0, storage_bytes=storage_size, paid_storage_diff=0))
+                entry["gas"] = max(entry["gas"], gas)
+                entry["paid_storage_diff"] = max(entry["paid_storage_diff"], paid)
+                if storage_size is not None:
+                    entry["storage_bytes"] = storage_size
+        return measured
+
+    def operations(self, results):
+        """Flatten receipts to (Contract.entrypoint, gas, storage, paid) rows."""
+        rows = []
+        for result in results:
+            name = self.aliases.get(result.destination)
+            if name is None:
+                continue
+            rows.append(("%s.%s" % (name, result.entrypoint), result.consumed_gas, result.storage_size, result.paid_storage_diff))
+        return rows
+
+
+def _owner_calls(bench):
+    rows = []
+    rows += bench.operations(bench.call("bootstrap1", "RegistrarMain", "setSafleIdFees", {"_amount": 0}))
+    rows += bench.operations(bench.call("bootstrap1", "RegistrarMain", "setRegistrarFees", {"_amount": 0}))
+    rows += bench.operations(bench.call("bootstrap1", "RegistrarMain", "toggleRegistrationStatus", None))
+    bench.call("bootstrap1", "RegistrarMain", "toggleRegistrationStatus", None)
+    if "withdrawFees" in michelson.entrypoints(bench.scripts["RegistrarMain"]["parameter"]):
+        rows += bench.operations(bench.call("bootstrap1", "RegistrarMain", "setFeeSweepThreshold", {"_amount": 0}))
+        # Fees are 0 here: a SafleID registered with a 1 mutez fee gives
+        # withdrawFees something to withdraw, and tez sent where no fee is
+        # due gives withdrawExcessBalance its excess.
+        bench.call("bootstrap1", "RegistrarMain", "setSafleIdFees", {"_amount": 1})
+        bench.register_safle_id(bench.client.address(bench.account()), fee=1)
+        bench.call("bootstrap1", "RegistrarMain", "setSafleIdFees", {"_amount": 0})
+        rows += bench.operations(bench.call("bootstrap1", "RegistrarMain", "withdrawFees", None))
+        if "withdrawExcessBalance" in michelson.entrypoints(bench.scripts["RegistrarMain"]["parameter"]):
+            bench.call("bootstrap1", "RegistrarMain", "toggleRegistrationStatus", None, amount=1)
+            bench.call("bootstrap1", "RegistrarMain", "toggleRegistrationStatus", None)
+            rows += bench.operations(bench.call("bootstrap1", "RegistrarMain", "withdrawExcessBalance", None))
+    rows += bench.operations(bench.call("bootstrap1", "RegistrarMain", "updateWalletAddress", {"_walletAddress": bench.wallet}))
+    rows += bench.operations(bench.call("bootstrap1", "RegistrarMain", "setStorageContract", {"_registrarStorageContract": bench.addresses["RegistrarStorage"]}))
+    rows += bench.operations(bench.call("bootstrap1", "RegistrarStorage", "setAuctionContract", {"_auctionAddress": bench.addresses["Auction"]}))
+    rows += bench.operations(bench.call("bootstrap1", "RegistrarStorage", "upgradeMainContractAddress", {"_mainContractAddress": bench.addresses["RegistrarMain"]}))
+    entrypoints = michelson.entrypoints(bench.scripts["RegistrarStorage"]["parameter"])
+    if "importRegistry" in entrypoints:
+        chunk = dict((name, []) for name in migrate.record_fields(entrypoints["importRegistry"]))
+        chunk["coinAddressToSafleId"] = [
+            ("importaddr" + letters(bench.fresh("importedCoin")), "filluser%08d" % 0) for _ in range(BATCH_ITEMS)
+        ]
+        rows += [(name + "[%d]" % BATCH_ITEMS, gas, size, paid)
+                 for name, gas, size, paid in bench.operations(bench.call("bootstrap1", "RegistrarStorage", "importRegistry", chunk))]
+        # Sealing is final, so it is measured on a copy of its own.
+        sealed = bench.originate_contract("RegistrarStorage", "sealed%d" % bench.fresh("sealed"), contractOwner=bench.owner)
+        results = bench.client.transfer("bootstrap1", sealed, "sealImport", bench.arg(
+            "RegistrarStorage", "sealImport", {"_totalRegistrars": bench.filled["registrars"], "_totalSafleIdRegistered": bench.filled["safleIds"]}
+        ))
+        rows += bench.operations(results)
+    return rows
+
+
+def _registrar_calls(bench):
+    alias = bench.account()
+    rows = bench.operations(bench.call(alias, "RegistrarMain", "registerRegistrar", {"_registrarName": "newreg%08d" % bench.fresh("registrar")}))
+    rows += bench.operations(bench.call(alias, "RegistrarMain", "updateRegistrar", {"_registrarName": "newreg%08d" % bench.fresh("registrar")}))
+    bench.last_updated_registrar = alias
+    index = bench.fresh("coinIndex")
+    rows += bench.operations(bench.call(bench.registrar, "RegistrarMain", "mapCoins", {"_blockchainName": "chain" + letters(index), "_aliasName": "c" + letters(index), "_indexNumber": index}))
+    return rows
+
+
+def _safle_id_calls(bench):
+    user = michelson.make_address(("measured", bench.fresh("measuredUser")))
+    rows = bench.operations(bench.call(bench.registrar, "RegistrarMain", "registerSafleId", {"_safleId": "measured%08d" % bench.fresh("safleId"), "_userAddress": user}))
+    rows += bench.operations(bench.call(bench.registrar, "RegistrarMain", "updateSafleId", {"_newSafleId": "measured%08d" % bench.fresh("safleId"), "_userAddress": user}))
+    bench.last_updated_user = user
+    rows += bench.operations(bench.call(bench.registrar, "RegistrarMain", "registerCoinAddress", {"_userAddress": user, "_index": 1, "_address": "coin" + letters(bench.fresh("coin"))}))
+    rows += bench.operations(bench.call(bench.registrar, "RegistrarMain", "updateCoinAddress", {"_userAddress": user, "_index": 1, "_address": "coin" + letters(bench.fresh("coin"))}))
+    rows += bench.operations(bench.call(bench.registrar, "RegistrarMain", "registerCoinAddresses", {"_userAddress": user, "_addresses": {1: "coin" + letters(bench.fresh("coin"))}}))
+    rows += bench.operations(bench.call(bench.registrar, "RegistrarMain", "updateCoinAddresses", {"_userAddress": user, "_addresses": {1: "coin" + letters(bench.fresh("coin"))}}))
+    items = [
+        {"_userAddress": michelson.make_address(("measured", bench.fresh("measuredUser"))), "_safleId": "measured%08d" % bench.fresh("safleId")}
+        for _ in range(10)
+    ]
+    rows += [(name + "[10]" if name.endswith("registerSafleIds") else name, gas, size, paid)
+             for name, gas, size, paid in bench.operations(bench.call(bench.registrar, "RegistrarMain", "registerSafleIds", {"_safleIds": items}))]
+    return rows
+
+
+def _auction_calls(bench):
+    conductor = bench.account()
+    auction = bench.start_auction(conductor)
+    rows = bench.operations(auction["results"])
+    loser, winner = bench.account(), bench.account()
+    rows += bench.operations(bench.bid(loser, auction))
+    bench.bid(winner, auction)
+    rows += bench.operations(bench.call(conductor, "Auction", "settleAuction", None))
+    rows += bench.operations(bench.call(loser, "Auction", "withdrawBid", {"_auctionId": auction["id"]}))
+    owner = bench.account()
+    owned = bench.register_safle_id(bench.client.address(owner))
+    rows += bench.operations(bench.call(owner, "Auction", "directlyTransferSafleId", {"_safleId": owned, "_newOwner": michelson.make_address(("receiver", owned))}))
+    expired = bench.expiring_auction
+    if expired is not None:
+        # Block times follow the clock: wait until the auction started at the
+        # previous size has ended, which filling has mostly taken care of.
+        bench.expiring_auction = bench.start_expiring_auction()
+        time.sleep(max(0, expired["ends"] + 5 - time.time()))
+        rows += bench.operations(bench.call("bootstrap1", "Auction", "settleExpiredAuctions", {"_auctionIds": [expired["id"]]}))
+    return rows
+
+
+def _view_calls(bench):
+    auction = bench.bench_auction
+    conductor = bench.client.address(auction["conductor"])
+    rows = []
+    rows += bench.view("RegistrarStorage", "resolveRegistrarName", {"_name": "benchregistrar"})
+    rows += bench.view("RegistrarStorage", "resolveSafleId", {"_safleId": "filluser%08d" % 0})
+    rows += bench.view("RegistrarStorage", "coinAddressToId", {"_address": "filladdr" + letters(0)})
+    rows += bench.view("RegistrarStorage", "idToCoinAddress", {"_safleId": "filluser%08d" % 0, "_index": 1})
+    rows += bench.view("RegistrarStorage", "oldSafleIdsOf", {"_userAddress": bench.last_updated_user, "_offset": 0, "_limit": 10})
+    rows += bench.view("RegistrarStorage", "oldRegistrarNamesOf", {"_registrar": bench.client.address(bench.last_updated_registrar), "_offset": 0, "_limit": 10})
+    if "accountOf" in bench.scripts["RegistrarStorage"]["views"]:
+        rows += bench.view("RegistrarStorage", "accountOf", {"_address": bench.last_updated_user})
+    if "resolveSafleIds" in bench.scripts["RegistrarStorage"]["views"]:
+        names = ["filluser%08d" % i for i in range(BATCH_ITEMS)] + ["missing"]
+        rows += bench.view("RegistrarStorage", "resolveSafleIds", {"_safleIds": names})
+    if "coinAddressesToIds" in bench.scripts["RegistrarStorage"]["views"]:
+        addresses = ["filladdr" + letters(i) for i in range(BATCH_ITEMS)] + ["missing"]
+        rows += bench.view("RegistrarStorage", "coinAddressesToIds", {"_addresses": addresses})
+        coins = [{"_safleId": "filluser%08d" % i, "_index": 1} for i in range(BATCH_ITEMS)] + [{"_safleId": "missing", "_index": 1}]
+        rows += bench.view("RegistrarStorage", "idsToCoinAddresses", {"_coins": coins})
+    if "nameStatus" in bench.scripts["RegistrarStorage"]["views"]:
+        rows += bench.view("RegistrarStorage", "nameStatus", {"_name": auction["safleId"]})
+        names = ["filluser%08d" % i for i in range(BATCH_ITEMS)] + ["benchregistrar", "missing"]
+        rows += bench.view("RegistrarStorage", "nameStatuses", {"_names": names})
+    rows += bench.view("Auction", "arrayOfbidders", {"_auctioner": conductor})
+    rows += bench.view("Auction", "getBidRate", {"_auctioner": conductor, "_bidder": bench.client.address(auction["bidders"][0])})
+    if "expiringAuctionCount" in bench.scripts["Auction"]["views"]:
+        rows += bench.view("Auction", "expiringAuctionCount", {"_bucket": int(auction["ends"]) // AUCTION_BUCKET_SECONDS})
+    return rows
+
+
+CASES = [_owner_calls, _registrar_calls, _safle_id_calls, _auction_calls, _view_calls]
+
+
+def run(sizes, build_dir=michelson.BUILD_DIR, client=None):
+    client = client or OctezClient()
+    try:
+        bench = Bench(client, build_dir)
+        bench.originate()
+        report = dict(sizes=sizes, results={}, storage={})
+        for size in sizes:
+            bench.fill(size)
+            for name, figures in bench.measure().items():
+                report["results"].setdefault(name, {})[str(size)] = figures
+            for name in CONTRACTS:
+                used = client.storage_used_space(bench.addresses[name])
+                report["storage"].setdefault(name, {})[str(size)] = used if used is not None else bench.storage_sizes.get(name)
+        return report
+    finally:
+        client.close()
+
+
+def load_budgets(path=DEFAULT_BUDGETS):
+    with open(path) as f:
+        return json.load(f)
+
+
+def budget_for(budgets, name):
+    budget = dict(budgets.get("default", {}))
+    budget.update(budgets.get("entries", {}).get(name, {}))
+    return budget
+
+
+def check(report, budgets, baseline=None):
+    """Return a list of human readable budget violations."""
+    violations = []
+    for name, by_size in sorted(report["results"].items()):
+        budget = budget_for(budgets, name)
+        sizes = sorted(by_size, key=int)
+        smallest, largest = by_size[sizes[0]]["gas"], by_size[sizes[-1]]["gas"]
+        max_growth = budget.get("max_growth")
+        if max_growth is not None and smallest > 0 and largest > smallest * max_growth:
+            violations.append("%s: gas grows %.2fx from N=%s to N=%s (budget %.2fx)" % (
+                name, largest / smallest, sizes[0], sizes[-1], max_growth))
+        max_gas = budget.get("max_gas")
+        if max_gas is not None and largest > max_gas:
+            violations.append("%s: %.0f gas at N=%s (budget %s)" % (name, largest, sizes[-1], max_gas))
+        max_regression = budget.get("max_regression")
+        if baseline is None or max_regression is None:
+            continue
+        for size in sizes:
+            old = baseline.get("results", {}).get(name, {}).get(size)
+            if old is None or old["gas"] <= 0:
+                continue
+            new = by_size[size]["gas"]
+            if new > old["gas"] * (1 + max_regression):
+                violations.append("%s: %.0f gas at N=%s, baseline %.0f (+%.1f%%, budget %.1f%%)" % (
+                    name, new, size, old["gas"], 100.0 * (new / old["gas"] - 1), 100.0 * max_regression))
+    return violations
+
+
+def compare(old, new):
+    """Rows of (name, size, old gas, new gas, ratio) for results in both reports."""
+    rows = []
+    for name in sorted(set(old["results"]) | set(new["results"])):
+        old_sizes = old["results"].get(name, {})
+        new_sizes = new["results"].get(name, {})
+        for size in sorted(set(old_sizes) | set(new_sizes), key=int):
+            before = old_sizes.get(size, {}).get("gas")
+            after = new_sizes.get(size, {}).get("gas")
+            ratio = after / before if before and after is not None else None
+            rows.append((name, size, before, after, ratio))
+    return rows
+
+
+def format_compare(rows):
+    lines = ["%-48s %8s %12s %12s %8s" % ("entry point", "N", "old gas", "new gas", "ratio")]
+    for name, size, before, after, ratio in rows:
+        lines.append("%-48s %8s %12s %12s %8s" % (
+            name, size,
+            "-" if before is None else "%.0f" % before,
+            "-" if after is None else "%.0f" % after,
+            "-" if ratio is None else "%.2f" % ratio))
+    return "\n".join(lines)
+
+
+def build_revision(revision, directory):
+    """Check ``revision`` out into ``directory`` and compile it; return its build dir."""
+    subprocess.check_call(["git", "worktree", "add", "--detach", directory, revision])
+    subprocess.check_call(["./compile.sh", "--no-html", "--force"] + CONTRACTS, cwd=directory)
+    return os.path.join(directory, "build")
+
+
+def run_revisions(old, new, sizes, endpoint=None):
+    """Benchmark two git revisions; return their (old, new) reports."""
+    reports = []
+    for revision in (old, new):
+        directory = tempfile.mkdtemp(prefix="safle-bench-")
+        shutil.rmtree(directory)
+        try:
+            build_dir = build_revision(revision, directory)
+            client = OctezClient(endpoint=endpoint) if endpoint else None
+            report = run(sizes, build_dir, client)
+            report["revision"] = revision
+            reports.append(report)
+        finally:
+            subprocess.call(["git", "worktree", "remove", "--force", directory])
+    return tuple(reports)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    run_parser = commands.add_parser("run", help="run the benchmark and check budgets")
+    run_parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES))
+    run_parser.add_argument("--build-dir", default=michelson.BUILD_DIR)
+    run_parser.add_argument("--output", default=DEFAULT_REPORT)
+    run_parser.add_argument("--budgets", default=DEFAULT_BUDGETS)
+    run_parser.add_argument("--baseline", help="previous report to check regressions against")
+    run_parser.add_argument("--endpoint", help="use a node instead of the mockup")
+    compare_parser = commands.add_parser("compare", help="compare the gas of two reports")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    revisions_parser = commands.add_parser("revisions", help="benchmark and compare two git revisions")
+    revisions_parser.add_argument("old")
+    revisions_parser.add_argument("new")
+    revisions_parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES))
+    revisions_parser.add_argument("--output-dir", default=michelson.BUILD_DIR)
+    revisions_parser.add_argument("--endpoint", help="use a node instead of the mockup")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        print(format_compare(compare(old, new)))
+        return 0
+    if args.command == "revisions":
+        sizes = [int(size) for size in args.sizes.split(",")]
+        old, new = run_revisions(args.old, args.new, sizes, args.endpoint)
+        for name, report in (("old", old), ("new", new)):
+            path = os.path.join(args.output_dir, "benchmark_%s.json" % name)
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            print("%s report (%s) written to %s" % (name, report["revision"], path))
+        print(format_compare(compare(old, new)))
+        return 0
+    if args.command != "run":
+        parser.print_help()
+        return 2
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    client = OctezClient(endpoint=args.endpoint) if args.endpoint else None
+    report = run(sizes, args.build_dir, client)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Report written to %s" % args.output)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    violations = check(report, load_budgets(args.budgets), baseline)
+    for violation in violations:
+        print("BUDGET " + violation)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Code size of the contracts compiled into ``build/``.
+
+Sizes are those of the Micheline binary encoding the node stores and
+charges for: the script (parameter, storage type, code and views) and the
+initial storage. Every byte of the script is paid at origination and the
+script is read again on every call, so it is reported per section:
+
+    python -m tools.codesize                        # every contract in build/
+    python -m tools.codesize RegistrarMain Auction
+
+``compile.sh`` prints this report after a build. The sizes are also written
+to ``build/codesize.json``; the next run prints the change against it.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from tools import michelson
+
+DEFAULT_REPORT = os.path.join(michelson.BUILD_DIR, "codesize.json")
+
+# Storage burn per byte, in mutez.
+COST_PER_BYTE = 250
+
+# Michelson primitives in the order of their binary tags.
+PRIMITIVES = [
+    "parameter", "storage", "code", "False", "Elt", "Left", "None", "Pair", "Right", "Some", "True", "Unit",
+    "PACK", "UNPACK", "BLAKE2B", "SHA256", "SHA512", "ABS", "ADD", "AMOUNT", "AND", "BALANCE", "CAR", "CDR",
+    "CHECK_SIGNATURE", "COMPARE", "CONCAT", "CONS", "CREATE_ACCOUNT", "CREATE_CONTRACT", "IMPLICIT_ACCOUNT",
+    "DIP", "DROP", "DUP", "EDIV", "EMPTY_MAP", "EMPTY_SET", "EQ", "EXEC", "FAILWITH", "GE", "GET", "GT",
+    "HASH_KEY", "IF", "IF_CONS", "IF_LEFT", "IF_NONE", "INT", "LAMBDA", "LE", "LEFT", "LOOP", "LSL", "LSR",
+    "LT", "MAP", "MEM", "MUL", "NEG", "NEQ", "NIL", "NONE", "NOT", "NOW", "OR", "PAIR", "PUSH", "RIGHT",
+    "SIZE", "SOME", "SOURCE", "SENDER", "SELF", "STEPS_TO_QUOTA", "SUB", "SWAP", "TRANSFER_TOKENS",
+    "SET_DELEGATE", "UNIT", "UPDATE", "XOR", "ITER", "LOOP_LEFT", "ADDRESS", "CONTRACT", "ISNAT", "CAST",
+    "RENAME", "bool", "contract", "int", "key", "key_hash", "lambda", "list", "map", "big_map", "nat",
+    "option", "or", "pair", "set", "signature", "string", "bytes", "mutez", "timestamp", "unit",
+    "operation", "address", "SLICE", "DIG", "DUG", "EMPTY_BIG_MAP", "APPLY", "chain_id", "CHAIN_ID",
+    "LEVEL", "SELF_ADDRESS", "never", "NEVER", "UNPAIR", "VOTING_POWER", "TOTAL_VOTING_POWER", "KECCAK",
+    "SHA3", "PAIRING_CHECK", "bls12_381_g1", "bls12_381_g2", "bls12_381_fr", "sapling_state",
+    "sapling_transaction_deprecated", "SAPLING_EMPTY_STATE", "SAPLING_VERIFY_UPDATE", "ticket",
+    "TICKET_DEPRECATED", "READ_TICKET", "SPLIT_TICKET", "JOIN_TICKETS", "GET_AND_UPDATE", "chest",
+    "chest_key", "OPEN_CHEST", "VIEW", "view", "constant", "SUB_MUTEZ", "tx_rollup_l2_address",
+    "MIN_BLOCK_TIME", "sapling_transaction", "EMIT", "Lambda_rec", "LAMBDA_REC", "TICKET", "BYTES", "NAT",
+]
+PRIMITIVE_TAGS = dict((prim, tag) for tag, prim in enumerate(PRIMITIVES))
+
+
+def _length_prefixed(data):
+    return len(data).to_bytes(4, "big") + data
+
+
+def _zarith(value):
+    magnitude = abs(value)
+    out = bytearray([(magnitude & 0x3F) | (0x40 if value < 0 else 0)])
+    magnitude >>= 6
+    while magnitude:
+        out[-1] |= 0x80
+        out.append(magnitude & 0x7F)
+        magnitude >>= 7
+    return bytes(out)
+
+
+def encode(node):
+    """Binary encoding of a Micheline JSON expression (``PACK`` without the 0x05 prefix)."""
+    if isinstance(node, list):
+        return b"\x02" + _length_prefixed(b"".join(encode(item) for item in node))
+    if "int" in node:
+        return b"\x00" + _zarith(int(node["int"]))
+    if "string" in node:
+        return b"\x01" + _length_prefixed(node["string"].encode())
+    if "bytes" in node:
+        return b"\x0a" + _length_prefixed(bytes.fromhex(node["bytes"]))
+    if node["prim"] not in PRIMITIVE_TAGS:
+        # e.g. the ERROR nodes SmartPy leaves where it could not compile a type.
+        raise michelson.MichelsonError("Unknown primitive %s" % node["prim"])
+    prim = bytes([PRIMITIVE_TAGS[node["prim"]]])
+    args = node.get("args", [])
+    annots = " ".join(node.get("annots", [])).encode()
+    if len(args) <= 2:
+        tag = 3 + 2 * len(args) + (1 if annots else 0)
+        body = prim + b"".join(encode(arg) for arg in args)
+        return bytes([tag]) + body + (_length_prefixed(annots) if annots else b"")
+    return b"\x09" + prim + _length_prefixed(b"".join(encode(arg) for arg in args)) + _length_prefixed(annots)
+
+
+def contract_size(name, build_dir=michelson.BUILD_DIR):
+    """Sizes in bytes of the script of ``build/<name>.json``, its sections and its initial storage."""
+    with open(os.path.join(build_dir, "%s.json" % name)) as f:
+        script = json.load(f)
+    sections = {}
+    for section in script:
+        if section["prim"] == "view":
+            key = "view %s" % section["args"][0]["string"]
+        else:
+            key = section["prim"]
+        sections[key] = len(encode(section))
+    size = dict(script=len(encode(script)), sections=sections)
+    storage_path = os.path.join(build_dir, "%s_storage.json" % name)
+    if os.path.exists(storage_path):
+        size["storage"] = len(encode(michelson.load_storage(name, build_dir)))
+    return size
+
+
+def built_contracts(build_dir=michelson.BUILD_DIR):
+    return sorted(
+        f[:-len(".json")] for f in os.listdir(build_dir)
+        if f.endswith(".json") and not f.endswith("_storage.json") and os.path.exists(os.path.join(build_dir, f[:-len(".json")] + "_storage.json"))
+    )
+
+
+def delta(new, old):
+    if old is None or old == new:
+        return ""
+    return " (%+d)" % (new - old)
+
+
+def print_report(sizes, previous):
+    for name in sorted(sizes):
+        size, old = sizes[name], previous.get(name, {})
+        storage = size.get("storage", 0)
+        burn = (size["script"] + storage) * COST_PER_BYTE
+        print("%s: script %d bytes%s, initial storage %d bytes, origination burn ~%d.%06d tez" % (
+            name, size["script"], delta(size["script"], old.get("script")), storage, burn // 10 ** 6, burn % 10 ** 6
+        ))
+        for section, section_size in sorted(size["sections"].items(), key=lambda item: -item[1]):
+            print("  %-30s %8d%s" % (section, section_size, delta(section_size, old.get("sections", {}).get(section))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("contracts", nargs="*", help="contracts in build/ (default: all)")
+    parser.add_argument("--build-dir", default=michelson.BUILD_DIR)
+    parser.add_argument("--report", default=DEFAULT_REPORT, help="where sizes are kept between runs")
+    args = parser.parse_args(argv)
+
+    names = args.contracts or built_contracts(args.build_dir)
+    sizes = {}
+    status = 0
+    for name in names:
+        try:
+            sizes[name] = contract_size(name, args.build_dir)
+        except michelson.MichelsonError as e:
+            print("%s: cannot be measured: %s" % (name, e))
+            status = 1
+    previous = {}
+    if os.path.exists(args.report):
+        with open(args.report) as f:
+            previous = json.load(f)
+    print_report(sizes, previous)
+    previous.update(sizes)
+    with open(args.report, "w") as f:
+        json.dump(previous, f, indent=2, sort_keys=True)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,562 @@
+"""Static cost profile of the contracts compiled into ``build/``.
+
+The Michelson of each contract is walked once with an abstract stack that
+remembers where values come from: the parameter, a storage field, a lambda
+or the length of one of those. That is enough to split the code by entry
+point and view, to name the inlined CheckingContract lambdas and to report
+for each of them:
+
+- the number of instructions;
+- the loops, and what bounds them: the length of the input, a storage
+  field, or something else;
+- the constants pushed, with their size;
+- the storage fields read and written;
+- the lambdas executed.
+
+Hot spots are flagged: loops over a storage field (their cost grows with
+the registry), nested loops, looping lambdas executed inside a loop, big
+constants (the script is parsed again on every call) and lambdas whose
+code is inlined more than once.
+
+    python -m tools.costprofile                       # every contract in build/
+    python -m tools.costprofile RegistrarMain --check
+
+``compile.sh`` prints this report after a build. The profile is also
+written to ``build/costprofile.json``; the next run prints the change
+against it, and ``--check`` fails when an entry point grew by more than
+``--tolerance`` percent of instructions or got a new hot spot.
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import sys
+
+from tools import codesize, michelson
+
+DEFAULT_REPORT = os.path.join(michelson.BUILD_DIR, "costprofile.json")
+
+# Pushed constants of at least this many bytes are hot spots.
+BIG_CONSTANT = 128
+
+DEFAULT_TOLERANCE = 5.0
+
+# Lambdas are recognised by their result type and strings only they contain,
+# most specific first: isSafleIdValid and normalizeSafleId also fail with the
+# message of checkAlphaNumeric.
+LAMBDAS = [
+    ("normalizeSafleId", "string", ["SafleId length should be greater than 3 characters"]),
+    ("isSafleIdValid", "unit", ["SafleId length should be greater than 3 characters"]),
+    ("checkAlphaNumeric", "unit", ["Only alphanumeric allowed in blockchain name and alias name"]),
+    ("toLower", "string", ["A", "a", "Z", "z"]),
+    ("isContract", "bool", ["tz1Ke2h7sDdakHJQh8WX4Z372du1KChsksyU"]),
+]
+
+NULLARY = {
+    "UNIT", "NONE", "NIL", "EMPTY_SET", "EMPTY_MAP", "EMPTY_BIG_MAP", "AMOUNT", "BALANCE", "NOW", "SENDER",
+    "SOURCE", "SELF", "SELF_ADDRESS", "CHAIN_ID", "LEVEL", "TOTAL_VOTING_POWER", "MIN_BLOCK_TIME", "SAPLING_EMPTY_STATE",
+}
+UNARY = {
+    "SOME", "LEFT", "RIGHT", "NOT", "NEG", "ABS", "ISNAT", "INT", "NAT", "BYTES", "EQ", "NEQ", "LT", "GT", "LE",
+    "GE", "SIZE", "PACK", "UNPACK", "BLAKE2B", "SHA256", "SHA512", "KECCAK", "SHA3", "HASH_KEY", "ADDRESS",
+    "CONTRACT", "IMPLICIT_ACCOUNT", "SET_DELEGATE", "VOTING_POWER", "CAST", "RENAME", "EMIT", "JOIN_TICKETS",
+    "PAIRING_CHECK",
+}
+BINARY = {
+    "ADD", "SUB", "SUB_MUTEZ", "MUL", "EDIV", "AND", "OR", "XOR", "LSL", "LSR", "COMPARE", "CONS", "MEM",
+    "GET", "EXEC", "APPLY", "VIEW", "TICKET", "SPLIT_TICKET", "SAPLING_VERIFY_UPDATE",
+}
+TERNARY = {"UPDATE", "SLICE", "TRANSFER_TOKENS", "CHECK_SIGNATURE", "OPEN_CHEST"}
+LOOPS = {"LOOP", "LOOP_LEFT", "ITER", "MAP"}
+
+FAILED = None
+
+
+class Value(object):
+    """What the analysis knows about a stack element.
+
+    ``source`` is "parameter" or "storage" for (parts of) those, with their
+    type in ``ty`` and, for storage, the field they belong to and the fields
+    changed in them (``written``). ``origin`` says what a computed value
+    derives from and ``bound`` what a length counts.
+    """
+
+    def __init__(self, source=None, ty=None, field=None, parent=None, side=None, origin=None, bound=None, lam=None, written=frozenset()):
+        self.source = source
+        self.ty = ty
+        self.field = field
+        self.parent = parent
+        self.side = side
+        self.origin = origin
+        self.bound = bound
+        self.lam = lam
+        self.written = written
+
+    def describe(self):
+        if self.source == "storage" and self.field is not None:
+            return "storage %s" % self.field
+        return self.origin
+
+    def changed(self, fields):
+        """This part of the storage with ``fields`` changed."""
+        return Value(self.source, self.ty, self.field, self.parent, self.side, self.origin, written=self.written | fields)
+
+
+def binary_pairs(ty):
+    """``ty`` with n-ary pairs folded to binary ones, built once so that nodes can be compared by identity."""
+    if isinstance(ty, dict) and ty.get("prim") == "pair":
+        return dict(ty, args=[binary_pairs(arg) for arg in michelson.pair_args(ty)])
+    if isinstance(ty, dict) and ty.get("prim") in ("or", "option"):
+        return dict(ty, args=[binary_pairs(arg) for arg in ty["args"]])
+    return ty
+
+
+def strings(node):
+    if isinstance(node, list):
+        return set().union(*[strings(item) for item in node]) if node else set()
+    found = {node["string"]} if "string" in node else set()
+    for arg in node.get("args", []):
+        found |= strings(arg)
+    return found
+
+
+def lambda_name(result_type, body):
+    contained = strings(body)
+    for name, result, required in LAMBDAS:
+        if result_type.get("prim") == result and all(s in contained for s in required):
+            return name
+    return "lambda_%s" % hashlib.sha1(codesize.encode(body)).hexdigest()[:8]
+
+
+class Unit(object):
+    """Profile of an entry point, a view, a lambda or the shared dispatch code."""
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.instructions = 0
+        self.loops = []
+        self.constants = []
+        self.reads = set()
+        self.writes = set()
+        self.calls = collections.Counter()
+        self.calls_in_loops = set()
+        self.copies = 1
+
+    @property
+    def key(self):
+        return self.name if self.kind == "dispatch" else "%s %s" % (self.kind, self.name)
+
+    def as_dict(self):
+        return {
+            "instructions": self.instructions,
+            "loops": self.loops,
+            "constants": self.constants,
+            "reads": sorted(self.reads),
+            "writes": sorted(self.writes),
+            "calls": dict(self.calls),
+            "copies": self.copies,
+        }
+
+
+# Instructions whose result is a changed version of an operand (by position)
+# rather than something read from it; None: of whichever operand is storage.
+MODIFYING = {
+    "UPDATE": 2, "GET_AND_UPDATE": 2, "CONS": 1,
+    "ADD": None, "SUB": None, "SUB_MUTEZ": None, "MUL": None, "AND": None, "OR": None, "XOR": None, "NOT": None, "NEG": None,
+}
+
+
+def fields_under(ty):
+    """Top-level storage fields within the (unannotated) pair node ``ty``."""
+    name = michelson.annotation(ty)
+    if name is not None:
+        return frozenset([name])
+    if ty.get("prim") == "pair":
+        return fields_under(ty["args"][0]) | fields_under(ty["args"][1])
+    return frozenset()
+
+
+class Profiler(object):
+    def __init__(self):
+        self.units = {}
+        self.unit = None
+        self.depth = 0
+        # What bounds each loop around the current instruction.
+        self.bounds = ()
+        self.storage = None
+
+    # -- units ---------------------------------------------------------
+
+    def run(self, unit, code, stack):
+        saved = self.unit, self.depth
+        self.unit, self.depth = self.units.setdefault(unit.key, unit), 0
+        stack = self.block(code, stack)
+        if stack is not FAILED and unit.kind in ("dispatch", "entrypoint"):
+            # Fields changed in the storage the code leaves on the stack.
+            for value in stack:
+                if value.source == "storage" and value.ty is self.storage:
+                    self.unit.writes |= value.written
+        elif stack is not FAILED and unit.kind == "view":
+            self.consume(stack)
+        self.unit, self.depth = saved
+        return stack
+
+    def profile(self, script):
+        """Walk the code and the views of ``script`` as loaded by :func:`michelson.load_contract`."""
+        parameter = binary_pairs(script["parameter"])
+        self.storage = binary_pairs(script["storage"])
+        root = Value("root", {"prim": "pair", "args": [parameter, self.storage]}, origin="input")
+        self.run(Unit("dispatch", "dispatch"), script["code"], [root])
+        for name, (input_type, _, code) in sorted(script["views"].items()):
+            root = Value("root", {"prim": "pair", "args": [binary_pairs(input_type), self.storage]}, origin="input")
+            self.run(Unit("view", name), code, [root])
+        return self.units
+
+    # -- stack helpers -------------------------------------------------
+
+    def pop(self, stack):
+        return stack.pop() if stack else Value()
+
+    def child(self, value, side):
+        if value.source in ("root", "storage", "parameter") and value.ty and value.ty.get("prim") == "pair":
+            ty = value.ty["args"][side]
+            if value.source == "root":
+                source, field = ("parameter", None) if side == 0 else ("storage", None)
+            else:
+                source, field = value.source, value.field
+            if source == "storage" and field is None:
+                field = michelson.annotation(ty)
+            written = value.written if value.field is not None else value.written & fields_under(ty)
+            return Value(source, ty, field, value, side, value.origin if source == "parameter" else None, written=written)
+        return Value(origin=value.describe(), bound=value.bound)
+
+    def get_n(self, value, n):
+        while n >= 2:
+            value, n = self.child(value, 1), n - 2
+        return self.child(value, 0) if n == 1 else value
+
+    def consume(self, values):
+        """Record the storage fields ``values`` read when an instruction uses them up."""
+        for value in values:
+            if value.source == "storage" and value.field is not None:
+                self.unit.reads.add(value.field)
+
+    def result(self, values, **kwargs):
+        origin = next((v.describe() for v in values if v.describe() is not None), None)
+        bound = next((v.bound for v in values if v.bound is not None), None)
+        return Value(origin=origin, bound=bound, **kwargs)
+
+    def compute(self, prim, values):
+        """Result of a generic instruction on ``values`` (top first)."""
+        position = MODIFYING.get(prim, -1)
+        if position is None:
+            position = next((i for i, v in enumerate(values) if v.source == "storage" and v.field is not None), -1)
+        target = values[position] if 0 <= position < len(values) else None
+        self.consume([v for v in values if v is not target])
+        if target is not None and target.source == "storage" and target.field is not None:
+            return target.changed(frozenset([target.field]))
+        if prim == "CONS":
+            # A list grows with the loop it is built in.
+            return Value(ty=values[1].ty, origin=values[1].origin or (self.bounds[-1] if self.bounds else None))
+        return self.result(values)
+
+    # -- walking -------------------------------------------------------
+
+    def block(self, code, stack):
+        for instruction in code:
+            if stack is FAILED:
+                break
+            stack = self.instruction(instruction, stack)
+        return stack
+
+    def branch(self, code, stack, unit=None):
+        if unit is None:
+            return self.block(code, list(stack))
+        return self.run(unit, code, list(stack))
+
+    def merge(self, left, right):
+        if left is FAILED:
+            return right
+        if right is FAILED or len(left) != len(right):
+            return left
+        merged = []
+        for a, b in zip(left, right):
+            if a is b:
+                merged.append(a)
+            elif (a.source, a.ty, a.field) == (b.source, b.ty, b.field) and a.source is not None:
+                merged.append(a.changed(b.written))
+            else:
+                merged.append(self.result([a, b]))
+        return merged
+
+    def loop(self, kind, over, code, stack):
+        self.depth += 1
+        self.unit.loops.append({"kind": kind, "over": over or "other", "depth": self.depth})
+        self.bounds = self.bounds + (over,)
+        stack = self.block(code, stack)
+        self.bounds = self.bounds[:-1]
+        self.depth -= 1
+        return stack
+
+    def instruction(self, node, stack):
+        if isinstance(node, list):
+            return self.block(node, stack)
+        prim = node["prim"]
+        args = node.get("args", [])
+        n = int(args[0]["int"]) if args and "int" in args[0] else None
+        self.unit.instructions += 1
+
+        if prim in NULLARY:
+            stack.append(Value(ty=args[0] if prim == "NIL" else None))
+        elif prim == "PUSH":
+            size = len(codesize.encode(args[1]))
+            self.unit.constants.append({"type": args[0]["prim"], "bytes": size})
+            stack.append(Value(ty=args[0]))
+        elif prim in ("LAMBDA", "LAMBDA_REC"):
+            name = lambda_name(args[1], args[2])
+            if "lambda " + name in self.units:
+                self.units["lambda " + name].copies += 1
+            else:
+                saved, self.bounds = self.bounds, ()
+                self.run(Unit("lambda", name), args[2], [Value("parameter", binary_pairs(args[0]), origin="input")])
+                self.bounds = saved
+            stack.append(Value(lam=name))
+        elif prim in ("CAR", "CDR") or (prim == "GET" and n is not None):
+            value = self.pop(stack)
+            stack.append(self.get_n(value, n) if prim == "GET" else self.child(value, 0 if prim == "CAR" else 1))
+        elif prim == "UNPAIR":
+            value = self.pop(stack)
+            parts = []
+            for _ in range((n or 2) - 1):
+                parts.append(self.child(value, 0))
+                value = self.child(value, 1)
+            stack.extend(reversed(parts + [value]))
+        elif prim == "PAIR":
+            parts = [self.pop(stack) for _ in range(n or 2)]
+            value = parts[-1]
+            for left in reversed(parts[:-1]):
+                value = self.pair(left, value)
+            stack.append(value)
+        elif prim == "UPDATE" and n is not None:
+            new, value = self.pop(stack), self.pop(stack)
+            target = self.get_n(value, n)
+            if value.source == "storage" and target.source == "storage":
+                stack.append(value.changed(frozenset([target.field or value.field]) - {None}))
+            else:
+                self.consume([new, value])
+                stack.append(self.result([value, new]))
+        elif prim == "CONCAT":
+            top = self.pop(stack)
+            values = [top] if top.ty and top.ty.get("prim") == "list" else [top, self.pop(stack)]
+            self.consume(values)
+            stack.append(self.result(values))
+        elif prim == "SIZE":
+            value = self.pop(stack)
+            self.consume([value])
+            stack.append(Value(origin=value.describe(), bound=value.describe()))
+        elif prim == "EXEC":
+            arg, lam = self.pop(stack), self.pop(stack)
+            self.consume([arg])
+            if lam.lam is not None:
+                self.unit.calls[lam.lam] += 1
+                if self.depth > 0:
+                    self.unit.calls_in_loops.add(lam.lam)
+            stack.append(self.result([arg]))
+        elif prim in UNARY or prim in BINARY or prim in TERNARY:
+            arity = 1 if prim in UNARY else 2 if prim in BINARY else 3
+            stack.append(self.compute(prim, [self.pop(stack) for _ in range(arity)]))
+        elif prim in ("GET_AND_UPDATE", "CREATE_CONTRACT", "READ_TICKET"):
+            values = [self.pop(stack) for _ in range(1 if prim == "READ_TICKET" else 3)]
+            stack.extend([self.compute(prim, values), self.result(values)])
+        elif prim == "DUP":
+            stack.append(stack[-(n or 1)] if len(stack) >= (n or 1) else Value())
+        elif prim == "DIG":
+            if n and len(stack) > n:
+                stack.append(stack.pop(-1 - n))
+        elif prim == "DUG":
+            if n and len(stack) > n:
+                value = stack.pop()
+                stack.insert(len(stack) - n, value)
+        elif prim == "SWAP":
+            if len(stack) >= 2:
+                stack[-1], stack[-2] = stack[-2], stack[-1]
+        elif prim == "DROP":
+            del stack[len(stack) - (1 if n is None else n):]
+        elif prim == "DIP":
+            depth = 1 if n is None else n
+            kept = stack[len(stack) - depth:]
+            below = self.block(args[-1], stack[:len(stack) - depth])
+            return FAILED if below is FAILED else below + kept
+        elif prim in ("FAILWITH", "NEVER"):
+            return FAILED
+        elif prim == "IF":
+            self.consume([self.pop(stack)])
+            return self.merge(self.branch(args[0], stack), self.branch(args[1], stack))
+        elif prim == "IF_NONE":
+            value = self.pop(stack)
+            return self.merge(self.branch(args[0], stack), self.branch(args[1], stack + [self.result([value])]))
+        elif prim == "IF_CONS":
+            value = self.pop(stack)
+            return self.merge(self.branch(args[0], stack + [self.result([value], ty=value.ty), self.result([value])]), self.branch(args[1], stack))
+        elif prim == "IF_LEFT":
+            return self.if_left(self.pop(stack), args, stack)
+        elif prim in LOOPS:
+            return self.loop_instruction(prim, args[0], stack)
+        return stack
+
+    def pair(self, left, right):
+        if (left.source == right.source == "storage" and left.parent is not None and right.parent is not None
+                and left.parent.ty is right.parent.ty and (left.side, right.side) == (0, 1)):
+            # The two halves of a part of the storage put back together.
+            parent = left.parent
+            return parent.changed(left.written | right.written)
+        for part, side in ((left, 0), (right, 1)):
+            other = right if side == 0 else left
+            if part.source == "storage" and part.parent is not None and part.side == side and part.parent.ty["args"][1 - side] is not other.ty:
+                # Half of a pair of the storage with a new other half: a field assigned.
+                replaced = part.parent.ty["args"][1 - side]
+                changed = frozenset([part.parent.field]) if part.parent.field is not None else fields_under(replaced)
+                return part.parent.changed(part.written | changed)
+        self.consume([left, right])
+        return self.result([left, right])
+
+    def if_left(self, value, args, stack):
+        branches = []
+        for side in (0, 1):
+            unit = None
+            if value.source == "parameter" and value.ty and value.ty.get("prim") == "or":
+                ty = value.ty["args"][side]
+                inner = Value("parameter", ty, origin=value.origin)
+                name = michelson.annotation(ty)
+                if name is not None and self.unit.kind == "dispatch":
+                    unit = Unit("entrypoint", name)
+            else:
+                inner = self.result([value])
+            branches.append(self.branch(args[side], stack + [inner], unit))
+        return self.merge(*branches)
+
+    def loop_instruction(self, prim, code, stack):
+        value = self.pop(stack)
+        self.consume([value])
+        if prim == "LOOP":
+            out = self.loop(prim, value.bound, code, list(stack))
+            return stack if out is FAILED else out[:-1]
+        element = self.result([value])
+        out = self.loop(prim, value.describe(), code, stack + [element])
+        if out is FAILED:
+            out = stack + [element]
+        if prim == "ITER":
+            return out
+        return out[:-1] + [self.result([value], ty=value.ty)]
+
+
+def hot_spots(unit, units, big_constant=BIG_CONSTANT):
+    spots = []
+    for loop in unit.loops:
+        if loop["over"].startswith("storage "):
+            spots.append("%s over %s" % (loop["kind"], loop["over"]))
+    if any(loop["depth"] > 1 for loop in unit.loops):
+        spots.append("nested loops")
+    for name in sorted(unit.calls_in_loops):
+        if units.get("lambda " + name) and units["lambda " + name].loops:
+            spots.append("executes %s, which loops, inside a loop" % name)
+    for constant in unit.constants:
+        if constant["bytes"] >= big_constant:
+            spots.append("pushes a %d-byte %s constant" % (constant["bytes"], constant["type"]))
+    if unit.copies > 1:
+        spots.append("code inlined %d times" % unit.copies)
+    return spots
+
+
+def contract_profile(name, build_dir=michelson.BUILD_DIR, big_constant=BIG_CONSTANT):
+    """Profile of every unit of ``build/<name>.json``, keyed by "entrypoint x", "view x", "lambda x" or "dispatch"."""
+    units = Profiler().profile(michelson.load_contract(name, build_dir))
+    profile = {}
+    for unit in units.values():
+        entry = unit.as_dict()
+        entry["hot_spots"] = hot_spots(unit, units, big_constant)
+        profile[unit.key] = entry
+    return profile
+
+
+def delta(new, old):
+    if old is None or old == new:
+        return ""
+    return " (%+d)" % (new - old)
+
+
+def regressions(profiles, previous, tolerance=DEFAULT_TOLERANCE):
+    """Units that grew by more than ``tolerance`` percent of instructions or got new hot spots."""
+    found = []
+    for name in sorted(profiles):
+        old_units = previous.get(name, {})
+        for key, unit in sorted(profiles[name].items()):
+            old = old_units.get(key)
+            if old is None:
+                continue
+            if unit["instructions"] > old["instructions"] * (1 + tolerance / 100.0):
+                found.append("%s %s: %d instructions, %d before" % (name, key, unit["instructions"], old["instructions"]))
+            for spot in unit["hot_spots"]:
+                if spot not in old["hot_spots"]:
+                    found.append("%s %s: new hot spot: %s" % (name, key, spot))
+    return found
+
+
+def print_report(profiles, previous):
+    for name in sorted(profiles):
+        print(name)
+        old_units = previous.get(name, {})
+        units = profiles[name]
+        order = sorted(units, key=lambda key: (key.split(" ")[0] != "dispatch", key.split(" ")[0], key))
+        for key in order:
+            unit, old = units[key], old_units.get(key, {})
+            details = []
+            if unit["loops"]:
+                details.append("loops: " + ", ".join(
+                    "%s over %s" % (loop["kind"], "input length" if loop["over"] == "input" else loop["over"]) for loop in unit["loops"]
+                ))
+            if unit["calls"]:
+                details.append("calls: " + ", ".join("%s x%d" % call for call in sorted(unit["calls"].items())))
+            if unit["reads"]:
+                details.append("reads: " + ", ".join(unit["reads"]))
+            if unit["writes"]:
+                details.append("writes: " + ", ".join(unit["writes"]))
+            new = "" if old or not old_units else " (new)"
+            print("  %-36s %6d%s%s  %s" % (key, unit["instructions"], delta(unit["instructions"], old.get("instructions")), new, "; ".join(details)))
+            for spot in unit["hot_spots"]:
+                print("    ! %s%s" % (spot, "" if not old or spot in old.get("hot_spots", []) else " (new)"))
+        for key in sorted(set(old_units) - set(units)):
+            print("  %-36s removed" % key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("contracts", nargs="*", help="contracts in build/ (default: all)")
+    parser.add_argument("--build-dir", default=michelson.BUILD_DIR)
+    parser.add_argument("--report", default=DEFAULT_REPORT, help="where profiles are kept between runs")
+    parser.add_argument("--big-constant", type=int, default=BIG_CONSTANT, help="bytes from which a pushed constant is a hot spot")
+    parser.add_argument("--check", action="store_true", help="fail on regressions against the previous profile")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="instruction growth allowed by --check, in percent")
+    args = parser.parse_args(argv)
+
+    names = args.contracts or codesize.built_contracts(args.build_dir)
+    profiles = dict((name, contract_profile(name, args.build_dir, args.big_constant)) for name in names)
+    previous = {}
+    if os.path.exists(args.report):
+        with open(args.report) as f:
+            previous = json.load(f)
+    print_report(profiles, previous)
+    found = regressions(profiles, previous, args.tolerance)
+    for regression in found:
+        print("regression: %s" % regression)
+    previous.update(profiles)
+    with open(args.report, "w") as f:
+        json.dump(previous, f, indent=2, sort_keys=True)
+    return 1 if args.check and found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,488 @@
+"""Differential testing of the SmartPy contracts against ``tools/model.py``.
+
+A trace is a seeded random sequence of calls to RegistrarMain,
+RegistrarStorage and Auction by a handful of test accounts. The model
+decides which calls succeed and with what message the others fail; the
+trace is then written out as a SmartPy test scenario where every call
+carries that expectation (``valid=False, exception=...``) and the final
+registry, counters and balances are compared through the views. SmartPy
+stops at the first call that behaves differently, which is reported as the
+divergence.
+
+    python -m tools.differential --seeds 1-20 --length 300
+    python -m tools.differential --seeds 1-1000 --length 1000 --model-only
+
+``--model-only`` skips SmartPy and only runs the traces through the model,
+e.g. to check it keeps up thousands of calls per second. The SmartPy CLI is
+expected where ``compile.sh`` expects it, or at ``$SMART_PY_CLI``.
+"""
+
+import argparse
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from tools import model
+from tools.model import Model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTRACTS_DIR = os.path.join(ROOT, "contracts")
+SMART_PY_CLI = os.environ.get("SMART_PY_CLI", os.path.expanduser("~/smartpy-cli/SmartPy.sh"))
+
+ACCOUNTS = ["owner", "wallet", "registrar", "registrar2", "alice", "bob", "carol", "dave", "erin", "frank"]
+USERS = ["alice", "bob", "carol", "dave", "erin", "frank", "registrar"]
+# Valid and invalid names (too short, too long, bad characters), some differing only in case.
+NAMES = [
+    "alice", "Alice", "bobby", "carol1", "dave42", "Erin7", "frank", "grace", "heidi", "ivan99", "judy",
+    "mallory", "oscar", "peggy", "trent", "victor", "reg1", "abc", "toolongsafleid123", "bad_id",
+]
+REGISTRAR_NAMES = ["Reg1", "reg2", "reg3", "alice", "abc", "bad_id"]
+COINS = [("eth", "ether"), ("BTC", "bitcoin"), ("ltc", "lite_coin")]
+COIN_ADDRESSES = ["AbCdEf", "abcdef", "defabc", "0xabc1"]
+INDEXES = [0, 1, 2, 3]
+
+
+class Address(str):
+    """A string the scenario must spell as ``<account>.address``."""
+
+
+class Map(dict):
+    """A dict the scenario must spell as a map rather than a record."""
+
+
+class Some(object):
+    def __init__(self, value):
+        self.value = value
+
+
+CONTRACT_VARIABLES = {model.MAIN: "main", model.STORAGE: "storage", model.AUCTION: "auction"}
+
+
+def address(name):
+    return Address(name)
+
+
+def option(value, wrap=lambda v: v):
+    return None if value is None else Some(wrap(value))
+
+
+# -- traces ----------------------------------------------------------------
+
+
+class Op(object):
+    __slots__ = ("contract", "entrypoint", "sender", "params", "amount", "now", "outcome")
+
+    def __init__(self, contract, entrypoint, sender, params, amount=0, now=0):
+        self.contract = contract
+        self.entrypoint = entrypoint
+        self.sender = sender
+        self.params = params
+        self.amount = amount
+        self.now = now
+        self.outcome = None
+
+    def __repr__(self):
+        result = "ok" if self.outcome is None else "fails with %r" % (self.outcome.message,)
+        return "%s.%s(%r) by %s, %d mutez at %ds: %s" % (
+            self.contract, self.entrypoint, self.params, self.sender, self.amount, self.now, result
+        )
+
+
+class TraceGenerator(object):
+    """Draws calls that are plausible in the current model state.
+
+    Most calls are well formed and come from the right sender so traces get
+    deep into the registry and the auctions; the rest exercise the checks.
+    """
+
+    def __init__(self, seed, state):
+        self.rng = random.Random(seed)
+        self.model = state
+        self.now = 0
+
+    def pick(self, items):
+        return self.rng.choice(items)
+
+    def account(self, *likely):
+        if likely and self.rng.random() < 0.8:
+            return address(self.pick(likely))
+        return address(self.pick(ACCOUNTS))
+
+    def fee(self, fees, count=1):
+        return self.pick([fees * count, fees * count, fees * count + 7, max(fees * count - 1, 0), 0])
+
+    def registered_name(self):
+        names = sorted(self.model.storage.resolveAddressFromSafleId)
+        if names and self.rng.random() < 0.8:
+            name = self.pick(names)
+            return name.upper() if self.rng.random() < 0.1 else name
+        return self.pick(NAMES)
+
+    def coin_addresses(self):
+        return Map((self.pick(INDEXES), self.pick(COIN_ADDRESSES)) for _ in range(self.rng.randint(1, 3)))
+
+    def next(self):
+        self.now += self.rng.randint(0, 200)
+        main = self.model.main.vars
+        entrypoint = self.pick(DRAWS)
+        if main["safleIdRegStatus"] and self.rng.random() < 0.2:
+            # Do not leave registrations paused for most of the trace.
+            entrypoint = "toggleRegistrationStatus"
+        draw = getattr(self, "draw_" + entrypoint)
+        contract, sender, params, amount = draw(main)
+        return Op(contract, entrypoint, sender, params, amount, self.now)
+
+    # Each draw returns (contract, sender, params, amount).
+
+    def draw_setSafleIdFees(self, main):
+        return "main", self.account("owner"), {"_amount": self.pick([0, 0, 10, 1000])}, 0
+
+    def draw_setRegistrarFees(self, main):
+        return "main", self.account("owner"), {"_amount": self.pick([0, 0, 50, 5000])}, 0
+
+    def draw_setFeeSweepThreshold(self, main):
+        return "main", self.account("owner"), {"_amount": self.pick([0, 0, 100, 5000])}, 0
+
+    def draw_withdrawFees(self, main):
+        return "main", self.account("owner"), {}, 0
+
+    def draw_withdrawExcessBalance(self, main):
+        return "main", self.account("owner"), {}, 0
+
+    def draw_toggleRegistrationStatus(self, main):
+        # Now and then with tez that is not a fee, for withdrawExcessBalance.
+        return "main", self.account("owner"), {}, self.pick([0, 0, 0, 7])
+
+    def draw_updateWalletAddress(self, main):
+        return "main", self.account("owner"), {"_walletAddress": self.account("wallet")}, 0
+
+    def draw_registerRegistrar(self, main):
+        sender = self.account("registrar", "registrar2")
+        return "main", sender, {"_registrarName": self.pick(REGISTRAR_NAMES)}, self.fee(main["registrarFees"])
+
+    def draw_updateRegistrar(self, main):
+        sender = self.account("registrar", "registrar2")
+        return "main", sender, {"_registrarName": self.pick(REGISTRAR_NAMES)}, self.fee(main["registrarFees"])
+
+    def draw_registerSafleId(self, main):
+        params = {"_safleId": self.pick(NAMES), "_userAddress": self.account(*USERS)}
+        return "main", self.account("registrar", "registrar2"), params, self.fee(main["safleIdFees"])
+
+    def draw_registerSafleIds(self, main):
+        items = [
+            {"_userAddress": self.account(*USERS), "_safleId": self.pick(NAMES)}
+            for _ in range(self.rng.randint(0, 3))
+        ]
+        amount = self.fee(main["safleIdFees"], max(len(items), 1))
+        return "main", self.account("registrar", "registrar2"), {"_safleIds": items}, amount
+
+    def draw_updateSafleId(self, main):
+        params = {"_newSafleId": self.pick(NAMES), "_userAddress": self.account(*USERS)}
+        return "main", self.account("registrar", "registrar2"), params, self.fee(main["safleIdFees"])
+
+    def draw_mapCoins(self, main):
+        coin, alias = self.pick(COINS)
+        params = {"_indexNumber": self.pick(INDEXES), "_blockchainName": coin, "_aliasName": alias}
+        return "main", self.account("registrar"), params, 0
+
+    def draw_registerCoinAddress(self, main):
+        params = {"_userAddress": self.account(*USERS), "_index": self.pick(INDEXES), "_address": self.pick(COIN_ADDRESSES)}
+        return "main", self.account("registrar"), params, 0
+
+    def draw_updateCoinAddress(self, main):
+        params = {"_userAddress": self.account(*USERS), "_index": self.pick(INDEXES), "_address": self.pick(COIN_ADDRESSES)}
+        return "main", self.account("registrar"), params, 0
+
+    def draw_registerCoinAddresses(self, main):
+        params = {"_userAddress": self.account(*USERS), "_addresses": self.coin_addresses()}
+        return "main", self.account("registrar"), params, 0
+
+    def draw_updateCoinAddresses(self, main):
+        params = {"_userAddress": self.account(*USERS), "_addresses": self.coin_addresses()}
+        return "main", self.account("registrar"), params, 0
+
+    def draw_storageRegisterSafleId(self, main):
+        # Only RegistrarMain may write to the storage contract.
+        params = {"_registrar": self.account("registrar"), "_userAddress": self.account(*USERS), "_safleId": self.pick(NAMES).lower()}
+        return "storage", self.account(*USERS), params, 0
+
+    def owned_name(self):
+        """A registered name and, mostly, its owner as the sender."""
+        owners = self.model.storage.resolveAddressFromSafleId
+        name = self.registered_name()
+        if name in owners and self.rng.random() < 0.8:
+            return name, address(owners[name])
+        return name, self.account(*USERS)
+
+    def draw_auctionSafleId(self, main):
+        name, sender = self.owned_name()
+        params = {"_safleId": name, "_auctionSeconds": self.pick([300, 301, 600, 1000, 7776000])}
+        return "auction", sender, params, 0
+
+    def draw_bidForSafleId(self, main):
+        names = sorted(self.model.auction.safleIdToAuction)
+        name = self.pick(names) if names and self.rng.random() < 0.9 else self.registered_name()
+        return "auction", self.account(*USERS), {"_safleId": name}, self.pick([0, 5, 100, 250, 1000])
+
+    def draw_settleAuction(self, main):
+        conductors = sorted(self.model.auction.alreadyActiveAuction)
+        sender = self.pick(conductors) if conductors and self.rng.random() < 0.8 else self.account(*USERS)
+        return "auction", address(sender), {}, 0
+
+    def draw_settleExpiredAuctions(self, main):
+        # What a keeper passes: the ids of a bucket, plus the odd unknown or
+        # repeated id, and now and then a batch over the limit.
+        buckets = sorted(self.model.auction.expiringAuctionCounts)
+        bucket = self.pick(buckets) if buckets else None
+        ids = sorted(i for b, i in self.model.auction.expiringAuctions if b == bucket)
+        if not ids or self.rng.random() < 0.2:
+            ids.append(self.rng.randint(0, self.model.auction.vars["totalAuctions"]))
+        if self.rng.random() < 0.05:
+            return "auction", self.account(*USERS), {"_auctionIds": (ids * (model.MAX_SETTLE_BATCH + 1))[:model.MAX_SETTLE_BATCH + 1]}, 0
+        return "auction", self.account(*USERS), {"_auctionIds": ids[:self.pick([1, 2, 10])]}, 0
+
+    def draw_withdrawBid(self, main):
+        bids = sorted(self.model.auction.bidRate)
+        if bids and self.rng.random() < 0.8:
+            auction_id, sender = self.pick(bids)
+        else:
+            auction_id, sender = self.rng.randint(0, self.model.auction.vars["totalAuctions"]), self.account(*USERS)
+        return "auction", address(sender), {"_auctionId": auction_id}, 0
+
+    def draw_directlyTransferSafleId(self, main):
+        name, sender = self.owned_name()
+        return "auction", sender, {"_safleId": name, "_newOwner": self.account(*USERS)}, 0
+
+
+# Relative weights of the calls a trace is made of.
+DRAWS = (
+    ["registerRegistrar"] * 3 + ["updateRegistrar"] + ["registerSafleId"] * 6 + ["registerSafleIds"] * 2
+    + ["updateSafleId"] * 2 + ["mapCoins"] * 2 + ["registerCoinAddress"] * 3 + ["updateCoinAddress"] * 2
+    + ["registerCoinAddresses"] * 2 + ["updateCoinAddresses"] * 2 + ["auctionSafleId"] * 3
+    + ["bidForSafleId"] * 4 + ["settleAuction"] * 2 + ["settleExpiredAuctions"] * 2 + ["withdrawBid"] * 2 + ["directlyTransferSafleId"]
+    + ["setSafleIdFees", "setRegistrarFees", "setFeeSweepThreshold", "withdrawFees", "withdrawExcessBalance", "toggleRegistrationStatus", "updateWalletAddress", "storageRegisterSafleId"]
+)
+
+# Draws that call an entry point under another name.
+ENTRYPOINTS = {"storageRegisterSafleId": "registerSafleId"}
+
+
+def new_model():
+    return Model(owner=address("owner"), wallet=address("wallet"))
+
+
+def generate(seed, length):
+    """Return the model after a trace of ``length`` calls, and the trace."""
+    state = new_model()
+    generator = TraceGenerator(seed, state)
+    trace = []
+    for _ in range(length):
+        op = generator.next()
+        op.entrypoint = ENTRYPOINTS.get(op.entrypoint, op.entrypoint)
+        op.outcome = state.try_call(op.contract, op.entrypoint, op.sender, op.params, op.amount, op.now)
+        trace.append(op)
+    return state, trace
+
+
+# -- SmartPy scenario --------------------------------------------------------
+
+
+def render(value):
+    """Spell a trace value as a SmartPy expression."""
+    if isinstance(value, Address):
+        return CONTRACT_VARIABLES.get(value, value) + ".address"
+    if isinstance(value, Some):
+        return "sp.some(%s)" % render(value.value)
+    if value is None:
+        return "sp.none"
+    if isinstance(value, (bool, int)):
+        return repr(value)
+    if isinstance(value, str):
+        return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+    if isinstance(value, tuple):
+        return "(%s)" % ", ".join(render(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return "sp.set([%s], t=sp.TNat)" % ", ".join(render(v) for v in sorted(value))
+    if isinstance(value, list):
+        return "[%s]" % ", ".join(render(v) for v in value)
+    if isinstance(value, Map):
+        return "{%s}" % ", ".join("%s: %s" % (render(k), render(value[k])) for k in sorted(value))
+    if isinstance(value, dict):
+        return "sp.record(%s)" % ", ".join("%s=%s" % (k, render(value[k])) for k in sorted(value))
+    raise TypeError("cannot render %r" % (value,))
+
+
+def render_call(op):
+    params = ", ".join("%s=%s" % (k, render(op.params[k])) for k in sorted(op.params))
+    run = ["sender=%s" % op.sender, "amount=sp.mutez(%d)" % op.amount, "now=sp.timestamp(%d)" % op.now]
+    if op.outcome is not None:
+        run.append("valid=False")
+        if op.outcome.message is not None:
+            run.append("exception=%s" % render(op.outcome.message))
+    return "scenario += %s.%s(%s).run(%s)" % (op.contract, op.entrypoint, params, ", ".join(run))
+
+
+def final_checks(state):
+    """``(expression, expected)`` pairs comparing the final state through views and storage."""
+    storage = state.storage
+    names = sorted(set(n.lower() for n in NAMES) | set(storage.resolveAddressFromSafleId))
+    coins = sorted(set(a.lower() for a in COIN_ADDRESSES))
+    ids = [{"_safleId": n, "_index": i} for n in names for i in INDEXES]
+    statuses = sorted(set(names) | set(n.lower() for n in REGISTRAR_NAMES) | set(storage.unavailableSafleIds))
+    checks = [
+        ("storage.resolveSafleIds(%s)" % render({"_safleIds": names}),
+         Map((n, option(storage.resolveAddressFromSafleId.get(n), Address)) for n in names)),
+        ("storage.coinAddressesToIds(%s)" % render({"_addresses": coins}),
+         Map((a, option(storage.coinAddressToSafleId.get(a))) for a in coins)),
+        ("storage.idsToCoinAddresses(%s)" % render({"_coins": ids}),
+         Map((k, option(v)) for k, v in storage.idsToCoinAddresses({"_coins": ids}).items())),
+        ("storage.nameStatuses(%s)" % render({"_names": statuses}), Map(storage.nameStatuses({"_names": statuses}))),
+        ("storage.data.totalSafleIdRegistered", storage.vars["totalSafleIdRegistered"]),
+        ("storage.data.totalRegistrars", storage.vars["totalRegistrars"]),
+        ("auction.data.totalAuctions", state.auction.vars["totalAuctions"]),
+        ("main.balance", ("mutez", state.balance(model.MAIN))),
+        ("main.data.totalFeesCollected", ("mutez", state.main.vars["totalFeesCollected"])),
+        ("main.data.totalFeesWithdrawn", ("mutez", state.main.vars["totalFeesWithdrawn"])),
+        ("main.data.totalExcessWithdrawn", ("mutez", state.main.vars["totalExcessWithdrawn"])),
+        ("auction.balance", ("mutez", state.balance(model.AUCTION))),
+    ]
+    buckets = sorted(set(a["auctionLastFor"] // model.AUCTION_BUCKET_SECONDS for a in state.auction.auction.values()))
+    for bucket in buckets:
+        checks.append(("auction.expiringAuctionCount(%s)" % render({"_bucket": bucket}), state.auction.expiringAuctionCount({"_bucket": bucket})))
+    for name in ACCOUNTS:
+        account = address(name)
+        checks.append(("storage.accountOf(%s)" % render({"_address": account}), storage.accountOf({"_address": account})))
+        page = {"_offset": 0, "_limit": 10}
+        checks.append(("storage.oldSafleIdsOf(%s)" % render(dict(page, _userAddress=account)),
+                       storage.oldSafleIdsOf(dict(page, _userAddress=account))))
+        checks.append(("storage.oldRegistrarNamesOf(%s)" % render(dict(page, _registrar=account)),
+                       storage.oldRegistrarNamesOf(dict(page, _registrar=account))))
+    return checks
+
+
+def scenario_source(seed, state, trace):
+    """SmartPy test replaying ``trace``; call ``i`` is preceded by an ``op i:`` heading."""
+    lines = [
+        "import smartpy as sp",
+        "",
+        'registrarMain = sp.io.import_stored_contract("RegistrarMain.py")',
+        'registrarStorage = sp.io.import_stored_contract("RegistrarStorage.py")',
+        'auctionContract = sp.io.import_stored_contract("Auction.py")',
+        "",
+        "",
+        '@sp.add_test(name="Differential %d")' % seed,
+        "def test():",
+        "    scenario = sp.test_scenario()",
+    ]
+    body = ['%s = sp.test_account("%s")' % (name, name) for name in ACCOUNTS]
+    body += [
+        "main = registrarMain.RegistrarMain(_ownerAddress=owner.address, _walletAddress=wallet.address)",
+        "scenario += main",
+        "storage = registrarStorage.RegistrarStorage(_ownerAddress=owner.address, _mainContractAddress=main.address)",
+        "scenario += storage",
+        "auction = auctionContract.Auction(_ownerAddress=owner.address, _storageContract=storage.address)",
+        "scenario += auction",
+        "scenario += main.setStorageContract(_registrarStorageContract=storage.address).run(sender=owner)",
+        "scenario += storage.setAuctionContract(_auctionAddress=auction.address).run(sender=owner)",
+    ]
+    for i, op in enumerate(trace):
+        body.append('scenario.h4("op %d: %s.%s")' % (i, op.contract, op.entrypoint))
+        body.append(render_call(op))
+    body.append('scenario.h4("op %d: final state")' % len(trace))
+    for expression, expected in final_checks(state):
+        if isinstance(expected, tuple) and expected[0] == "mutez":
+            body.append("scenario.verify(%s == sp.mutez(%d))" % (expression, expected[1]))
+        else:
+            body.append("scenario.verify_equal(%s, %s)" % (expression, render(expected)))
+    return "\n".join(lines + ["    " + line for line in body]) + "\n"
+
+
+def divergence(output, source):
+    """Index of the call SmartPy disagreed on, from its output; None if it did not say."""
+    markers = re.findall(r"op (\d+):", output)
+    lines = [int(n) for n in re.findall(r"_differential_\d+\.py\D{1,10}?(\d+)", output)]
+    if lines:
+        headings = source.splitlines()[:max(lines)]
+        for heading in reversed(headings):
+            match = re.search(r'scenario\.h4\("op (\d+):', heading)
+            if match:
+                return int(match.group(1))
+    return int(markers[-1]) if markers else None
+
+
+def run_smartpy(seed, state, trace, keep=False):
+    """Replay ``trace`` in SmartPy; return None when it agrees, else ``(op index, output)``."""
+    source = scenario_source(seed, state, trace)
+    path = os.path.join(CONTRACTS_DIR, "_differential_%d.py" % seed)
+    with open(path, "w") as f:
+        f.write(source)
+    out_dir = tempfile.mkdtemp(prefix="differential-")
+    try:
+        process = subprocess.run(
+            [SMART_PY_CLI, "test", path, out_dir], cwd=ROOT,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True
+        )
+    finally:
+        if not keep:
+            os.remove(path)
+    output = process.stdout
+    if process.returncode == 0 and "Error" not in output:
+        return None
+    return divergence(output, source), output
+
+
+# -- command line ------------------------------------------------------------
+
+
+def parse_seeds(text):
+    seeds = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        seeds.extend(range(int(first), int(last or first) + 1))
+    return seeds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seeds", default="1-10", help="seeds to replay, e.g. 1-10,42")
+    parser.add_argument("--length", type=int, default=200, help="calls per trace")
+    parser.add_argument("--model-only", action="store_true", help="run the traces through the model only")
+    parser.add_argument("--keep", action="store_true", help="keep the generated contracts/_differential_<seed>.py")
+    args = parser.parse_args(argv)
+
+    if not args.model_only and not os.path.isfile(SMART_PY_CLI):
+        sys.exit("Fatal: Please install SmartPy CLI at %s (or use --model-only)" % SMART_PY_CLI)
+
+    diverged = 0
+    calls = 0
+    started = time.time()
+    for seed in parse_seeds(args.seeds):
+        state, trace = generate(seed, args.length)
+        calls += len(trace)
+        if args.model_only:
+            continue
+        result = run_smartpy(seed, state, trace, args.keep)
+        failed = sum(op.outcome is not None for op in trace)
+        if result is None:
+            print("seed %d: %d calls (%d failing) agree" % (seed, len(trace), failed))
+            continue
+        diverged += 1
+        index, output = result
+        print("seed %d: DIVERGED" % seed)
+        if index is not None and index < len(trace):
+            print("  op %d: %r" % (index, trace[index]))
+        elif index == len(trace):
+            print("  final state differs")
+        print("  " + "\n  ".join(output.strip().splitlines()[-15:]))
+    elapsed = time.time() - started
+    if args.model_only:
+        print("%d calls through the model in %.2fs (%.0f calls/s)" % (calls, elapsed, calls / max(elapsed, 1e-9)))
+    return 1 if diverged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+"""Off-chain index of RegistrarStorage and Auction in a SQLite database.
+
+:class:`Indexer` follows the events of both contracts block by block and
+keeps the registry in plain tables: SafleIDs and their owners, registrar
+names, coin mappings and addresses, old names and auctions with their bids.
+Names are primary keys, so a prefix search is a range scan of the index,
+and owners and coin addresses are indexed for reverse lookups:
+
+    indexer = Indexer(RpcClient("http://localhost:8732"), "KT1storage...", "KT1auction...",
+                      path="registry.sqlite", start_level=<origination level>)
+    indexer.sync()                     # e.g. once per block
+    indexer.search("ali")              # ["alice", "alicia", ...]
+    indexer.resolve_safle_id("alice")  # same answers as the Resolver, without a node
+
+Each block is applied in one transaction together with its hash, so the
+database is always at a block boundary and a restarted indexer resumes
+after the last block it stored. Every row a block changes is journaled
+with its previous content; when the node's chain no longer goes through
+the stored blocks, they are undone newest first down to the fork and the
+new branch is applied. The journal of the last ``keep_blocks`` blocks is
+kept, which bounds the depth of a reorganisation that can be followed.
+
+    python -m tools.indexer sync registry.sqlite --endpoint http://localhost:8732 \\
+        --storage KT1... --auction KT1... --start-level 1234 [--follow]
+    python -m tools.indexer search registry.sqlite ali
+    python -m tools.indexer expired registry.sqlite [--now SECONDS]
+
+``expired`` lists the auctions that ended and are not settled yet, at most
+one ``settleExpiredAuctions`` batch of them, for a keeper to pass on.
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+from tools import michelson
+from tools.model import MAX_SETTLE_BATCH
+from tools.resolver import NotRegistered
+from tools.rpc import RpcClient, block_events
+
+# Blocks whose changes can still be undone; deeper reorganisations are refused.
+KEEP_BLOCKS = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS blocks (level INTEGER PRIMARY KEY, hash TEXT NOT NULL, predecessor TEXT);
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, level INTEGER NOT NULL,
+    tbl TEXT NOT NULL, key TEXT NOT NULL, row TEXT
+);
+CREATE INDEX IF NOT EXISTS journal_level ON journal (level);
+
+CREATE TABLE IF NOT EXISTS safle_ids (safle_id TEXT PRIMARY KEY, owner TEXT NOT NULL, level INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS safle_ids_owner ON safle_ids (owner);
+CREATE TABLE IF NOT EXISTS registrars (name TEXT PRIMARY KEY, registrar TEXT NOT NULL, level INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS registrars_registrar ON registrars (registrar);
+CREATE TABLE IF NOT EXISTS old_names (
+    kind TEXT NOT NULL, owner TEXT NOT NULL, name TEXT NOT NULL, level INTEGER NOT NULL,
+    PRIMARY KEY (kind, owner, name)
+);
+CREATE TABLE IF NOT EXISTS coins (coin_index INTEGER PRIMARY KEY, coin_name TEXT NOT NULL, alias_name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS coin_addresses (
+    safle_id TEXT NOT NULL, coin_index INTEGER NOT NULL, address TEXT NOT NULL,
+    PRIMARY KEY (safle_id, coin_index)
+);
+CREATE TABLE IF NOT EXISTS coin_address_owners (address TEXT PRIMARY KEY, safle_id TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS auctions (
+    auction_id INTEGER PRIMARY KEY, safle_id TEXT NOT NULL, conductor TEXT NOT NULL, ends INTEGER NOT NULL,
+    highest_bidder TEXT, highest_bid INTEGER NOT NULL, settled INTEGER NOT NULL, level INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS auctions_safle_id ON auctions (safle_id);
+CREATE INDEX IF NOT EXISTS auctions_ends ON auctions (settled, ends);
+CREATE TABLE IF NOT EXISTS bids (
+    auction_id INTEGER NOT NULL, bidder TEXT NOT NULL, amount INTEGER NOT NULL,
+    PRIMARY KEY (auction_id, bidder)
+);
+"""
+
+# Primary key columns of the tables events write to.
+KEYS = {
+    "safle_ids": ("safle_id",),
+    "registrars": ("name",),
+    "old_names": ("kind", "owner", "name"),
+    "coins": ("coin_index",),
+    "coin_addresses": ("safle_id", "coin_index"),
+    "coin_address_owners": ("address",),
+    "auctions": ("auction_id",),
+    "bids": ("auction_id", "bidder"),
+}
+
+# Sorts after every character a name can contain, to bound prefix scans.
+PREFIX_END = "\U0010ffff"
+
+
+class IndexerError(Exception):
+    pass
+
+
+def unpacked_string(packed):
+    """The string of ``sp.pack(string)``, given in hex."""
+    data = bytes.fromhex(packed)
+    if data[:2] != b"\x05\x01" or int.from_bytes(data[2:6], "big") != len(data) - 6:
+        raise IndexerError("Not a packed string: %s" % packed)
+    return data[6:].decode("utf-8")
+
+
+class Indexer(object):
+    def __init__(self, rpc, storage_contract, auction_contract=None, path=":memory:", start_level=0, keep_blocks=KEEP_BLOCKS):
+        self.rpc = rpc
+        self.storage_contract = storage_contract
+        self.auction_contract = auction_contract
+        self.start_level = start_level
+        self.keep_blocks = keep_blocks
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        with self.db:
+            self.db.executescript(SCHEMA)
+            self._check_meta()
+
+    def _check_meta(self):
+        # A database follows one pair of contracts; pointing it at others would mix registries.
+        contracts = {"storage": self.storage_contract, "auction": self.auction_contract or ""}
+        for key, value in contracts.items():
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.db.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, value))
+            elif row["value"] != value:
+                raise IndexerError("The database indexes %s contract %s, not %s" % (key, row["value"], value))
+
+    def close(self):
+        self.db.close()
+
+    # -- checkpoint ----------------------------------------------------
+
+    @property
+    def level(self):
+        """Last block applied, or None before the first sync."""
+        row = self.db.execute("SELECT MAX(level) AS level FROM blocks").fetchone()
+        return row["level"]
+
+    def block_hash(self, level):
+        row = self.db.execute("SELECT hash FROM blocks WHERE level = ?", (level,)).fetchone()
+        return row and row["hash"]
+
+    def sync(self, max_blocks=None):
+        """Follow the node's chain up to its head; return the level reached.
+
+        Stored blocks that are no longer on the chain are rolled back first.
+        ``max_blocks`` bounds the blocks applied in one call, e.g. to catch
+        up in slices.
+        """
+        applied = 0
+        while max_blocks is None or applied < max_blocks:
+            head = self.rpc.header()
+            level = self.level
+            if level is None:
+                if head["level"] < self.start_level:
+                    break
+                self.apply_block(self.rpc.block(self.start_level))
+            elif level > head["level"] or (level == head["level"] and head["hash"] != self.block_hash(level)):
+                self.rollback(level)
+                continue
+            elif level == head["level"]:
+                break
+            else:
+                block = self.rpc.block(level + 1)
+                if block["header"]["predecessor"] != self.block_hash(level):
+                    self.rollback(level)
+                    continue
+                self.apply_block(block)
+            applied += 1
+        return self.level
+
+    def apply_block(self, block):
+        header = block["header"]
+        level = header["level"]
+        with self.db:
+            for tag, payload in block_events(block, self.storage_contract):
+                handler = STORAGE_EVENTS.get(tag)
+                if handler is not None:
+                    handler(self, level, payload)
+            if self.auction_contract is not None:
+                for tag, payload in block_events(block, self.auction_contract):
+                    handler = AUCTION_EVENTS.get(tag)
+                    if handler is not None:
+                        handler(self, level, payload)
+            self.db.execute(
+                "INSERT INTO blocks (level, hash, predecessor) VALUES (?, ?, ?)",
+                (level, header["hash"], header.get("predecessor"))
+            )
+            self.db.execute("DELETE FROM journal WHERE level <= ?", (level - self.keep_blocks,))
+            self.db.execute("DELETE FROM blocks WHERE level <= ?", (level - self.keep_blocks,))
+
+    def rollback(self, level):
+        """Undo the block stored at ``level``, which must be the last one."""
+        if level != self.level:
+            raise IndexerError("Only the last block (%s) can be rolled back, not %d" % (self.level, level))
+        if level > self.start_level and self.block_hash(level - 1) is None:
+            raise IndexerError("Reorganisation deeper than the %d blocks kept at level %d" % (self.keep_blocks, level))
+        with self.db:
+            changes = self.db.execute("SELECT tbl, key, row FROM journal WHERE level = ? ORDER BY id DESC", (level,)).fetchall()
+            for change in changes:
+                key = json.loads(change["key"])
+                self._delete(change["tbl"], key)
+                if change["row"] is not None:
+                    self._insert(change["tbl"], json.loads(change["row"]))
+            self.db.execute("DELETE FROM journal WHERE level = ?", (level,))
+            self.db.execute("DELETE FROM blocks WHERE level = ?", (level,))
+
+    # -- journaled writes ----------------------------------------------
+
+    def _where(self, key):
+        return " AND ".join("%s = ?" % column for column in key), tuple(key.values())
+
+    def _row(self, table, key):
+        where, args = self._where(key)
+        row = self.db.execute("SELECT * FROM %s WHERE %s" % (table, where), args).fetchone()
+        return None if row is None else dict(row)
+
+    def _insert(self, table, row):
+        self.db.execute(
+            "INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(row), ", ".join("?" * len(row))),
+            tuple(row.values())
+        )
+
+    def _delete(self, table, key):
+        where, args = self._where(key)
+        self.db.execute("DELETE FROM %s WHERE %s" % (table, where), args)
+
+    def put(self, level, table, row):
+        """Write ``row`` over the row with the same key, or delete that row when only the key is given."""
+        key = dict((column, row[column]) for column in KEYS[table])
+        old = self._row(table, key)
+        self.db.execute(
+            "INSERT INTO journal (level, tbl, key, row) VALUES (?, ?, ?, ?)",
+            (level, table, json.dumps(key), None if old is None else json.dumps(old))
+        )
+        self._delete(table, key)
+        if len(row) > len(key):
+            self._insert(table, row)
+
+    def update(self, level, table, **row):
+        """Change some columns of an existing row."""
+        old = self._row(table, dict((column, row[column]) for column in KEYS[table]))
+        if old is None:
+            raise IndexerError("%s has no row %s" % (table, json.dumps(row)))
+        old.update(row)
+        self.put(level, table, old)
+
+    # -- events --------------------------------------------------------
+
+    def on_register_safle_id(self, level, e):
+        self.put(level, "safle_ids", {"safle_id": e["safleId"], "owner": e["user"], "level": level})
+
+    def on_update_safle_id(self, level, e):
+        self.put(level, "safle_ids", {"safle_id": e["oldSafleId"]})
+        self.put(level, "old_names", {"kind": "safleId", "owner": e["user"], "name": e["oldSafleId"], "level": level})
+        self.put(level, "safle_ids", {"safle_id": e["newSafleId"], "owner": e["user"], "level": level})
+
+    def on_transfer_safle_id(self, level, e):
+        self.put(level, "old_names", {"kind": "safleId", "owner": e["oldOwner"], "name": e["safleId"], "level": level})
+        self.put(level, "safle_ids", {"safle_id": e["safleId"], "owner": e["newOwner"], "level": level})
+
+    def on_register_registrar(self, level, e):
+        self.put(level, "registrars", {"name": e["name"], "registrar": e["registrar"], "level": level})
+
+    def on_update_registrar(self, level, e):
+        self.put(level, "registrars", {"name": e["oldName"]})
+        self.put(level, "old_names", {"kind": "registrar", "owner": e["registrar"], "name": e["oldName"], "level": level})
+        self.put(level, "registrars", {"name": e["newName"], "registrar": e["registrar"], "level": level})
+
+    def on_map_coin(self, level, e):
+        self.put(level, "coins", {"coin_index": e["index"], "coin_name": e["coinName"], "alias_name": e["aliasName"]})
+
+    def on_coin_address(self, level, e):
+        # Like coinAddressToSafleId, a replaced address keeps resolving to the SafleID.
+        self.put(level, "coin_addresses", {"safle_id": e["safleId"], "coin_index": e["index"], "address": e["address"]})
+        self.put(level, "coin_address_owners", {"address": e["address"], "safle_id": e["safleId"]})
+
+    def on_import(self, level, e):
+        # importRegistry carries raw big_map entries. Names are keyed by their
+        # hash there, so current names come from the accounts and old ones
+        # from the packed names of the history.
+        for address, account in e["accounts"]:
+            if account["isAddressTaken"]:
+                self.put(level, "safle_ids", {"safle_id": account["safleId"], "owner": address, "level": level})
+            if account["isRegistrar"]:
+                self.put(level, "registrars", {"name": account["registrarName"], "registrar": address, "level": level})
+        for kind, history in (("safleId", "resolveOldSafleIdFromAddress"), ("registrar", "resolveOldRegistrarAddress")):
+            for (owner, _), name in e[history]:
+                self.put(level, "old_names", {"kind": kind, "owner": owner, "name": unpacked_string(name), "level": level})
+        for index, coin in e["OtherCoin"]:
+            self.put(level, "coins", {"coin_index": index, "coin_name": coin["coinName"], "alias_name": coin["aliasName"]})
+        for safle_id, addresses in e["safleIdToCoinAddress"]:
+            for index, address in addresses.items():
+                self.put(level, "coin_addresses", {"safle_id": safle_id, "coin_index": index, "address": address})
+        for address, safle_id in e["coinAddressToSafleId"]:
+            self.put(level, "coin_address_owners", {"address": address, "safle_id": safle_id})
+
+    def on_auction(self, level, e):
+        self.put(level, "auctions", {
+            "auction_id": e["auctionId"], "safle_id": e["safleId"], "conductor": e["conductor"],
+            "ends": michelson.sort_key({"prim": "timestamp"}, e["auctionLastFor"]),
+            "highest_bidder": None, "highest_bid": 0, "settled": 0, "level": level,
+        })
+
+    def on_bid(self, level, e):
+        self.put(level, "bids", {"auction_id": e["auctionId"], "bidder": e["bidder"], "amount": e["bid"]})
+        self.update(level, "auctions", auction_id=e["auctionId"], highest_bidder=e["bidder"], highest_bid=e["bid"])
+
+    def on_settle_auction(self, level, e):
+        self.update(level, "auctions", auction_id=e["auctionId"], settled=1)
+
+    def on_withdraw_bid(self, level, e):
+        self.put(level, "bids", {"auction_id": e["auctionId"], "bidder": e["bidder"]})
+
+    # -- lookups -------------------------------------------------------
+
+    def _one(self, query, args, what):
+        row = self.db.execute(query, args).fetchone()
+        if row is None:
+            raise NotRegistered("%s is not registered" % what)
+        return row[0]
+
+    def resolve_safle_id(self, safle_id):
+        """Address owning ``safle_id``."""
+        return self._one("SELECT owner FROM safle_ids WHERE safle_id = ?", (safle_id,), "resolveSafleId(%s)" % safle_id)
+
+    def resolve_registrar_name(self, name):
+        """Address of the registrar called ``name``."""
+        return self._one("SELECT registrar FROM registrars WHERE name = ?", (name,), "resolveRegistrarName(%s)" % name)
+
+    def coin_address_to_id(self, address):
+        """SafleID a coin address is registered to."""
+        return self._one("SELECT safle_id FROM coin_address_owners WHERE address = ?", (address,), "coinAddressToId(%s)" % address)
+
+    def id_to_coin_address(self, safle_id, index):
+        """Coin address registered for ``safle_id`` at coin ``index``."""
+        return self._one(
+            "SELECT address FROM coin_addresses WHERE safle_id = ? AND coin_index = ?", (safle_id, index),
+            "idToCoinAddress(%s, %d)" % (safle_id, index)
+        )
+
+    def safle_ids_of(self, owner):
+        """SafleIDs ``owner`` holds, most recently acquired first."""
+        rows = self.db.execute("SELECT safle_id FROM safle_ids WHERE owner = ? ORDER BY level DESC, safle_id", (owner,))
+        return [row[0] for row in rows]
+
+    def registrar_names_of(self, registrar):
+        rows = self.db.execute("SELECT name FROM registrars WHERE registrar = ? ORDER BY name", (registrar,))
+        return [row[0] for row in rows]
+
+    def old_names(self, owner, kind="safleId"):
+        """Names ``owner`` used to hold, oldest first; ``kind`` is "safleId" or "registrar"."""
+        rows = self.db.execute(
+            "SELECT name FROM old_names WHERE kind = ? AND owner = ? ORDER BY level, name", (kind, owner)
+        )
+        return [row[0] for row in rows]
+
+    def search(self, prefix, limit=10, registrars=False):
+        """Names starting with ``prefix`` in order, SafleIDs or (``registrars``) registrar names.
+
+        SafleIDs are stored lower case, so the prefix is too.
+        """
+        table, column = ("registrars", "name") if registrars else ("safle_ids", "safle_id")
+        prefix = prefix.lower()
+        rows = self.db.execute(
+            "SELECT {c} FROM {t} WHERE {c} >= ? AND {c} < ? ORDER BY {c} LIMIT ?".format(t=table, c=column),
+            (prefix, prefix + PREFIX_END, limit)
+        )
+        return [row[0] for row in rows]
+
+    def auction(self, auction_id):
+        """The auction as a dict, with its outstanding bids under "bids" (bidder -> mutez)."""
+        row = self.db.execute("SELECT * FROM auctions WHERE auction_id = ?", (auction_id,)).fetchone()
+        if row is None:
+            raise NotRegistered("Auction %d does not exist" % auction_id)
+        auction = dict(row)
+        auction["settled"] = bool(auction["settled"])
+        bids = self.db.execute("SELECT bidder, amount FROM bids WHERE auction_id = ? ORDER BY amount DESC, bidder", (auction_id,))
+        auction["bids"] = dict((bid["bidder"], bid["amount"]) for bid in bids)
+        return auction
+
+    def auctions_of(self, safle_id):
+        """Ids of the auctions of ``safle_id``, oldest first."""
+        rows = self.db.execute("SELECT auction_id FROM auctions WHERE safle_id = ? ORDER BY auction_id", (safle_id,))
+        return [row[0] for row in rows]
+
+    def expired_auctions(self, now, limit=MAX_SETTLE_BATCH):
+        """Ids of the auctions ended by ``now`` (seconds) and not settled, earliest end first."""
+        rows = self.db.execute(
+            "SELECT auction_id FROM auctions WHERE settled = 0 AND ends <= ? ORDER BY ends, auction_id LIMIT ?",
+            (now, limit)
+        )
+        return [row[0] for row in rows]
+
+
+STORAGE_EVENTS = {
+    "registerSafleId": Indexer.on_register_safle_id,
+    "updateSafleId": Indexer.on_update_safle_id,
+    "transferSafleId": Indexer.on_transfer_safle_id,
+    "registerRegistrar": Indexer.on_register_registrar,
+    "updateRegistrar": Indexer.on_update_registrar,
+    "mapCoin": Indexer.on_map_coin,
+    "registerCoinAddress": Indexer.on_coin_address,
+    "updateCoinAddress": Indexer.on_coin_address,
+    "importRegistry": Indexer.on_import,
+}
+
+AUCTION_EVENTS = {
+    "auctionSafleId": Indexer.on_auction,
+    "bidForSafleId": Indexer.on_bid,
+    "settleAuction": Indexer.on_settle_auction,
+    "withdrawBid": Indexer.on_withdraw_bid,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sync_cmd = sub.add_parser("sync", help="index the blocks up to the head")
+    search_cmd = sub.add_parser("search", help="list the SafleIDs starting with a prefix")
+    expired_cmd = sub.add_parser("expired", help="list the ended auctions that are not settled")
+    for cmd in (sync_cmd, search_cmd, expired_cmd):
+        cmd.add_argument("db", help="SQLite database file")
+    sync_cmd.add_argument("--endpoint", required=True)
+    sync_cmd.add_argument("--storage", required=True, help="RegistrarStorage address")
+    sync_cmd.add_argument("--auction", help="Auction address")
+    sync_cmd.add_argument("--start-level", type=int, default=0, help="level the contracts were originated at")
+    sync_cmd.add_argument("--follow", action="store_true", help="keep following new blocks")
+    sync_cmd.add_argument("--interval", type=float, default=5.0, help="seconds between polls with --follow")
+    search_cmd.add_argument("prefix")
+    search_cmd.add_argument("--limit", type=int, default=10)
+    search_cmd.add_argument("--registrars", action="store_true", help="search registrar names instead")
+    expired_cmd.add_argument("--now", type=int, help="seconds since the epoch (default: the clock)")
+    expired_cmd.add_argument("--limit", type=int, default=MAX_SETTLE_BATCH)
+    args = parser.parse_args(argv)
+
+    if args.command in ("search", "expired"):
+        db = sqlite3.connect(args.db)
+        contracts = dict(db.execute("SELECT key, value FROM meta"))
+        db.close()
+        indexer = Indexer(None, contracts["storage"], contracts["auction"] or None, path=args.db)
+        if args.command == "search":
+            names = indexer.search(args.prefix, args.limit, args.registrars)
+        else:
+            names = indexer.expired_auctions(int(time.time()) if args.now is None else args.now, args.limit)
+        for name in names:
+            print(name)
+        return 0
+
+    indexer = Indexer(RpcClient(args.endpoint), args.storage, args.auction, path=args.db, start_level=args.start_level)
+    while True:
+        print("indexed up to level %s" % indexer.sync())
+        if not args.follow:
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
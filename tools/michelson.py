@@ -0,0 +1,386 @@
+"""Helpers for the compiled Micheline JSON that compile.sh writes to build/.
+
+The tools in this package never import SmartPy: they work from the
+compiled contracts, so everything here is plain Python. Values are
+converted between Python and Micheline using the types found in the
+compiled script, which means record fields are addressed by the same
+names as in the SmartPy sources (e.g. ``_safleId``).
+"""
+
+import calendar
+import hashlib
+import json
+import os
+import time
+
+BUILD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "build")
+
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+# Base58check prefixes and the tag used by the binary address encoding.
+ADDRESS_PREFIXES = {
+    "tz1": (bytes.fromhex("06a19f"), b"\x00\x00"),
+    "tz2": (bytes.fromhex("06a1a1"), b"\x00\x01"),
+    "tz3": (bytes.fromhex("06a1a4"), b"\x00\x02"),
+    "KT1": (bytes.fromhex("025a79"), b"\x01"),
+}
+
+
+class MichelsonError(Exception):
+    pass
+
+
+def b58check_encode(payload):
+    data = payload + hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    number = int.from_bytes(data, "big")
+    encoded = ""
+    while number:
+        number, rest = divmod(number, 58)
+        encoded = B58_ALPHABET[rest] + encoded
+    leading = len(data) - len(data.lstrip(b"\x00"))
+    return "1" * leading + encoded
+
+
+def b58check_decode(string):
+    number = 0
+    for char in string:
+        number = number * 58 + B58_ALPHABET.index(char)
+    data = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    data = b"\x00" * (len(string) - len(string.lstrip("1"))) + data
+    payload, checksum = data[:-4], data[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        raise MichelsonError("Bad base58 checksum: %s" % string)
+    return payload
+
+
+def make_address(seed, kind="tz1"):
+    """Deterministic, syntactically valid address derived from ``seed``."""
+    prefix, _ = ADDRESS_PREFIXES[kind]
+    digest = hashlib.blake2b(str(seed).encode(), digest_size=20).digest()
+    return b58check_encode(prefix + digest)
+
+
+def address_bytes(address):
+    """Binary encoding of an address, which is also its comparison order."""
+    address, _, entrypoint = address.partition("%")
+    prefix, tag = ADDRESS_PREFIXES[address[:3]]
+    digest = b58check_decode(address)[len(prefix):]
+    encoded = tag + digest + (b"\x00" if address.startswith("KT1") else b"")
+    return encoded + entrypoint.encode()
+
+
+def load_contract(name, build_dir=BUILD_DIR):
+    """Return the toplevel sections of ``build/<name>.json``.
+
+    The result maps ``parameter``, ``storage`` and ``code`` to their
+    Micheline and ``views`` to a dict of name -> (input, output, code).
+    """
+    with open(os.path.join(build_dir, "%s.json" % name)) as f:
+        script = json.load(f)
+    sections = {"views": {}}
+    for section in script:
+        if section["prim"] == "view":
+            name_node, input_type, output_type, code = section["args"]
+            sections["views"][name_node["string"]] = (input_type, output_type, code)
+        else:
+            sections[section["prim"]] = section["args"][0]
+    return sections
+
+
+def load_storage(name, build_dir=BUILD_DIR):
+    with open(os.path.join(build_dir, "%s_storage.json" % name)) as f:
+        return json.load(f)
+
+
+def annotation(node):
+    for annot in node.get("annots", []):
+        if annot.startswith("%"):
+            return annot[1:]
+    return None
+
+
+def pair_args(node):
+    """Arguments of a pair type or value, with n-ary combs folded to binary."""
+    args = node["args"]
+    if len(args) > 2:
+        return [args[0], dict(node, args=args[1:], annots=[])]
+    return args
+
+
+def entrypoints(parameter_type):
+    """Map every ``%entrypoint`` annotation of an or-tree to its type."""
+    found = {}
+
+    def walk(node):
+        name = annotation(node)
+        if name is not None:
+            found[name] = node
+        elif node["prim"] == "or":
+            for arg in node["args"]:
+                walk(arg)
+
+    walk(parameter_type)
+    if not found:
+        found["default"] = parameter_type
+    return found
+
+
+def _timestamp(value):
+    if isinstance(value, int):
+        return value
+    return calendar.timegm(time.strptime(value.replace("Z", ""), "%Y-%m-%dT%H:%M:%S"))
+
+
+def sort_key(ty, value):
+    """Python sort key matching Michelson's COMPARE for ``value`` of ``ty``."""
+    prim = ty["prim"]
+    if prim in ("int", "nat", "mutez"):
+        return int(value)
+    if prim == "timestamp":
+        return _timestamp(value)
+    if prim == "string":
+        return value.encode()
+    if prim == "bytes":
+        return bytes.fromhex(value) if isinstance(value, str) else bytes(value)
+    if prim in ("address", "key_hash"):
+        return address_bytes(value)
+    if prim == "bool":
+        return bool(value)
+    if prim == "unit":
+        return 0
+    if prim == "option":
+        return (0,) if value is None else (1, sort_key(ty["args"][0], value))
+    if prim == "pair":
+        left, right = pair_args(ty)
+        if isinstance(value, dict):
+            return tuple(sort_key(arg, _field_value(arg, value)) for arg in (left, right))
+        return (sort_key(left, value[0]), sort_key(right, value[1]))
+    raise MichelsonError("Type %s is not comparable" % prim)
+
+
+def _field_value(arg, record):
+    name = annotation(arg)
+    if name is None and arg["prim"] == "pair":
+        return record
+    return record[name]
+
+
+def encode(ty, value):
+    """Convert a Python value to Micheline using the type ``ty``.
+
+    Records are dicts keyed by field name, maps are dicts, lists/sets are
+    lists, options are ``None`` or the value, ``or`` values are
+    ``(entrypoint_or_field_name, value)`` or ``("Left"/"Right", value)``.
+    Micheline nodes (dicts with "prim", "int", "string" or "bytes") and
+    lambdas are passed through.
+    """
+    prim = ty["prim"]
+    if isinstance(value, dict) and prim not in ("pair", "map", "big_map"):
+        if "prim" in value or "int" in value or "string" in value or "bytes" in value:
+            return value
+        if len(value) == 1:
+            # SmartPy compiles single-field records to the bare field type.
+            value = list(value.values())[0]
+    if prim in ("int", "nat", "mutez"):
+        return {"int": str(int(value))}
+    if prim == "timestamp":
+        return {"int": str(_timestamp(value))}
+    if prim in ("string", "address", "key_hash", "key", "signature", "chain_id"):
+        return {"string": value}
+    if prim == "bytes":
+        return {"bytes": value if isinstance(value, str) else bytes(value).hex()}
+    if prim == "bool":
+        return {"prim": "True" if value else "False"}
+    if prim == "unit":
+        return {"prim": "Unit"}
+    if prim == "option":
+        if value is None:
+            return {"prim": "None"}
+        return {"prim": "Some", "args": [encode(ty["args"][0], value)]}
+    if prim == "pair":
+        left, right = pair_args(ty)
+        if isinstance(value, dict):
+            return {"prim": "Pair", "args": [encode(arg, _field_value(arg, value)) for arg in (left, right)]}
+        return {"prim": "Pair", "args": [encode(left, value[0]), encode(right, value[1])]}
+    if prim == "or":
+        branch, inner = value
+        path = _or_path(ty, branch)
+        if path is None:
+            raise MichelsonError("No branch %r in or type" % branch)
+        node_type = ty
+        for side in path:
+            node_type = node_type["args"][0 if side == "Left" else 1]
+        node = encode(node_type, inner)
+        for side in reversed(path):
+            node = {"prim": side, "args": [node]}
+        return node
+    if prim in ("list", "set"):
+        items = list(value)
+        if prim == "set":
+            items = sorted(items, key=lambda item: sort_key(ty["args"][0], item))
+        return [encode(ty["args"][0], item) for item in items]
+    if prim in ("map", "big_map"):
+        key_type, value_type = ty["args"]
+        items = sorted(value.items(), key=lambda item: sort_key(key_type, item[0]))
+        return [{"prim": "Elt", "args": [encode(key_type, k), encode(value_type, v)]} for k, v in items]
+    if prim == "lambda":
+        return value
+    raise MichelsonError("Cannot encode type %s" % prim)
+
+
+def _or_path(ty, branch):
+    if branch in ("Left", "Right"):
+        return [branch]
+    if annotation(ty) == branch:
+        return []
+    if ty["prim"] != "or":
+        return None
+    for side, arg in zip(("Left", "Right"), ty["args"]):
+        if annotation(arg) == branch:
+            return [side]
+        sub = _or_path(arg, branch) if arg["prim"] == "or" and annotation(arg) is None else None
+        if sub is not None:
+            return [side] + sub
+    return None
+
+
+def decode(ty, node):
+    """Inverse of :func:`encode` for the value shapes it produces.
+
+    big_maps stored by id (an ``int`` node) are returned as that int.
+    """
+    prim = ty["prim"]
+    if prim in ("int", "nat", "mutez"):
+        return int(node["int"])
+    if prim == "timestamp":
+        return int(node["int"]) if "int" in node else node["string"]
+    if prim in ("string", "address", "key_hash", "key", "signature", "chain_id"):
+        if "bytes" in node:
+            raise MichelsonError("Optimized %s values are not supported" % prim)
+        return node["string"]
+    if prim == "bytes":
+        return node["bytes"]
+    if prim == "bool":
+        return node["prim"] == "True"
+    if prim == "unit":
+        return None
+    if prim == "option":
+        return None if node["prim"] == "None" else decode(ty["args"][0], node["args"][0])
+    if prim == "pair":
+        left, right = pair_args(ty)
+        left_node, right_node = pair_args(node) if isinstance(node, dict) else _list_pair(node)
+        values = (decode(left, left_node), decode(right, right_node))
+        if not _is_record(ty):
+            return values
+        record = {}
+        for arg, sub in zip((left, right), values):
+            if annotation(arg) is None:
+                record.update(sub)
+            else:
+                record[annotation(arg)] = sub
+        return record
+    if prim == "or":
+        side = node["prim"]
+        arg = ty["args"][0 if side == "Left" else 1]
+        name = annotation(arg)
+        inner = decode(arg, node["args"][0])
+        if name is None and arg["prim"] == "or":
+            return inner
+        return (name or side, inner)
+    if prim in ("list", "set"):
+        return [decode(ty["args"][0], item) for item in node]
+    if prim in ("map", "big_map"):
+        if isinstance(node, dict) and "int" in node:
+            return int(node["int"])
+        key_type, value_type = ty["args"]
+        return {_hashable(decode(key_type, elt["args"][0])): decode(value_type, elt["args"][1]) for elt in node}
+    if prim == "lambda":
+        return node
+    raise MichelsonError("Cannot decode type %s" % prim)
+
+
+def _is_record(ty):
+    for arg in pair_args(ty):
+        if annotation(arg) is None and not (arg["prim"] == "pair" and _is_record(arg)):
+            return False
+    return True
+
+
+def _list_pair(node):
+    if len(node) > 2:
+        return [node[0], node[1:]]
+    return node
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return tuple(sorted(value.items()))
+    return value
+
+
+def get_field(ty, value, name):
+    """Read the storage field ``name`` from a Micheline ``value`` of type ``ty``."""
+    path = field_path(ty, name)
+    if path is None:
+        raise MichelsonError("No field %s" % name)
+    for index in path:
+        value = pair_args(value)[index]
+    return value
+
+
+def set_field(ty, value, name, new_value):
+    """Return a copy of ``value`` with field ``name`` replaced by ``new_value``."""
+    path = field_path(ty, name)
+    if path is None:
+        raise MichelsonError("No field %s" % name)
+
+    def replace(node, rest):
+        if not rest:
+            return new_value
+        args = list(pair_args(node))
+        args[rest[0]] = replace(args[rest[0]], rest[1:])
+        return dict(node, args=args)
+
+    return replace(value, path)
+
+
+def field_path(ty, name):
+    if annotation(ty) == name:
+        return []
+    if ty["prim"] != "pair":
+        return None
+    for index, arg in enumerate(pair_args(ty)):
+        if annotation(arg) == name:
+            return [index]
+        if arg["prim"] == "pair" and annotation(arg) is None:
+            sub = field_path(arg, name)
+            if sub is not None:
+                return [index] + sub
+    return None
+
+
+def to_text(node, nested=False):
+    """Render Micheline JSON in Michelson concrete syntax."""
+    if isinstance(node, list):
+        if not node:
+            return "{}"
+        return "{ " + " ; ".join(to_text(item) for item in node) + " }"
+    if "int" in node:
+        return node["int"]
+    if "string" in node:
+        return json.dumps(node["string"])
+    if "bytes" in node:
+        return "0x" + node["bytes"]
+    parts = [node["prim"]] + list(node.get("annots", []))
+    parts += [to_text(arg, nested=True) for arg in node.get("args", [])]
+    text = " ".join(parts)
+    if nested and len(parts) > 1:
+        return "(" + text + ")"
+    return text
+
+
+def script_text(name, build_dir=BUILD_DIR):
+    """Full Michelson source of a compiled contract, ready for octez-client."""
+    with open(os.path.join(build_dir, "%s.json" % name)) as f:
+        script = json.load(f)
+    return "\n".join(to_text(section) + " ;" for section in script)
@@ -0,0 +1,232 @@
+"""Bulk migration of the registry into a new RegistrarStorage.
+
+The registry of the old contract comes as a JSON dump:
+
+    {
+      "totalRegistrars": 12,
+      "totalSafleIdRegistered": 3400,
+      "bigMaps": {
+        "accounts": [[<key>, <value>], ...],
+        "resolveAddressFromSafleId": [[<key>, <value>], ...],
+        ...
+      }
+    }
+
+with keys and values in Micheline JSON, as an indexer returns big_map
+entries. The entries are split into chunks that stay under a byte and a
+gas budget, each chunk is one ``importRegistry`` call by the owner, and
+``sealImport`` sets the totals and closes the import:
+
+    python -m tools.migrate plan dump.json                  # chunk sizes only
+    python -m tools.migrate import dump.json KT1... --sender owner --endpoint http://localhost:8732
+    python -m tools.migrate verify dump.json KT1... --endpoint http://localhost:8732
+
+``verify`` reads every entry of the dump back from the node and compares
+the number of entries of each big_map, so the new contract holds exactly
+the dump. It works against the old contract too, to check the dump.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+
+from tools import codesize, michelson
+from tools.octez import OctezClient
+from tools.rpc import RpcClient
+
+# Bytes of chunk parameter per operation; an operation is at most 32 KiB.
+MAX_BYTES = 16000
+
+# Rough gas model of an importRegistry call: a fixed part for the call, and
+# per entry the parameter decoding, the key hashing and the big_map write.
+# The default budget is half the per-operation limit, which covers the error
+# of an estimate this coarse.
+MAX_GAS = 520000
+GAS_PER_OPERATION = 10000
+GAS_PER_ENTRY = 1500
+GAS_PER_BYTE = 10
+
+TOTALS = ("totalRegistrars", "totalSafleIdRegistered")
+
+# b58check prefix of script expression hashes ("expr...").
+EXPR_PREFIX = b"\x0d\x2c\x40\x1b"
+
+
+class MigrationError(Exception):
+    pass
+
+
+def load_dump(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def chunks(dump, max_bytes=MAX_BYTES, max_gas=MAX_GAS):
+    """Split the big_map entries of ``dump`` into dicts of big_map name -> ``Pair key value`` nodes."""
+    current, size, gas = {}, 0, GAS_PER_OPERATION
+    for name in sorted(dump["bigMaps"]):
+        for key, value in dump["bigMaps"][name]:
+            entry = {"prim": "Pair", "args": [key, value]}
+            entry_size = len(codesize.encode(entry))
+            entry_gas = GAS_PER_ENTRY + GAS_PER_BYTE * entry_size
+            if entry_size > max_bytes or GAS_PER_OPERATION + entry_gas > max_gas:
+                raise MigrationError("An entry of %s does not fit in a chunk: %s" % (name, json.dumps(key)))
+            if current and (size + entry_size > max_bytes or gas + entry_gas > max_gas):
+                yield current
+                current, size, gas = {}, 0, GAS_PER_OPERATION
+            current.setdefault(name, []).append(entry)
+            size += entry_size
+            gas += entry_gas
+    if current:
+        yield current
+
+
+def record_fields(ty):
+    """Names of the fields of a record type."""
+    names = []
+    for arg in michelson.pair_args(ty):
+        if arg["prim"] == "pair" and michelson.annotation(arg) is None:
+            names += record_fields(arg)
+        else:
+            names.append(michelson.annotation(arg))
+    return names
+
+
+def chunk_parameter(ty, chunk):
+    """The ``importRegistry`` argument of type ``ty`` for ``chunk``; missing big_maps get no entries."""
+    unknown = set(chunk) - set(record_fields(ty))
+    if unknown:
+        raise MigrationError("importRegistry takes no %s" % ", ".join(sorted(unknown)))
+
+    def fill(node):
+        if node["prim"] == "list":
+            return chunk.get(michelson.annotation(node), [])
+        return {"prim": "Pair", "args": [fill(arg) for arg in michelson.pair_args(node)]}
+
+    return fill(ty)
+
+
+def seal_parameter(ty, dump):
+    return michelson.encode(ty, dict(("_" + total, dump[total]) for total in TOTALS))
+
+
+def _packable(ty, node):
+    # PACK writes addresses in binary whatever form the node shows them in.
+    if ty["prim"] == "address" and "string" in node:
+        return {"bytes": michelson.address_bytes(node["string"]).hex()}
+    if ty["prim"] == "pair":
+        return {"prim": "Pair", "args": [_packable(t, n) for t, n in zip(michelson.pair_args(ty), michelson.pair_args(node))]}
+    return node
+
+
+def script_expr_hash(ty, key):
+    """Hash a node looks big_map keys up by: ``expr...`` of the packed key."""
+    packed = b"\x05" + codesize.encode(_packable(ty, key))
+    return michelson.b58check_encode(EXPR_PREFIX + hashlib.blake2b(packed, digest_size=32).digest())
+
+
+def _decoded(ty, node):
+    try:
+        return michelson.decode(ty, node)
+    except michelson.MichelsonError:
+        return node
+
+
+def verify(rpc, contract, dump, sealed=True):
+    """Differences between ``dump`` and the registry of ``contract`` on the node, one string each."""
+    script = rpc.script(contract)
+    storage_type = next(section for section in script["code"] if section["prim"] == "storage")["args"][0]
+    storage = script["storage"]
+
+    def field(name):
+        return michelson.get_field(storage_type, storage_type, name), michelson.get_field(storage_type, storage, name)
+
+    problems = []
+    for total in TOTALS:
+        actual = michelson.decode(*field(total))
+        if actual != dump[total]:
+            problems.append("%s: %d on chain, %d in the dump" % (total, actual, dump[total]))
+    if sealed and michelson.field_path(storage_type, "importSealed") is not None and not michelson.decode(*field("importSealed")):
+        problems.append("the import is not sealed")
+
+    for name in sorted(dump["bigMaps"]):
+        ty, node = field(name)
+        big_map, (key_type, value_type) = int(node["int"]), ty["args"]
+        entries = dump["bigMaps"][name]
+        for key, value in entries:
+            actual = rpc.big_map_value(big_map, script_expr_hash(key_type, key))
+            if actual is None:
+                problems.append("%s: %s is missing" % (name, json.dumps(key)))
+            elif _decoded(value_type, actual) != _decoded(value_type, value):
+                problems.append("%s: %s is %s on chain, %s in the dump" % (name, json.dumps(key), json.dumps(actual), json.dumps(value)))
+        count = rpc.big_map_size(big_map)
+        if count != len(entries):
+            problems.append("%s: %d entries on chain, %d in the dump" % (name, count, len(entries)))
+    return problems
+
+
+def entrypoint_types(script):
+    parameter_type = next(section for section in script["code"] if section["prim"] == "parameter")["args"][0]
+    types = michelson.entrypoints(parameter_type)
+    if "importRegistry" not in types:
+        raise MigrationError("The contract has no importRegistry entry point")
+    return types
+
+
+def print_plan(planned):
+    for i, chunk in enumerate(planned):
+        size = sum(len(codesize.encode(entry)) for entries in chunk.values() for entry in entries)
+        print("chunk %4d: %s (%d bytes)" % (
+            i, ", ".join("%s %d" % (name, len(entries)) for name, entries in sorted(chunk.items())), size
+        ))
+    print("%d chunks" % len(planned))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    plan_cmd = sub.add_parser("plan", help="print the chunks the dump is split into")
+    import_cmd = sub.add_parser("import", help="import the dump into a contract and verify it")
+    verify_cmd = sub.add_parser("verify", help="compare a contract on a node with the dump")
+    for cmd in (plan_cmd, import_cmd, verify_cmd):
+        cmd.add_argument("dump")
+        cmd.add_argument("--max-bytes", type=int, default=MAX_BYTES)
+        cmd.add_argument("--max-gas", type=int, default=MAX_GAS)
+    for cmd in (import_cmd, verify_cmd):
+        cmd.add_argument("contract")
+        cmd.add_argument("--endpoint", required=True)
+    import_cmd.add_argument("--sender", required=True, help="octez-client alias of the contract owner")
+    import_cmd.add_argument("--base-dir", help="octez-client base directory")
+    import_cmd.add_argument("--start", type=int, default=0, help="first chunk to send, to resume an import")
+    import_cmd.add_argument("--no-seal", action="store_true", help="leave the import open for another dump")
+    verify_cmd.add_argument("--unsealed", action="store_true", help="do not require the import to be sealed")
+    args = parser.parse_args(argv)
+
+    dump = load_dump(args.dump)
+    planned = list(chunks(dump, args.max_bytes, args.max_gas))
+    if args.command == "plan":
+        print_plan(planned)
+        return 0
+
+    rpc = RpcClient(args.endpoint)
+    if args.command == "import":
+        types = entrypoint_types(rpc.script(args.contract))
+        client = OctezClient(base_dir=args.base_dir, endpoint=args.endpoint)
+        for i in range(args.start, len(planned)):
+            arg = michelson.to_text(chunk_parameter(types["importRegistry"], planned[i]))
+            client.transfer(args.sender, args.contract, "importRegistry", arg)
+            print("chunk %d/%d imported" % (i + 1, len(planned)))
+        if not args.no_seal:
+            client.transfer(args.sender, args.contract, "sealImport", michelson.to_text(seal_parameter(types["sealImport"], dump)))
+            print("import sealed")
+
+    problems = verify(rpc, args.contract, dump, sealed=not (getattr(args, "unsealed", False) or getattr(args, "no_seal", False)))
+    for problem in problems:
+        print(problem)
+    print("%s matches the dump" % args.contract if not problems else "%d differences" % len(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,747 @@
+"""Executable reference model of RegistrarMain, RegistrarStorage and Auction.
+
+Every entry point is modelled in plain Python with the same checks, in the
+same order and with the same messages as its ``sp.verify``; a failing check
+raises :class:`Failure` and the whole call - including the internal calls
+it triggered - is rolled back, as on chain. Views are modelled too, so the
+final state of a trace can be compared with the real contracts.
+
+Addresses are plain strings: test account names, or ``MAIN``, ``STORAGE``
+and ``AUCTION`` for the three contracts. Amounts are mutez, time is seconds.
+
+    model = Model()
+    model.call("main", "registerRegistrar", "registrar", {"_registrarName": "Reg1"})
+    model.call("main", "registerSafleId", "registrar", {"_safleId": "Alice", "_userAddress": "alice"})
+    model.view("storage", "resolveSafleId", {"_safleId": "alice"})   # -> "alice"
+
+Thousands of calls per second make it usable for long randomized runs;
+``tools/differential.py`` replays sampled traces against the SmartPy code.
+"""
+
+MAIN = "MAIN"
+STORAGE = "STORAGE"
+AUCTION = "AUCTION"
+# Placeholder both RegistrarMain and RegistrarStorage start with; no contract lives there.
+UNSET = "KT18amZmM5W7qDWVt2pH6uj7sCEd3kbzLrHT"
+
+MAX_NAME_UPDATES = 5
+AUCTION_BUCKET_SECONDS = 3600
+MAX_SETTLE_BATCH = 20
+NAME_FREE, NAME_SAFLE_ID, NAME_REGISTRAR, NAME_RETIRED, NAME_IN_AUCTION = range(5)
+NOT_OWNER = "sender is not a contract owner"
+NOT_ALPHANUMERIC = "Only alphanumeric allowed in blockchain name and alias name"
+NOT_REGISTERED = "Resolver : User is not yet registered for this SafleID."
+UPPER = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+ALPHANUMERIC = set("abcdefghijklmnopqrstuvwxyz" + UPPER + "0123456789")
+LETTERS = dict((c, c.lower()) for c in "abcdefghijklmnopqrstuvwxyz" + UPPER)
+
+
+class Failure(Exception):
+    """A failed ``sp.verify`` (or FAILWITH); ``message`` is None when it has none."""
+
+    def __init__(self, message=None):
+        Exception.__init__(self, message)
+        self.message = message
+
+
+def verify(condition, message=None):
+    if not condition:
+        raise Failure(message)
+
+
+def get(table, key):
+    """``table[key]`` as SmartPy does it: a missing key fails the call."""
+    if key not in table:
+        raise Failure()
+    return table[key]
+
+
+def to_lower(string):
+    # toLower maps letters only; any other character is a missing map key.
+    return "".join(get(LETTERS, c) for c in string)
+
+
+def check_alpha_numeric(string):
+    for c in string:
+        verify(c in ALPHANUMERIC, NOT_ALPHANUMERIC)
+
+
+def normalize_safle_id(safle_id):
+    verify(4 <= len(safle_id), "SafleId length should be greater than 3 characters")
+    verify(len(safle_id) <= 16, "SafleId length should be less than 17 characters")
+    check_alpha_numeric(safle_id)
+    return safle_id.lower()
+
+
+def is_contract(address):
+    # CheckingContract.isContract tests tz1Ke... > address >= KT18am...; implicit
+    # addresses sort before originated ones, so no address satisfies both.
+    return False
+
+
+def empty_account():
+    return dict(
+        safleId="", isAddressTaken=False, inAuction=False, safleIdUpdates=0,
+        oldSafleIdCount=0, isRegistrar=False, registrarName="", registrarUpdates=0
+    )
+
+
+class Journal(object):
+    """Undo log so a failed call leaves every table as it was."""
+
+    def __init__(self):
+        self.entries = []
+
+    def put(self, table, key, value):
+        self.entries.append((table, key, key in table, table.get(key)))
+        table[key] = value
+
+    def delete(self, table, key):
+        if key in table:
+            self.entries.append((table, key, True, table[key]))
+            del table[key]
+
+    def mark(self):
+        return len(self.entries)
+
+    def rollback(self, mark):
+        while len(self.entries) > mark:
+            table, key, present, old = self.entries.pop()
+            if present:
+                table[key] = old
+            else:
+                table.pop(key, None)
+
+    def commit(self):
+        del self.entries[:]
+
+
+class MainModel(object):
+    def __init__(self, model, owner, wallet):
+        self.model = model
+        self.vars = dict(
+            contractOwner=owner, walletAddress=wallet, safleIdRegStatus=False,
+            registrarStorageContractAddress=UNSET, safleIdFees=0, registrarFees=0,
+            totalFeesCollected=0, totalFeesWithdrawn=0, feeSweepThreshold=0, totalExcessWithdrawn=0,
+            storageContractAddress=False
+        )
+
+    def set(self, name, value):
+        self.model.journal.put(self.vars, name, value)
+
+    def only_owner(self, sender):
+        verify(self.vars["contractOwner"] == sender, NOT_OWNER)
+
+    def check_registration(self):
+        verify(self.vars["safleIdRegStatus"] == False, "SafleId Registration is Paused")
+        verify(self.vars["storageContractAddress"], "storage address not set")
+
+    def fee_checks(self, amount, fees, name):
+        verify(amount >= fees, "Registration fees not matched.")
+        return normalize_safle_id(name)
+
+    def pending_fees(self):
+        return self.vars["totalFeesCollected"] - self.vars["totalFeesWithdrawn"]
+
+    def collect_fees(self, amount):
+        self.set("totalFeesCollected", self.vars["totalFeesCollected"] + amount)
+        if self.vars["feeSweepThreshold"] > 0 and self.pending_fees() >= self.vars["feeSweepThreshold"]:
+            self.sweep_fees(self.pending_fees())
+
+    def sweep_fees(self, amount):
+        self.set("totalFeesWithdrawn", self.vars["totalFeesWithdrawn"] + amount)
+        self.model.transfer(MAIN, self.vars["walletAddress"], amount)
+
+    def storage(self, entrypoint, params):
+        self.model.internal(self.vars["registrarStorageContractAddress"], entrypoint, MAIN, params)
+
+    def setSafleIdFees(self, sender, amount, now, params):
+        self.only_owner(sender)
+        self.set("safleIdFees", params["_amount"])
+
+    def setRegistrarFees(self, sender, amount, now, params):
+        self.only_owner(sender)
+        self.set("registrarFees", params["_amount"])
+
+    def setFeeSweepThreshold(self, sender, amount, now, params):
+        self.only_owner(sender)
+        self.set("feeSweepThreshold", params["_amount"])
+
+    def withdrawFees(self, sender, amount, now, params):
+        self.only_owner(sender)
+        verify(self.pending_fees() > 0, "No fees to withdraw.")
+        self.sweep_fees(self.pending_fees())
+
+    def withdrawExcessBalance(self, sender, amount, now, params):
+        self.only_owner(sender)
+        excess = self.model.balance(MAIN) - self.pending_fees()
+        verify(excess > 0, "No excess balance to withdraw.")
+        self.set("totalExcessWithdrawn", self.vars["totalExcessWithdrawn"] + excess)
+        self.model.transfer(MAIN, self.vars["walletAddress"], excess)
+
+    def toggleRegistrationStatus(self, sender, amount, now, params):
+        self.only_owner(sender)
+        self.set("safleIdRegStatus", not self.vars["safleIdRegStatus"])
+
+    def registerRegistrar(self, sender, amount, now, params):
+        lower = self.fee_checks(amount, self.vars["registrarFees"], params["_registrarName"])
+        self.check_registration()
+        self.collect_fees(amount)
+        self.storage("registerRegistrar", {"_registrar": sender, "_registrarName": lower})
+
+    def updateRegistrar(self, sender, amount, now, params):
+        lower = self.fee_checks(amount, self.vars["registrarFees"], params["_registrarName"])
+        self.check_registration()
+        self.collect_fees(amount)
+        self.storage("updateRegistrar", {"_registrar": sender, "_newRegistrarName": lower})
+
+    def registerSafleId(self, sender, amount, now, params):
+        lower = self.fee_checks(amount, self.vars["safleIdFees"], params["_safleId"])
+        self.check_registration()
+        self.collect_fees(amount)
+        self.storage("registerSafleId", {"_registrar": sender, "_userAddress": params["_userAddress"], "_safleId": lower})
+
+    def registerSafleIds(self, sender, amount, now, params):
+        items = params["_safleIds"]
+        verify(len(items) > 0, "No SafleIDs to register.")
+        verify(amount >= self.vars["safleIdFees"] * len(items), "Registration fees not matched.")
+        self.check_registration()
+        lowered = [{"_userAddress": i["_userAddress"], "_safleId": normalize_safle_id(i["_safleId"])} for i in items]
+        self.collect_fees(amount)
+        self.storage("registerSafleIds", {"_registrar": sender, "_safleIds": lowered})
+
+    def updateSafleId(self, sender, amount, now, params):
+        lower = self.fee_checks(amount, self.vars["safleIdFees"], params["_newSafleId"])
+        self.check_registration()
+        self.collect_fees(amount)
+        self.storage("updateSafleId", {"_registrar": sender, "_userAddress": params["_userAddress"], "_safleId": lower})
+
+    def setStorageContract(self, sender, amount, now, params):
+        self.only_owner(sender)
+        self.set("registrarStorageContractAddress", params["_registrarStorageContract"])
+        self.set("storageContractAddress", True)
+
+    def updateWalletAddress(self, sender, amount, now, params):
+        self.only_owner(sender)
+        verify(not is_contract(params["_walletAddress"]))
+        self.set("walletAddress", params["_walletAddress"])
+
+    def mapCoins(self, sender, amount, now, params):
+        blockchain = to_lower(params["_blockchainName"])
+        alias = to_lower(params["_aliasName"])
+        verify(params["_indexNumber"] != 0)
+        check_alpha_numeric(blockchain)
+        check_alpha_numeric(alias)
+        self.storage("mapCoin", {"_indexnumber": params["_indexNumber"], "_coinName": blockchain, "_aliasName": alias, "_registrar": sender})
+
+    def registerCoinAddress(self, sender, amount, now, params):
+        address = to_lower(params["_address"])
+        verify(params["_index"] != 0)
+        self.storage("registerCoinAddress", {"_userAddress": params["_userAddress"], "_index": params["_index"], "_address": address, "_registrar": sender})
+
+    def updateCoinAddress(self, sender, amount, now, params):
+        address = to_lower(params["_address"])
+        verify(params["_index"] != 0)
+        self.storage("updateCoinAddress", {"_userAddress": params["_userAddress"], "_index": params["_index"], "_newAddress": address, "_registrar": sender})
+
+    def lower_coin_addresses(self, addresses):
+        lowered = {}
+        for index in sorted(addresses):
+            verify(index != 0)
+            lowered[index] = to_lower(addresses[index])
+        return lowered
+
+    def registerCoinAddresses(self, sender, amount, now, params):
+        lowered = self.lower_coin_addresses(params["_addresses"])
+        self.storage("registerCoinAddresses", {"_userAddress": params["_userAddress"], "_addresses": lowered, "_registrar": sender})
+
+    def updateCoinAddresses(self, sender, amount, now, params):
+        lowered = self.lower_coin_addresses(params["_addresses"])
+        self.storage("updateCoinAddresses", {"_userAddress": params["_userAddress"], "_addresses": lowered, "_registrar": sender})
+
+
+class StorageModel(object):
+    def __init__(self, model, owner, main):
+        self.model = model
+        self.vars = dict(contractOwner=owner, mainContract=main, auctionContractAddress=UNSET, totalRegistrars=0, totalSafleIdRegistered=0)
+        # Name keyed registries are keyed by the name itself: the contract's
+        # blake2b(pack(name)) keys are a bijection of it.
+        self.resolveAddressFromSafleId = {}
+        self.accounts = {}
+        self.coinAddressToSafleId = {}
+        self.OtherCoin = {}
+        self.isCoinMapped = {}
+        self.safleIdToCoinAddress = {}
+        self.registrarNameToAddress = {}
+        self.resolveOldSafleIdFromAddress = {}
+        self.resolveOldSafleID = {}
+        self.resolveOldRegistrarAddress = {}
+        self.unavailableSafleIds = {}
+
+    @property
+    def journal(self):
+        return self.model.journal
+
+    def set(self, name, value):
+        self.journal.put(self.vars, name, value)
+
+    def account(self, address):
+        return dict(self.accounts.get(address) or empty_account())
+
+    def is_registrar(self, address):
+        return self.account(address)["isRegistrar"]
+
+    def only_owner(self, sender):
+        verify(self.vars["contractOwner"] == sender)
+
+    def only_main(self, sender):
+        verify(self.vars["mainContract"] == sender)
+
+    def only_auction(self, sender):
+        verify(sender == self.vars["auctionContractAddress"])
+
+    def registrar_checks(self, name):
+        verify(name not in self.registrarNameToAddress, "Registrar name is already taken.")
+        verify(name not in self.resolveAddressFromSafleId, "This Registrar name is already registered as an SafleID.")
+
+    def failure(self, message, safle_id, report_id):
+        return (safle_id, message) if report_id else message
+
+    def safle_id_available(self, safle_id, report_id=False):
+        verify(safle_id not in self.registrarNameToAddress, self.failure("This SafleId is taken by a Registrar.", safle_id, report_id))
+        verify(safle_id not in self.resolveAddressFromSafleId, self.failure("This SafleId is already registered.", safle_id, report_id))
+        verify(safle_id not in self.unavailableSafleIds, self.failure("SafleId is already used once, not available now", safle_id, report_id))
+
+    def add_safle_id(self, user, safle_id, report_id=False):
+        account = self.account(user)
+        verify(not account["isAddressTaken"], self.failure("SafleID already registered", safle_id, report_id))
+        self.journal.put(self.resolveAddressFromSafleId, safle_id, user)
+        account.update(isAddressTaken=True, safleId=safle_id)
+        self.journal.put(self.accounts, user, account)
+        self.set("totalSafleIdRegistered", self.vars["totalSafleIdRegistered"] + 1)
+
+    def old_safle_ids(self, account, user, safle_id):
+        self.journal.put(self.resolveOldSafleIdFromAddress, (user, account["oldSafleIdCount"]), safle_id)
+        account["oldSafleIdCount"] += 1
+        self.journal.put(self.resolveOldSafleID, safle_id, user)
+
+    def coin_owner_checks(self, user, registrar):
+        verify(self.is_registrar(registrar), "Invalid Registrar.")
+        account = self.account(user)
+        verify(not account["inAuction"], "Coin addresses cannot be changed inbetween Auction.")
+        verify(account["safleId"] != "", "SafleID not registered.")
+        return account["safleId"]
+
+    # -- entry points --------------------------------------------------
+
+    def upgradeMainContractAddress(self, sender, amount, now, params):
+        self.only_owner(sender)
+        self.set("mainContract", params["_mainContractAddress"])
+
+    def setAuctionContract(self, sender, amount, now, params):
+        self.only_owner(sender)
+        self.set("auctionContractAddress", params["_auctionAddress"])
+
+    def registerRegistrar(self, sender, amount, now, params):
+        self.only_main(sender)
+        name, registrar = params["_registrarName"], params["_registrar"]
+        self.registrar_checks(name)
+        account = self.account(registrar)
+        account.update(isRegistrar=True, registrarName=name, isAddressTaken=True)
+        self.journal.put(self.accounts, registrar, account)
+        self.journal.put(self.registrarNameToAddress, name, registrar)
+        self.set("totalRegistrars", self.vars["totalRegistrars"] + 1)
+
+    def updateRegistrar(self, sender, amount, now, params):
+        self.only_main(sender)
+        name, registrar = params["_newRegistrarName"], params["_registrar"]
+        self.registrar_checks(name)
+        account = self.account(registrar)
+        verify(account["isRegistrar"], "Registrar should register first.")
+        verify(account["registrarUpdates"] + 1 <= MAX_NAME_UPDATES, "Maximum update count reached.")
+        old = account["registrarName"]
+        self.journal.delete(self.registrarNameToAddress, old)
+        self.journal.put(self.resolveOldRegistrarAddress, (registrar, account["registrarUpdates"]), old)
+        account.update(registrarName=name, registrarUpdates=account["registrarUpdates"] + 1)
+        self.journal.put(self.accounts, registrar, account)
+        self.journal.put(self.registrarNameToAddress, name, registrar)
+
+    def registerSafleId(self, sender, amount, now, params):
+        self.only_main(sender)
+        verify(self.is_registrar(params["_registrar"]), "Invalid Registrar.")
+        self.safle_id_available(params["_safleId"])
+        self.add_safle_id(params["_userAddress"], params["_safleId"])
+
+    def registerSafleIds(self, sender, amount, now, params):
+        self.only_main(sender)
+        verify(self.is_registrar(params["_registrar"]), "Invalid Registrar.")
+        for item in params["_safleIds"]:
+            self.safle_id_available(item["_safleId"], report_id=True)
+            self.add_safle_id(item["_userAddress"], item["_safleId"], report_id=True)
+
+    def updateSafleId(self, sender, amount, now, params):
+        self.only_main(sender)
+        user, safle_id = params["_userAddress"], params["_safleId"]
+        verify(self.is_registrar(params["_registrar"]), "Invalid Registrar.")
+        self.safle_id_available(safle_id)
+        account = self.account(user)
+        verify(account["safleIdUpdates"] + 1 <= MAX_NAME_UPDATES, "Maximum update count reached.")
+        verify(account["isAddressTaken"], "SafleID not registered.")
+        verify(not account["inAuction"], "SafleId cannot be updated inbetween Auction.")
+        old = account["safleId"]
+        self.journal.put(self.unavailableSafleIds, old, True)
+        self.journal.delete(self.resolveAddressFromSafleId, old)
+        self.old_safle_ids(account, user, old)
+        self.journal.put(self.resolveAddressFromSafleId, safle_id, user)
+        account.update(safleId=safle_id, safleIdUpdates=account["safleIdUpdates"] + 1)
+        self.journal.put(self.accounts, user, account)
+        self.set("totalSafleIdRegistered", self.vars["totalSafleIdRegistered"] + 1)
+
+    def transferSafleId(self, sender, amount, now, params):
+        self.only_auction(sender)
+        safle_id, old_owner, new_owner = params["_safleId"], params["_oldOwner"], params["_newOwner"]
+        account = self.account(old_owner)
+        verify(account["isAddressTaken"], "You are not an owner of this safleId.")
+        verify(safle_id in self.resolveAddressFromSafleId, "This SafleId does not have an owner.")
+        self.old_safle_ids(account, old_owner, safle_id)
+        account.update(isAddressTaken=False, inAuction=False)
+        self.journal.put(self.accounts, old_owner, account)
+        self.journal.put(self.resolveAddressFromSafleId, safle_id, new_owner)
+        account = self.account(new_owner)
+        account.update(isAddressTaken=True, safleId=safle_id)
+        self.journal.put(self.accounts, new_owner, account)
+
+    def auctionInProcess(self, sender, amount, now, params):
+        self.only_auction(sender)
+        verify(len(params["_safleId"]) != 0, "Resolver : User SafleID should not be empty.")
+        verify(params["_safleId"] in self.resolveAddressFromSafleId, NOT_REGISTERED)
+        account = self.account(params["_safleIdOwner"])
+        account["inAuction"] = True
+        self.journal.put(self.accounts, params["_safleIdOwner"], account)
+
+    def auctionEnded(self, sender, amount, now, params):
+        self.only_auction(sender)
+        account = self.account(params["_safleIdOwner"])
+        account["inAuction"] = False
+        self.journal.put(self.accounts, params["_safleIdOwner"], account)
+
+    def mapCoin(self, sender, amount, now, params):
+        self.only_main(sender)
+        verify(params["_indexnumber"] not in self.OtherCoin, "This index number has already been mapped.")
+        verify(not self.isCoinMapped.get(params["_coinName"], False), "This coin is already mapped.")
+        verify(self.is_registrar(params["_registrar"]), "Invalid Registrar.")
+        self.journal.put(self.OtherCoin, params["_indexnumber"], dict(isIndexMapped=True, aliasName=params["_aliasName"], coinName=params["_coinName"]))
+        self.journal.put(self.isCoinMapped, params["_coinName"], True)
+
+    def write_coin(self, coins, safle_id, index, address):
+        coins[index] = address
+        self.journal.put(self.coinAddressToSafleId, address, safle_id)
+
+    def registerCoinAddress(self, sender, amount, now, params):
+        self.only_main(sender)
+        safle_id = self.coin_owner_checks(params["_userAddress"], params["_registrar"])
+        verify(params["_index"] in self.OtherCoin, "This index number is not mapped.")
+        coins = dict(self.safleIdToCoinAddress.get(safle_id, {}))
+        self.write_coin(coins, safle_id, params["_index"], params["_address"])
+        self.journal.put(self.safleIdToCoinAddress, safle_id, coins)
+
+    def updateCoinAddress(self, sender, amount, now, params):
+        self.only_main(sender)
+        safle_id = self.coin_owner_checks(params["_userAddress"], params["_registrar"])
+        verify(params["_index"] in self.OtherCoin, "This index number is not mapped.")
+        coins = dict(get(self.safleIdToCoinAddress, safle_id))
+        verify(params["_index"] in coins)
+        self.write_coin(coins, safle_id, params["_index"], params["_newAddress"])
+        self.journal.put(self.safleIdToCoinAddress, safle_id, coins)
+
+    def registerCoinAddresses(self, sender, amount, now, params):
+        self.only_main(sender)
+        safle_id = self.coin_owner_checks(params["_userAddress"], params["_registrar"])
+        coins = dict(self.safleIdToCoinAddress.get(safle_id, {}))
+        for index in sorted(params["_addresses"]):
+            verify(index in self.OtherCoin, (index, "This index number is not mapped."))
+            self.write_coin(coins, safle_id, index, params["_addresses"][index])
+        self.journal.put(self.safleIdToCoinAddress, safle_id, coins)
+
+    def updateCoinAddresses(self, sender, amount, now, params):
+        self.only_main(sender)
+        safle_id = self.coin_owner_checks(params["_userAddress"], params["_registrar"])
+        coins = dict(get(self.safleIdToCoinAddress, safle_id))
+        for index in sorted(params["_addresses"]):
+            verify(index in coins, (index, "No coin address registered for this index."))
+            self.write_coin(coins, safle_id, index, params["_addresses"][index])
+        self.journal.put(self.safleIdToCoinAddress, safle_id, coins)
+
+    # -- views ---------------------------------------------------------
+
+    def resolveSafleId(self, params):
+        verify(len(params["_safleId"]) != 0, "Resolver : user SafleID should not be empty.")
+        verify(params["_safleId"] in self.resolveAddressFromSafleId, NOT_REGISTERED)
+        return self.resolveAddressFromSafleId[params["_safleId"]]
+
+    def resolveRegistrarName(self, params):
+        verify(params["_name"] in self.registrarNameToAddress, "Resolver : Registrar is not yet registered for this SafleID.")
+        return self.registrarNameToAddress[params["_name"]]
+
+    def coinAddressToId(self, params):
+        return get(self.coinAddressToSafleId, params["_address"])
+
+    def idToCoinAddress(self, params):
+        return get(get(self.safleIdToCoinAddress, params["_safleId"]), params["_index"])
+
+    def accountOf(self, params):
+        return self.account(params["_address"])
+
+    def resolveSafleIds(self, params):
+        return dict((name, self.resolveAddressFromSafleId.get(name)) for name in params["_safleIds"])
+
+    def nameStatus(self, params):
+        name = params["_name"]
+        if name in self.registrarNameToAddress:
+            return NAME_REGISTRAR
+        if name in self.resolveAddressFromSafleId:
+            if self.account(self.resolveAddressFromSafleId[name])["inAuction"]:
+                return NAME_IN_AUCTION
+            return NAME_SAFLE_ID
+        if name in self.unavailableSafleIds:
+            return NAME_RETIRED
+        return NAME_FREE
+
+    def nameStatuses(self, params):
+        return dict((name, self.nameStatus({"_name": name})) for name in params["_names"])
+
+    def coinAddressesToIds(self, params):
+        return dict((address, self.coinAddressToSafleId.get(address)) for address in params["_addresses"])
+
+    def idsToCoinAddresses(self, params):
+        return dict(
+            ((c["_safleId"], c["_index"]), self.safleIdToCoinAddress.get(c["_safleId"], {}).get(c["_index"]))
+            for c in params["_coins"]
+        )
+
+    def history(self, table, owner, total, offset, limit):
+        names = [table[(owner, i)] for i in range(offset, min(total, offset + limit))]
+        return dict(total=total, names=names)
+
+    def oldSafleIdsOf(self, params):
+        total = self.account(params["_userAddress"])["oldSafleIdCount"]
+        return self.history(self.resolveOldSafleIdFromAddress, params["_userAddress"], total, params["_offset"], params["_limit"])
+
+    def oldRegistrarNamesOf(self, params):
+        total = self.account(params["_registrar"])["registrarUpdates"]
+        return self.history(self.resolveOldRegistrarAddress, params["_registrar"], total, params["_offset"], params["_limit"])
+
+
+class AuctionModel(object):
+    def __init__(self, model, owner, storage):
+        self.model = model
+        self.vars = dict(contractOwner=owner, storageContract=storage, totalAuctions=0)
+        self.auction = {}
+        self.bidRate = {}
+        self.biddersArray = {}
+        self.auctionOfConductor = {}
+        self.alreadyActiveAuction = {}
+        self.safleIdToAuction = {}
+        self.expiringAuctions = {}
+        self.expiringAuctionCounts = {}
+
+    @property
+    def journal(self):
+        return self.model.journal
+
+    def index_auction(self, auction_id, last_for):
+        bucket = last_for // AUCTION_BUCKET_SECONDS
+        self.journal.put(self.expiringAuctions, (bucket, auction_id), True)
+        self.journal.put(self.expiringAuctionCounts, bucket, self.expiringAuctionCounts.get(bucket, 0) + 1)
+
+    def unindex_auction(self, auction_id):
+        bucket = self.auction[auction_id]["auctionLastFor"] // AUCTION_BUCKET_SECONDS
+        if (bucket, auction_id) in self.expiringAuctions:
+            self.journal.delete(self.expiringAuctions, (bucket, auction_id))
+            remaining = self.expiringAuctionCounts[bucket] - 1
+            if remaining:
+                self.journal.put(self.expiringAuctionCounts, bucket, remaining)
+            else:
+                self.journal.delete(self.expiringAuctionCounts, bucket)
+
+    def close_auction(self, auction_id):
+        auction = dict(self.auction[auction_id])
+        auction.update(isAuctionLive=False, returnBidsOfOther=True)
+        self.journal.put(self.auction, auction_id, auction)
+        self.journal.delete(self.alreadyActiveAuction, auction["auctionConductor"])
+        self.unindex_auction(auction_id)
+        if auction["totalBidders"] == 0:
+            # releaseSafleId
+            self.storage("auctionEnded", {"_safleId": auction["safleId"], "_safleIdOwner": auction["auctionConductor"]})
+            return
+        # transferSafleIdToWinner
+        self.journal.put(self.auction, auction_id, dict(auction, safleIdTransferred=True))
+        self.model.transfer(AUCTION, auction["auctionConductor"], auction["highestBid"])
+        self.storage("transferSafleId", {
+            "_safleId": auction["safleId"], "_oldOwner": auction["auctionConductor"], "_newOwner": auction["higestBidderAddress"]
+        })
+
+    def resolve(self, safle_id):
+        # sp.view(...).open_some(): a missing contract fails, a failing view fails the call.
+        name = self.model.address_name(self.vars["storageContract"])
+        verify(name is not None)
+        return self.model.view(name, "resolveSafleId", {"_safleId": safle_id})
+
+    def storage(self, entrypoint, params):
+        self.model.internal(self.vars["storageContract"], entrypoint, AUCTION, params)
+
+    def upgradeStorageContractAddress(self, sender, amount, now, params):
+        verify(sender == self.vars["contractOwner"])
+        self.journal.put(self.vars, "storageContract", params["_storageContractAddress"])
+
+    def auctionSafleId(self, sender, amount, now, params):
+        safle_id, seconds = params["_safleId"], params["_auctionSeconds"]
+        verify(len(safle_id) <= 16, "Length of the safleId should be betweeb 4-16 characters.")
+        verify(300 < seconds < 7776000, "Auction time should be in between 330 to 7776000 seconds.")
+        verify(sender not in self.alreadyActiveAuction, "Auction is already in process by this user.")
+        verify(self.resolve(safle_id) == sender, "You are not an owner of this SafleId.")
+        lower = to_lower(safle_id)
+        auction_id = self.vars["totalAuctions"]
+        self.journal.put(self.auction, auction_id, dict(
+            isAuctionLive=True, auctionConductor=sender, safleId=lower, higestBidderAddress=sender,
+            highestBid=0, totalBids=0, totalBidders=0, returnBidsOfOther=False,
+            auctionLastFor=now + seconds, safleIdTransferred=False
+        ))
+        self.journal.put(self.auctionOfConductor, sender, auction_id)
+        self.journal.put(self.safleIdToAuction, lower, auction_id)
+        self.journal.put(self.alreadyActiveAuction, sender, True)
+        self.journal.put(self.vars, "totalAuctions", auction_id + 1)
+        self.index_auction(auction_id, now + seconds)
+        self.storage("auctionInProcess", {"_safleId": lower, "_safleIdOwner": sender})
+
+    def bidForSafleId(self, sender, amount, now, params):
+        lower = to_lower(params["_safleId"])
+        verify(lower in self.safleIdToAuction)
+        verify(not is_contract(sender))
+        auction_id = self.safleIdToAuction[lower]
+        auction = dict(self.auction[auction_id])
+        previous = self.bidRate.get((auction_id, sender), 0)
+        verify(auction["isAuctionLive"], "Auction is not live")
+        verify(auction["auctionConductor"] != sender, "You cannot bid for your SafleId")
+        verify(amount + previous > auction["highestBid"], "Bid amount should be greater than the current bidrate.")
+        verify(now < auction["auctionLastFor"], "Auction time is completed")
+        if previous == 0:
+            self.journal.put(self.biddersArray, (auction_id, auction["totalBidders"]), sender)
+            auction["totalBidders"] += 1
+        self.journal.put(self.bidRate, (auction_id, sender), previous + amount)
+        auction.update(highestBid=previous + amount, higestBidderAddress=sender, totalBids=auction["totalBids"] + 1)
+        self.journal.put(self.auction, auction_id, auction)
+
+    def settleAuction(self, sender, amount, now, params):
+        auction_id = get(self.auctionOfConductor, sender)
+        auction = dict(self.auction[auction_id])
+        verify(auction["returnBidsOfOther"] == False)
+        verify(auction["auctionConductor"] == sender)
+        verify(auction["totalBidders"] > 0)
+        self.close_auction(auction_id)
+
+    def settleExpiredAuctions(self, sender, amount, now, params):
+        verify(len(params["_auctionIds"]) <= MAX_SETTLE_BATCH, "Too many auctions to settle in one call.")
+        settled = 0
+        for auction_id in params["_auctionIds"]:
+            auction = self.auction.get(auction_id)
+            if auction is not None and auction["isAuctionLive"] and auction["auctionLastFor"] <= now:
+                self.close_auction(auction_id)
+                settled += 1
+        verify(settled > 0, "No expired auctions to settle.")
+
+    def withdrawBid(self, sender, amount, now, params):
+        auction = get(self.auction, params["_auctionId"])
+        key = (params["_auctionId"], sender)
+        verify(auction["returnBidsOfOther"], "Auction is not settled yet.")
+        verify(auction["higestBidderAddress"] != sender, "Winning bid cannot be withdrawn.")
+        verify(key in self.bidRate, "No bid to withdraw.")
+        self.model.transfer(AUCTION, sender, self.bidRate[key])
+        self.journal.delete(self.bidRate, key)
+
+    def directlyTransferSafleId(self, sender, amount, now, params):
+        verify(self.resolve(params["_safleId"]) == sender, "You are not an owner of this SafleId.")
+        self.storage("transferSafleId", {"_safleId": params["_safleId"], "_oldOwner": sender, "_newOwner": params["_newOwner"]})
+
+    def arrayOfbidders(self, params):
+        auction_id = get(self.auctionOfConductor, params["_auctioner"])
+        return [self.biddersArray[(auction_id, i)] for i in range(self.auction[auction_id]["totalBidders"])]
+
+    def expiringAuctionCount(self, params):
+        return self.expiringAuctionCounts.get(params["_bucket"], 0)
+
+    def getBidRate(self, params):
+        auction_id = get(self.auctionOfConductor, params["_auctioner"])
+        return get(self.bidRate, (auction_id, params["_bidder"]))
+
+
+class Model(object):
+    """The three contracts wired together as in a deployment."""
+
+    def __init__(self, owner="owner", wallet="wallet", wired=True):
+        self.journal = Journal()
+        self.balances = {}
+        self.contracts = {
+            "main": MainModel(self, owner, wallet),
+            "storage": StorageModel(self, owner, MAIN),
+            "auction": AuctionModel(self, owner, STORAGE),
+        }
+        self.addresses = {MAIN: "main", STORAGE: "storage", AUCTION: "auction"}
+        if wired:
+            self.call("main", "setStorageContract", owner, {"_registrarStorageContract": STORAGE})
+            self.call("storage", "setAuctionContract", owner, {"_auctionAddress": AUCTION})
+
+    @property
+    def main(self):
+        return self.contracts["main"]
+
+    @property
+    def storage(self):
+        return self.contracts["storage"]
+
+    @property
+    def auction(self):
+        return self.contracts["auction"]
+
+    def address_name(self, address):
+        return self.addresses.get(address)
+
+    def balance(self, address):
+        return self.balances.get(address, 0)
+
+    def transfer(self, source, destination, amount):
+        verify(self.balance(source) >= amount)
+        self.journal.put(self.balances, source, self.balance(source) - amount)
+        self.journal.put(self.balances, destination, self.balance(destination) + amount)
+
+    def internal(self, address, entrypoint, sender, params):
+        # Calls to an address without the entry point fail, like sp.contract(...).open_some().
+        name = self.address_name(address)
+        verify(name is not None)
+        method = getattr(self.contracts[name], entrypoint, None)
+        verify(method is not None)
+        method(sender, 0, self.now, params)
+
+    def call(self, contract, entrypoint, sender, params=None, amount=0, now=0):
+        """Apply one external call; raise :class:`Failure` and roll back if it fails."""
+        mark = self.journal.mark()
+        self.now = now
+        address = [a for a, n in self.addresses.items() if n == contract][0]
+        try:
+            self.journal.put(self.balances, address, self.balance(address) + amount)
+            getattr(self.contracts[contract], entrypoint)(sender, amount, now, params or {})
+        except Failure:
+            self.journal.rollback(mark)
+            raise
+        self.journal.commit()
+
+    def try_call(self, *args, **kwargs):
+        """Like :meth:`call`, returning None on success or the :class:`Failure`."""
+        try:
+            self.call(*args, **kwargs)
+        except Failure as e:
+            return e
+        return None
+
+    def view(self, contract, view, params):
+        return getattr(self.contracts[contract], view)(params)
@@ -0,0 +1,160 @@
+"""Thin wrapper around ``octez-client`` used by the benchmark and deploy tools.
+
+By default the client runs in mockup mode in a throw-away base directory,
+so no node is needed: operations are applied locally and their receipts
+are parsed for gas and storage figures.
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+OCTEZ_CLIENT = os.environ.get("OCTEZ_CLIENT", "octez-client")
+
+# Accounts that exist in every mockup base dir.
+BOOTSTRAP_ACCOUNTS = ["bootstrap1", "bootstrap2", "bootstrap3", "bootstrap4", "bootstrap5"]
+
+
+class OctezError(Exception):
+    def __init__(self, command, output):
+        Exception.__init__(self, "%s failed:\n%s" % (" ".join(command[:4]), output))
+        self.output = output
+
+
+class OperationResult(object):
+    """One applied (internal) transaction parsed out of a receipt."""
+
+    def __init__(self, destination, entrypoint):
+        self.destination = destination
+        self.entrypoint = entrypoint
+        self.consumed_gas = 0.0
+        self.storage_size = None
+        self.paid_storage_diff = 0
+
+    def __repr__(self):
+        return "OperationResult(%s%%%s, gas=%s)" % (self.destination, self.entrypoint, self.consumed_gas)
+
+
+RECEIPT_PATTERNS = [
+    ("destination", re.compile(r"^\s*To: (\S+)")),
+    ("entrypoint", re.compile(r"^\s*Entrypoint: (\S+)")),
+    ("consumed_gas", re.compile(r"^\s*Consumed gas: ([0-9.]+)")),
+    ("storage_size", re.compile(r"^\s*Storage size: ([0-9]+) bytes")),
+    ("paid_storage_diff", re.compile(r"^\s*Paid storage size diff: ([0-9]+) bytes")),
+]
+TRANSACTION_START = re.compile(r"^\s*(Internal )?Transaction:\s*$")
+RECEIPT_START = re.compile(r"Operation receipts?:|This sequence of operations was run:")
+
+
+def parse_receipt(output):
+    """Return the transactions of an octez-client receipt, in order."""
+    match = RECEIPT_START.search(output)
+    if match:
+        output = output[match.end():]
+    operations = []
+    current = None
+    for line in output.splitlines():
+        if TRANSACTION_START.match(line):
+            current = OperationResult(None, "default")
+            operations.append(current)
+            continue
+        if current is None:
+            continue
+        for field, pattern in RECEIPT_PATTERNS:
+            found = pattern.match(line)
+            if found is None:
+                continue
+            value = found.group(1)
+            if field == "consumed_gas":
+                current.consumed_gas += float(value)
+            elif field in ("storage_size", "paid_storage_diff"):
+                setattr(current, field, int(value))
+            elif field == "destination" and current.destination is not None:
+                # Balance updates also mention addresses; keep the first To.
+                pass
+            else:
+                setattr(current, field, value)
+            break
+    return operations
+
+
+class OctezClient(object):
+    def __init__(self, base_dir=None, endpoint=None, mockup=True, burn_cap="100"):
+        self.mockup = mockup and endpoint is None
+        self.endpoint = endpoint
+        self.burn_cap = burn_cap
+        self.owns_base_dir = base_dir is None
+        self.base_dir = base_dir or tempfile.mkdtemp(prefix="safle-octez-")
+        if self.mockup and not os.path.exists(os.path.join(self.base_dir, "mockup")):
+            self.run("create", "mockup")
+
+    def close(self):
+        if self.owns_base_dir:
+            shutil.rmtree(self.base_dir, ignore_errors=True)
+
+    def command(self, *args):
+        command = [OCTEZ_CLIENT, "--base-dir", self.base_dir]
+        if self.mockup:
+            command += ["--mode", "mockup"]
+        elif self.endpoint:
+            command += ["--endpoint", self.endpoint]
+        return command + list(args)
+
+    def run(self, *args):
+        command = self.command(*args)
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        if process.returncode != 0:
+            raise OctezError(command, process.stdout)
+        return process.stdout
+
+    def address(self, alias):
+        output = self.run("show", "address", alias)
+        return re.search(r"Hash: (\S+)", output).group(1)
+
+    def gen_account(self, alias):
+        self.run("gen", "keys", alias, "--force")
+        return self.address(alias)
+
+    def originate(self, alias, script, storage, sender="bootstrap1", balance="0"):
+        with tempfile.NamedTemporaryFile("w", suffix=".tz", delete=False) as f:
+            f.write(script)
+            path = f.name
+        try:
+            output = self.run(
+                "originate", "contract", alias, "transferring", balance, "from", sender,
+                "running", path, "--init", storage, "--burn-cap", self.burn_cap, "--force"
+            )
+        finally:
+            os.unlink(path)
+        return re.search(r"New contract (KT1\w+) originated", output).group(1)
+
+    def transfer(self, sender, destination, entrypoint=None, arg=None, amount="0"):
+        args = ["transfer", amount, "from", sender, "to", destination, "--burn-cap", self.burn_cap]
+        if entrypoint is not None:
+            args += ["--entrypoint", entrypoint]
+        if arg is not None:
+            args += ["--arg", arg]
+        return parse_receipt(self.run(*args))
+
+    def multiple_transfers(self, sender, transfers):
+        """Apply several transfers from ``sender`` as one operation group.
+
+        ``transfers`` are dicts with destination, amount, entrypoint and arg
+        (Michelson text), as accepted by ``multiple transfers``.
+        """
+        payload = json.dumps([dict(t, amount=str(t.get("amount", "0"))) for t in transfers])
+        return parse_receipt(self.run("multiple", "transfers", "from", sender, "using", payload, "--burn-cap", self.burn_cap))
+
+    def run_view(self, view, contract, arg):
+        output = self.run("run", "view", view, "on", "contract", contract, "with", "input", arg)
+        return output.strip()
+
+    def storage_used_space(self, contract):
+        try:
+            output = self.run("rpc", "get", "/chains/main/blocks/head/context/contracts/%s/storage/used_space" % contract)
+        except OctezError:
+            return None
+        return int(json.loads(output))
@@ -0,0 +1,164 @@
+"""Cached client-side resolution of SafleIDs, registrar names and coin addresses.
+
+:class:`Resolver` answers ``resolveSafleId``, ``resolveRegistrarName``,
+``coinAddressToId`` and ``idToCoinAddress`` by simulating the views of
+RegistrarStorage through a node, and keeps every answer - including "not
+registered" - in a bounded LRU cache whose entries also expire after
+``ttl`` seconds.
+
+:meth:`Resolver.sync` reads the blocks baked since its previous call and
+drops exactly the entries the contract's events touched, so hot names stay
+in memory until they actually change:
+
+    resolver = Resolver(RpcClient("http://localhost:8732"), "KT1...")
+    resolver.resolve_safle_id("alice")
+    resolver.sync()   # e.g. once per block
+"""
+
+import collections
+import time
+
+from tools.rpc import RpcError, block_events
+
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL = 300.0
+
+
+class NotRegistered(LookupError):
+    pass
+
+
+class LRUCache(object):
+    """Least recently used cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] > self.clock()
+
+    def get(self, key):
+        """Return ``(True, value)`` for a live entry, ``(False, None)`` otherwise."""
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, key, value):
+        self.entries[key] = (self.clock() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# Cache keys touched by each event of RegistrarStorage, from its payload.
+INVALIDATIONS = {
+    "registerSafleId": lambda e: [("resolveSafleId", e["safleId"])],
+    "updateSafleId": lambda e: [("resolveSafleId", e["oldSafleId"]), ("resolveSafleId", e["newSafleId"])],
+    "transferSafleId": lambda e: [("resolveSafleId", e["safleId"])],
+    "registerCoinAddress": lambda e: [("idToCoinAddress", e["safleId"], e["index"]), ("coinAddressToId", e["address"])],
+    "updateCoinAddress": lambda e: [("idToCoinAddress", e["safleId"], e["index"]), ("coinAddressToId", e["address"])],
+    "registerRegistrar": lambda e: [("resolveRegistrarName", e["name"])],
+    "updateRegistrar": lambda e: [("resolveRegistrarName", e["oldName"]), ("resolveRegistrarName", e["newName"])],
+}
+
+
+class Resolver(object):
+    def __init__(self, rpc, contract, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.rpc = rpc
+        self.contract = contract
+        self.cache = LRUCache(max_size, ttl, clock)
+        self.level = None
+        self._chain_id = None
+
+    # -- lookups -------------------------------------------------------
+
+    def resolve_safle_id(self, safle_id):
+        """Address owning ``safle_id``."""
+        return self.lookup(("resolveSafleId", safle_id), {"string": safle_id})
+
+    def resolve_registrar_name(self, name):
+        """Address of the registrar called ``name``."""
+        return self.lookup(("resolveRegistrarName", name), {"string": name})
+
+    def coin_address_to_id(self, address):
+        """SafleID a coin address is registered to."""
+        return self.lookup(("coinAddressToId", address), {"string": address})
+
+    def id_to_coin_address(self, safle_id, index):
+        """Coin address registered for ``safle_id`` at coin ``index``."""
+        argument = {"prim": "Pair", "args": [{"int": str(index)}, {"string": safle_id}]}
+        return self.lookup(("idToCoinAddress", safle_id, index), argument)
+
+    def lookup(self, key, argument):
+        hit, value = self.cache.get(key)
+        if not hit:
+            if self.level is None:
+                # Read before the view runs, so the first sync replays every
+                # block that may have changed what is about to be cached.
+                self.level = self.rpc.header()["level"]
+            value = self.fetch(key[0], argument)
+            self.cache.put(key, value)
+        if value is None:
+            raise NotRegistered("%s(%s) is not registered" % (key[0], ", ".join(str(k) for k in key[1:])))
+        return value
+
+    def fetch(self, view, argument):
+        """Run ``view`` on the node; ``None`` when the view rejects the input."""
+        if self._chain_id is None:
+            self._chain_id = self.rpc.chain_id()
+        try:
+            result = self.rpc.run_view(self.contract, view, argument, self._chain_id)
+        except RpcError as e:
+            if e.rejected:
+                return None
+            raise
+        return result["string"]
+
+    # -- invalidation --------------------------------------------------
+
+    def apply_event(self, tag, payload):
+        """Drop the cache entries an event of the storage contract touched."""
+        if tag == "importRegistry":
+            # A bulk import can touch any name; it only happens during a migration.
+            self.cache.clear()
+            return
+        keys = INVALIDATIONS.get(tag)
+        if keys is None:
+            return
+        for key in keys(payload):
+            self.cache.invalidate(key)
+
+    def sync(self):
+        """Apply the events of every block since the last sync; return the new level.
+
+        The blocks since the first cache fill count as well. A first call
+        before any lookup only records the head level: nothing is cached yet.
+        """
+        head = self.rpc.header()["level"]
+        if self.level is not None:
+            for level in range(self.level + 1, head + 1):
+                for tag, payload in block_events(self.rpc.block(level), self.contract):
+                    self.apply_event(tag, payload)
+        self.level = head
+        return head
@@ -0,0 +1,104 @@
+"""Minimal Tezos node RPC client and contract event extraction.
+
+Only the standard library is used so the resolver and the indexer can run
+anywhere Python does.
+"""
+
+import json
+import urllib.error
+import urllib.request
+
+from tools import michelson
+
+
+class RpcError(Exception):
+    def __init__(self, path, status, body):
+        Exception.__init__(self, "%s returned %s: %s" % (path, status, body[:500]))
+        self.path = path
+        self.status = status
+        self.body = body
+
+    @property
+    def rejected(self):
+        """True when a script (e.g. a view) failed with FAILWITH."""
+        return "script_rejected" in self.body
+
+
+class RpcClient(object):
+    def __init__(self, endpoint, chain="main", timeout=10):
+        self.endpoint = endpoint.rstrip("/")
+        self.chain = chain
+        self.timeout = timeout
+
+    def request(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(
+            self.endpoint + path, data=data, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode())
+        except urllib.error.HTTPError as e:
+            raise RpcError(path, e.code, e.read().decode(errors="replace"))
+
+    def block_path(self, block="head"):
+        return "/chains/%s/blocks/%s" % (self.chain, block)
+
+    def header(self, block="head"):
+        return self.request(self.block_path(block) + "/header")
+
+    def block(self, block="head"):
+        return self.request(self.block_path(block))
+
+    def chain_id(self):
+        return self.request("/chains/%s/chain_id" % self.chain)
+
+    def script(self, contract, block="head"):
+        """Code and current storage of ``contract``; big_maps in the storage are their ids."""
+        return self.request(self.block_path(block) + "/context/contracts/%s/script" % contract)
+
+    def big_map_value(self, big_map, key_hash, block="head"):
+        """Value under the ``expr...`` hash of a key, or None when the key is not in the big_map."""
+        try:
+            return self.request(self.block_path(block) + "/context/big_maps/%d/%s" % (big_map, key_hash))
+        except RpcError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def big_map_size(self, big_map, block="head", page=1000):
+        count = 0
+        while True:
+            values = self.request(self.block_path(block) + "/context/big_maps/%d?offset=%d&length=%d" % (big_map, count, page))
+            count += len(values)
+            if len(values) < page:
+                return count
+
+    def run_view(self, contract, view, argument, chain_id=None):
+        """Simulate the on-chain ``view`` of ``contract`` with a Micheline ``argument``."""
+        result = self.request(self.block_path() + "/helpers/scripts/run_script_view", {
+            "contract": contract,
+            "view": view,
+            "input": argument,
+            "chain_id": chain_id or self.chain_id(),
+            "unparsing_mode": "Readable",
+        })
+        return result["data"]
+
+
+def block_events(block, contract):
+    """Yield ``(tag, payload)`` for every applied event ``contract`` emitted in ``block``.
+
+    Payloads are decoded with the event's own type, so records come back as
+    dicts keyed by field name.
+    """
+    for group in block.get("operations", []):
+        for operation in group:
+            for content in operation.get("contents", []):
+                metadata = content.get("metadata", {})
+                for result in metadata.get("internal_operation_results", []):
+                    if result.get("kind") != "event" or result.get("source") != contract:
+                        continue
+                    if result.get("result", {}).get("status") != "applied":
+                        continue
+                    yield result.get("tag"), michelson.decode(result["type"], result["payload"])
@@ -0,0 +1,263 @@
+"""Parallel runner for the SmartPy test scenarios in ``contracts/``.
+
+Every ``@sp.add_test`` function is found by parsing the contract files, and
+the scenarios are spread over ``--jobs`` workers, longest first, using the
+timings of the previous run. A worker writes the scenarios it got from one
+file into a shard file - that file's imports and helpers followed by the
+selected tests - and runs it with the SmartPy CLI. The contracts a file
+imports are therefore parsed once per shard rather than once per scenario.
+
+    python -m tools.testrunner                 # every scenario, one worker per CPU
+    python -m tools.testrunner -k Auction -j 2
+    python -m tools.testrunner --list
+
+Per-scenario times are printed at the end and kept in
+``build/.cache/test_timings.json`` to balance the next run. They are read
+from the output SmartPy writes for each scenario; the first scenario of a
+shard also carries the time spent loading the shard's imports.
+"""
+
+import argparse
+import ast
+import collections
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTRACTS_DIR = os.path.join(ROOT, "contracts")
+SMART_PY_CLI = os.environ.get("SMART_PY_CLI", os.path.expanduser("~/smartpy-cli/SmartPy.sh"))
+TIMINGS = os.path.join(ROOT, "build", ".cache", "test_timings.json")
+DEFAULT_SECONDS = 5.0
+
+# SmartPy's block statements, rewritten to plain Python only for parsing.
+SP_BLOCK = re.compile(r"^(\s*)sp\.(if|elif|else|for|while)\b")
+
+Result = collections.namedtuple("Result", "scenario seconds passed shard")
+
+
+class Scenario(collections.namedtuple("Scenario", "name path start end")):
+    @property
+    def key(self):
+        # Names are only unique within a file.
+        return "%s::%s" % (os.path.basename(self.path), self.name)
+
+
+def python_source(source):
+    return "\n".join(SP_BLOCK.sub(r"\1\2", line) for line in source.splitlines())
+
+
+def is_add_test(decorator):
+    call = decorator.func if isinstance(decorator, ast.Call) else decorator
+    return isinstance(call, ast.Attribute) and call.attr == "add_test"
+
+
+def test_name(node, decorator):
+    if isinstance(decorator, ast.Call):
+        for keyword in decorator.keywords:
+            if keyword.arg == "name" and isinstance(keyword.value, ast.Constant):
+                return keyword.value.value
+    return node.name
+
+
+def discover(paths=None):
+    """``Scenario``s of every ``@sp.add_test`` function in ``paths`` (default: ``contracts/*.py``)."""
+    if paths is None:
+        paths = sorted(
+            os.path.join(CONTRACTS_DIR, f) for f in os.listdir(CONTRACTS_DIR)
+            if f.endswith(".py") and not f.startswith("_")
+        )
+    scenarios = []
+    for path in paths:
+        with open(path) as f:
+            tree = ast.parse(python_source(f.read()), path)
+        for node in tree.body:
+            if not isinstance(node, ast.FunctionDef):
+                continue
+            for decorator in node.decorator_list:
+                if is_add_test(decorator):
+                    start = min(d.lineno for d in node.decorator_list)
+                    scenarios.append(Scenario(test_name(node, decorator), path, start, node.end_lineno))
+    return scenarios
+
+
+def shard_source(path, scenarios):
+    """The file at ``path`` with every scenario except ``scenarios`` removed."""
+    with open(path) as f:
+        lines = f.read().splitlines()
+    keep = set((s.start, s.end) for s in scenarios)
+    drop = set()
+    for scenario in discover([path]):
+        if (scenario.start, scenario.end) not in keep:
+            drop.update(range(scenario.start - 1, scenario.end))
+    return "\n".join(line for i, line in enumerate(lines) if i not in drop) + "\n"
+
+
+def load_timings(path=TIMINGS):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_timings(results, path=TIMINGS):
+    timings = load_timings(path)
+    for result in results:
+        if result.passed:
+            timings[result.scenario.key] = round(result.seconds, 3)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(timings, f, indent=2, sort_keys=True)
+
+
+def schedule(scenarios, jobs, timings):
+    """Split ``scenarios`` into ``jobs`` lists of similar expected duration, longest first."""
+    workers = [[] for _ in range(max(1, min(jobs, len(scenarios))))]
+    load = [0.0] * len(workers)
+    for scenario in sorted(scenarios, key=lambda s: -timings.get(s.key, DEFAULT_SECONDS)):
+        i = load.index(min(load))
+        workers[i].append(scenario)
+        load[i] += timings.get(scenario.key, DEFAULT_SECONDS)
+    return workers
+
+
+def output_dir(out_dir, name):
+    for candidate in (name, re.sub(r"\W", "_", name)):
+        if os.path.isdir(os.path.join(out_dir, candidate)):
+            return os.path.join(out_dir, candidate)
+    return None
+
+
+def finished_at(directory):
+    """When SmartPy last wrote to ``directory``."""
+    times = [os.path.getmtime(directory)]
+    for root, _, files in os.walk(directory):
+        times.extend(os.path.getmtime(os.path.join(root, f)) for f in files)
+    return max(times)
+
+
+def scenario_times(out_dir, scenarios, started, finished, passed):
+    """``(scenario, seconds, passed)`` for each scenario of a shard, in run order.
+
+    SmartPy runs a file's scenarios in order and writes each one's output as
+    it goes, so a scenario took from the end of the previous output to the
+    end of its own. When the shard failed, the failing scenario is the first
+    one without output, or the last one; the scenarios after it count as
+    not run (``passed`` is None).
+    """
+    results = []
+    previous = started
+    failed = False
+    for i, scenario in enumerate(scenarios):
+        directory = output_dir(out_dir, scenario.name)
+        last = i == len(scenarios) - 1
+        if failed:
+            results.append((scenario, 0.0, None))
+        elif directory is None:
+            results.append((scenario, max(finished - previous, 0.0), False))
+            failed = True
+        else:
+            end = finished if last else min(finished, finished_at(directory))
+            results.append((scenario, max(end - previous, 0.0), passed or not last))
+            previous = end
+    return results
+
+
+def run_shard(shard_id, path, scenarios, keep=False):
+    """Run ``scenarios`` of ``path`` in one SmartPy process; return ``(results, output)``."""
+    shard = os.path.join(CONTRACTS_DIR, "_shard_%d_%s" % (shard_id, os.path.basename(path)))
+    with open(shard, "w") as f:
+        f.write(shard_source(path, scenarios))
+    out_dir = tempfile.mkdtemp(prefix="scenarios-")
+    started = time.time()
+    try:
+        process = subprocess.run(
+            [SMART_PY_CLI, "test", shard, out_dir], cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True
+        )
+        finished = time.time()
+        times = scenario_times(out_dir, scenarios, started, finished, process.returncode == 0)
+    finally:
+        if not keep:
+            os.remove(shard)
+        shutil.rmtree(out_dir, ignore_errors=True)
+    results = [Result(scenario, seconds, ok, shard_id) for scenario, seconds, ok in times]
+    return results, process.stdout
+
+
+def run(scenarios, jobs, keep=False, timings=None):
+    """Run ``scenarios`` on ``jobs`` workers; return the results and the output of failed shards."""
+    workers = schedule(scenarios, jobs, load_timings() if timings is None else timings)
+    results, failures = [], []
+    lock = threading.Lock()
+
+    def work(worker_id, assigned):
+        by_file = collections.OrderedDict()
+        for scenario in assigned:
+            by_file.setdefault(scenario.path, []).append(scenario)
+        for n, (path, group) in enumerate(by_file.items()):
+            group.sort(key=lambda s: s.start)
+            shard_results, output = run_shard(worker_id * 1000 + n, path, group, keep)
+            with lock:
+                results.extend(shard_results)
+                if not all(r.passed for r in shard_results):
+                    failures.append((path, output))
+
+    threads = [threading.Thread(target=work, args=(i, assigned)) for i, assigned in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, failures
+
+
+def print_report(results, elapsed):
+    width = max([len(r.scenario.name) for r in results] + [8])
+    print("%-*s  %-20s %6s %9s  %s" % (width, "scenario", "file", "shard", "seconds", "result"))
+    for r in sorted(results, key=lambda r: -r.seconds):
+        status = {True: "ok", False: "FAILED", None: "not run"}[r.passed]
+        print("%-*s  %-20s %6d %9.2f  %s" % (width, r.scenario.name, os.path.basename(r.scenario.path), r.shard, r.seconds, status))
+    total = sum(r.seconds for r in results)
+    print("%d scenarios, %.1fs of scenario time in %.1fs wall time" % (len(results), total, elapsed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="contract files to take scenarios from (default: contracts/*.py)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 4, help="worker processes")
+    parser.add_argument("-k", dest="pattern", help="only scenarios whose name contains PATTERN")
+    parser.add_argument("--list", action="store_true", help="list the scenarios and exit")
+    parser.add_argument("--keep", action="store_true", help="keep the generated contracts/_shard_*.py files")
+    args = parser.parse_args(argv)
+
+    scenarios = discover([os.path.abspath(f) for f in args.files] or None)
+    if args.pattern:
+        scenarios = [s for s in scenarios if args.pattern in s.name]
+    if args.list:
+        for s in scenarios:
+            print("%s  (%s:%d)" % (s.name, os.path.relpath(s.path, ROOT), s.start))
+        return 0
+    if not scenarios:
+        sys.exit("No scenarios found.")
+    if not os.path.isfile(SMART_PY_CLI):
+        sys.exit("Fatal: Please install SmartPy CLI at %s" % SMART_PY_CLI)
+
+    started = time.time()
+    results, failures = run(scenarios, args.jobs, args.keep)
+    for path, output in failures:
+        print("---- %s" % os.path.relpath(path, ROOT))
+        print(output.strip())
+    print_report(results, time.time() - started)
+    save_timings(results)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())